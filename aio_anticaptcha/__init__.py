@@ -1,205 +1,681 @@
-import aiohttp
 import asyncio
-import io
-from base64 import b64encode
+import os
+import time
+import weakref
+from functools import partial
+
+from .background import BackgroundQueue
+from .balance import BalanceTracker
+from .breaker import CircuitBreaker
+from .batch import ResolveIterator
+from .broker import Broker, BrokerClient
+from .cache import AnswerCache
+from .connector import create_connector, create_ssl_context
+from .errors import (CircuitOpenError, DeadlineError, IPNotAllowedError,
+                     ServiceError, TransientError, UserKeyError,
+                     ZeroBalanceError, error_from_code, http_error,
+                     network_error)
+from .governor import SlotGovernor
+from .hedge import Hedger
+from .journal import Journal
+from .latency import LatencyModel
+from .metrics import Metrics
+from .pingback import PingbackReceiver
+from .pool import AntiCaptchaPool
+from .poller import Poller
+from .preprocess import Preprocessor
+from .retry import RetryPolicy, is_transient
+from .sync import SyncAntiCaptcha
+from .task import CANCELLED, DONE, FAILED, CaptchaTask
+from .upload import CaptchaForm
 
 __version__ = '0.1.0'
-__all__ = ('AntiCaptcha', 'AntiGate', 'ServiceError',
-           'UserKeyError', 'ZeroBalanceError')
-
-
-class ServiceError(Exception):
-    pass
-
-
-class UserKeyError(ServiceError):
-    pass
-
-
-class ZeroBalanceError(ServiceError):
-    pass
+__all__ = ('AntiCaptcha', 'AntiCaptchaPool', 'AntiGate', 'AnswerCache',
+           'BackgroundQueue', 'BalanceTracker', 'Broker', 'BrokerClient',
+           'CaptchaTask', 'CircuitBreaker', 'CircuitOpenError',
+           'DeadlineError', 'Hedger', 'IPNotAllowedError', 'Journal',
+           'LatencyModel', 'Metrics', 'PingbackReceiver', 'Preprocessor',
+           'RetryPolicy', 'ServiceError', 'SlotGovernor', 'SyncAntiCaptcha',
+           'TransientError', 'UserKeyError', 'ZeroBalanceError',
+           'create_connector', 'create_ssl_context')
 
 
 class AntiCaptcha:
-    def __init__(self, api_key, *, domain='anti-captcha.com', port=80,
-                 check_interval=10, send_interval=0.1, loop=None):
+    def __init__(self, api_key, *, domain='anti-captcha.com', port=None,
+                 ssl=None, check_interval=10, check_intervals=None,
+                 send_interval=0.1, poll_batch_size=None, latency_model=None,
+                 connector=None, cache=None, governor=None, preprocessor=None,
+                 metrics=None, balance_tracker=None, journal=None,
+                 hedger=None, pingback=None, background_queue=None,
+                 retry_policy=None, circuit_breaker=None, loop=None):
         if not isinstance(api_key, str) or len(api_key) != 32:
             raise ValueError('api_key must be string 32 bytes')
         if check_interval <= 0:
             raise ValueError('check_interval must be integer '
                              'and greater than zero')
+        if check_intervals and min(check_intervals.values()) <= 0:
+            raise ValueError('check_intervals must be greater than zero')
         if send_interval <= 0:
             raise ValueError('send_interval must be integer '
                              'and greater than zero')
+        if poll_batch_size is not None and poll_batch_size <= 0:
+            raise ValueError('poll_batch_size must be integer '
+                             'and greater than zero')
 
         self._api_key = api_key
         self._check_interval = check_interval
         self._send_interval = send_interval
+        self._latency = latency_model
+        self._cache = cache
+        self._governor = governor
+        self._preprocessor = preprocessor
+        self._metrics = metrics
+        self._balance = balance_tracker
+        self._balance_task = None
+        self._submitting = set()
+        self._journal = journal
+        self._hedger = hedger
+        self._pingback = pingback
+        self._background = background_queue
+        self._retry = retry_policy
+        self._breaker = circuit_breaker
+        self._submissions = 0
+        self._slot_rejections = 0
+
+        if ssl is True:
+            ssl = create_ssl_context(metrics=metrics)
+        scheme = 'https' if ssl else 'http'
+        if port is None:
+            port = 443 if ssl else 80
+        self._request_url = '{}://{}:{}/in.php'.format(scheme, domain, port)
+        self._response_url = '{}://{}:{}/res.php'.format(scheme, domain, port)
+        # the loop and the session are bound by the first request, so a
+        # client can be built before the loop runs and survives a fork
+        self._event_loop = loop
+        self._ssl = ssl or None
+        self._connector = connector
+        self._client_session = None
+
+        if pingback is not None:
+            check_interval = pingback.fallback_interval
+        self._poller_options = {
+            'batch_size': poll_batch_size or 1,
+            'interval': check_interval,
+            'latency': latency_model,
+            'fallback': pingback is not None,
+            'intervals': check_intervals,
+        }
+        self._poller = Poller(self, loop=loop, **self._poller_options)
+        _clients.add(self)
+
+    @property
+    def _loop(self):
+        if self._event_loop is None:
+            self._event_loop = asyncio.get_running_loop()
+        return self._event_loop
+
+    @property
+    def _session(self):
+        if self._client_session is None:
+            self._client_session = self._create_session()
+        return self._client_session
+
+    @_session.setter
+    def _session(self, session):
+        self._client_session = session
+
+    def _after_fork(self):
+        # the parent's loop, connections and pending captchas can't be used
+        # by a forked child, it starts over with its own. They are kept
+        # referenced, their cleanup would unregister the parent's sockets
+        # from the epoll instance it shares with the child.
+        _inherited.append((self._client_session, self._poller,
+                           self._balance_task, self._submitting))
+        self._event_loop = None
+        self._submitting = set()
+        self._client_session = None
+        self._connector = None
+        self._balance_task = None
+        self._poller = Poller(self, loop=None, **self._poller_options)
+        for component in (self._cache, self._governor, self._preprocessor,
+                          self._journal, self._pingback, self._background):
+            if component is not None:
+                _inherited.append(component._after_fork())
+
+    def resolve(self, captcha, *, priority=0, journal_key=None, timeout=None,
+                **ext_opts):
+        if timeout is not None and timeout <= 0:
+            raise ValueError('timeout must be greater than zero')
+
+        key = None
+        if self._cache is not None:
+            key = self._cache.key(captcha, ext_opts)
+        if key is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                task = CaptchaTask(LatencyModel.profile(ext_opts),
+                                   priority=priority, loop=self._loop)
+                task.captcha_id = cached[0]
+                task._set_result(cached[1])
+                return task
+
+        deadline = None
+        if timeout is not None:
+            deadline = self._loop.time() + timeout
+        if key is None:
+            return self._resolve(captcha, ext_opts, journal_key, deadline,
+                                 priority=priority)
+
+        shared = self._cache.pending(key)
+        if shared is None:
+            # the shared captcha runs as long as anybody waits for it
+            shared = self._resolve(captcha, ext_opts, journal_key,
+                                   priority=priority)
+            self._cache.add_pending(key, shared)
+        return self._follow(shared, deadline, priority)
+
+    def _follow(self, shared, deadline, priority):
+        # every caller of a shared captcha waits with its own deadline
+        task = CaptchaTask(shared.profile, priority=priority,
+                           deadline=deadline, loop=self._loop)
+        if priority > shared.priority:
+            # polled as often as its most urgent caller needs
+            shared.priority = priority
+        shared._waiters += 1
+
+        def resolved(shared):
+            task.captcha_id = shared.captcha_id
+            if shared.cancelled():
+                task.cancel()
+            elif shared.exception() is not None:
+                task._set_exception(shared.exception())
+            else:
+                task._set_result(shared.result()[1])
+
+        def detached(task):
+            if task.captcha_id is None:
+                # an expired follower still reports the captcha it paid for
+                task.captcha_id = shared.captcha_id
+            if task.cancelled():
+                task.state = CANCELLED
+            shared._waiters -= 1
+            if not shared.done() and not shared._waiters:
+                shared.cancel()
+
+        shared.add_done_callback(resolved)
+        task.add_done_callback(detached)
+        if deadline is not None:
+            handle = self._loop.call_at(deadline, self._expire, task)
+            task.add_done_callback(lambda task: handle.cancel())
+        return task
+
+    def _resolve(self, captcha, ext_opts, journal_key=None, deadline=None,
+                 hedge=True, priority=0):
+        task = CaptchaTask(LatencyModel.profile(ext_opts), priority=priority,
+                           deadline=deadline, loop=self._loop)
+        if self._balance is not None:
+            if self._balance.stale:
+                self._refresh_balance()
+            if not self._balance.reserve():
+                task._set_exception(ZeroBalanceError(
+                    'Balance is not enough to pay for the captcha'))
+                return task
+
+        task.add_done_callback(self._task_done)
+        if deadline is not None:
+            handle = self._loop.call_at(deadline, self._expire, task)
+            task.add_done_callback(lambda task: handle.cancel())
+        task._submit = self._loop.create_task(
+            self._submit(task, captcha, ext_opts, journal_key, hedge))
+        self._submitting.add(task)
+        return task
+
+    def resume(self):
+        if self._journal is None:
+            raise RuntimeError('journal is not configured')
+
+        tasks = []
+        now, wall = self._loop.time(), time.time()
+        for captcha_id, key, profile, submitted in (
+                self._journal.take_unfinished()):
+            task = CaptchaTask(profile, loop=self._loop)
+            task.captcha_id = captcha_id
+            task.started = now - max(0, wall - submitted)
+            task.add_done_callback(partial(self._task_done, reserved=False))
+            self._poller.add(task)
+            if self._pingback is not None:
+                self._pingback.register(captcha_id, self._poller.push)
+            tasks.append((key, task))
+        return tasks
+
+    def resolve_many(self, captchas, *, concurrency=100, **ext_opts):
+        if concurrency <= 0:
+            raise ValueError('concurrency must be integer '
+                             'and greater than zero')
+        return ResolveIterator(self, captchas, concurrency=concurrency,
+                               ext_opts=ext_opts, loop=self._loop)
 
-        self._request_url = 'http://{}:{}/in.php'.format(domain, port)
-        self._response_url = 'http://{}:{}/res.php'.format(domain, port)
-        self._loop = loop or asyncio.get_event_loop()
-        self._session = self._create_session()
-
-    @asyncio.coroutine
-    def resolve(self, captcha, **ext_opts):
-        captcha_id = yield from self._send_captcha(captcha, **ext_opts)
-        resolved = yield from self._get_captcha(captcha_id)
-        return captcha_id, resolved
-
-    @asyncio.coroutine
-    def _send_captcha(self, captcha, **ext_opts):
-        data = aiohttp.helpers.FormData((('key', self._api_key),))
-
-        if isinstance(captcha, (bytes, bytearray)):
-            captcha = b64encode(captcha)
-            data.add_fields(('method', 'base64'), ('body', captcha.decode()))
-        elif isinstance(captcha, io.IOBase):
-            data.add_field('method', 'post')
-            data.add_field('file', captcha, filename='cap',
-                           content_type='multipart/form-data')
+    async def _submit(self, task, captcha, ext_opts, journal_key, hedge):
+        try:
+            if self._preprocessor is not None:
+                captcha = await self._preprocessor.process(captcha)
+            task.captcha_id = await self._send_captcha(
+                captcha, deadline=task.deadline, priority=task.priority,
+                **ext_opts)
+        except asyncio.TimeoutError as e:
+            if task.deadline is not None:
+                self._expire(task)
+            else:
+                task._set_exception(network_error(e))
+        except Exception as e:
+            task._set_exception(e)
         else:
-            raise ServiceError('Unsupported captcha type')
-
-        if ext_opts:
-            data.add_fields(list(ext_opts.items()))
-
+            task._submit = None
+            self._submitting.discard(task)
+            if self._journal is not None:
+                self._journal.submitted(task.captcha_id, journal_key,
+                                        task.profile)
+            if not task.done():
+                self._poller.add(task)
+                if self._pingback is not None:
+                    self._pingback.register(task.captcha_id,
+                                            self._poller.push)
+                if hedge and self._hedger is not None:
+                    self._hedger.schedule(self, task, captcha, ext_opts)
+
+    def _expire(self, task):
+        task._set_exception(DeadlineError(
+            'Captcha was not solved before the deadline'))
+
+    def _task_done(self, task, reserved=True):
+        # stop the submission or polling and release the connection
+        if task._submit is not None:
+            task._submit.cancel()
+            task._submit = None
+        self._submitting.discard(task)
+        if task.captcha_id is not None:
+            self._poller.discard(task)
+            if self._pingback is not None:
+                self._pingback.unregister(task.captcha_id)
+
+        if task.cancelled():
+            task.state = CANCELLED
+        elif (self._journal is not None and task.captcha_id is not None and
+                not isinstance(task.exception(), DeadlineError)):
+            # a cancelled or expired captcha is paid already, the journal
+            # keeps it to be resumed
+            self._journal.finished(task.captcha_id)
+
+        balance = self._balance if reserved else None
+        if task.state == DONE:
+            if balance is not None:
+                balance.charge()
+            if self._metrics is not None:
+                self._metrics.observe('solve_seconds',
+                                      self._loop.time() - task.started,
+                                      priority=task.priority)
+        elif balance is not None:
+            balance.release()
+            if (task.state == FAILED and
+                    isinstance(task.exception(), ZeroBalanceError)):
+                balance.update(0.0)
+
+    async def _send_captcha(self, captcha, *, deadline=None, priority=0,
+                            **ext_opts):
+        if self._pingback is not None:
+            ext_opts['pingback'] = await self._pingback.start()
+        form = CaptchaForm(self._api_key, captcha, ext_opts)
+        metrics = self._metrics
+
+        queued = self._loop.time()
+        attempt = 0
         while True:
-            resp = yield from self._session.post(
-                self._request_url, data=data)
+            if self._governor is not None:
+                # retries keep their place among the waiting submissions
+                if metrics is not None:
+                    started = self._loop.time()
+                    metrics.gauge('slot_queue_depth', 1, priority=priority)
+                try:
+                    await self._governor.acquire(priority, since=queued)
+                finally:
+                    if metrics is not None:
+                        metrics.gauge('slot_queue_depth', -1,
+                                      priority=priority)
+                if metrics is not None:
+                    metrics.observe('slot_wait_seconds',
+                                    self._loop.time() - started,
+                                    priority=priority)
+
             try:
-                if resp.status >= 400:
-                    raise ServiceError('HTTP error [status: %d]' %
-                                       resp.status)
-                msg = yield from resp.text()
-
-                if msg == 'ERROR_NO_SLOT_AVAILABLE':
-                    yield from asyncio.sleep(self._send_interval,
-                                             loop=self._loop)
+                msg = await self._call('in.php', self._post_captcha, form,
+                                       deadline)
+            except Exception as e:
+                delay = self._retry_delay('in.php', e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            if msg == 'ERROR_NO_SLOT_AVAILABLE':
+                self._slot_rejections += 1
+                if metrics is not None:
+                    metrics.inc('no_slot_retries_total')
+                if self._governor is not None:
+                    self._governor.on_no_slot()
                 else:
-                    self._handle_error(msg)
-
-                    chunks = msg.split('|', 1)
-                    if len(chunks) == 2 and chunks[0].upper() == 'OK':
-                        return chunks[1]
-                    else:
-                        raise ServiceError('Invalid server reply')
-            except aiohttp.ClientError as e:
-                resp.close()
-                raise ServiceError('Network error: %s' % str(e))
-            finally:
-                yield from resp.release()
-
-    @asyncio.coroutine
-    def _get_captcha(self, captcha_id):
+                    await asyncio.sleep(self._send_interval)
+                continue
+
+            self._handle_error(msg)
+            chunks = msg.split('|', 1)
+            if len(chunks) == 2 and chunks[0].upper() == 'OK':
+                self._submissions += 1
+                if self._governor is not None:
+                    self._governor.on_success()
+                if metrics is not None:
+                    metrics.inc('submits_total')
+                return chunks[1]
+            raise ServiceError('Invalid server reply')
+
+    async def _post_captcha(self, form, deadline):
+        import aiohttp
+
+        if self._metrics is not None:
+            started = self._loop.time()
+        try:
+            resp = await self._session.post(
+                self._request_url, data=form.payload(),
+                **self._request_timeout(deadline))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise network_error(e, deadline)
+        try:
+            if resp.status >= 400:
+                raise http_error(resp.status)
+            msg = await resp.text()
+            if self._metrics is not None:
+                self._metrics.observe('submit_seconds',
+                                      self._loop.time() - started)
+            return msg
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            resp.close()
+            raise network_error(e, deadline)
+        finally:
+            await resp.release()
+
+    async def _call(self, endpoint, func, *args):
+        breaker = self._breaker
+        if breaker is None:
+            return (await func(*args))
+
+        breaker.check(endpoint)
+        try:
+            result = await func(*args)
+        except Exception as e:
+            if is_transient(e):
+                if breaker.on_failure(endpoint) and self._metrics is not None:
+                    self._metrics.inc('circuit_trips_total',
+                                      endpoint=endpoint)
+            elif (isinstance(e, ServiceError) and
+                    not isinstance(e, DeadlineError)):
+                # the service replied, with an error code
+                breaker.on_success(endpoint)
+            raise
+        breaker.on_success(endpoint)
+        return result
+
+    def _retry_delay(self, endpoint, exc, attempt, deadline=None,
+                     count=True):
+        if self._retry is None or not is_transient(exc):
+            return None
+        delay = self._retry.delay(attempt)
+        if delay is None or (deadline is not None and
+                             self._loop.time() + delay >= deadline):
+            return None
+        if count:
+            self._count_retry(endpoint)
+        return delay
+
+    def _count_retry(self, endpoint):
+        self._retry.retried += 1
+        if self._metrics is not None:
+            self._metrics.inc('retries_total', endpoint=endpoint)
+
+    async def _check_captcha(self, captcha_id, deadline=None):
+        import aiohttp
+
         data = {'key': self._api_key, 'action': 'get', 'id': captcha_id}
+        try:
+            resp = await self._session.get(
+                self._response_url, params=data,
+                **self._request_timeout(deadline))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise network_error(e, deadline)
+
+        try:
+            if resp.status >= 400:
+                raise http_error(resp.status)
+            msg = await resp.text()
+            if msg == 'CAPCHA_NOT_READY':
+                return msg
+            self._handle_error(msg)
+
+            chunks = msg.split('|', 1)
+            if len(chunks) == 2 and chunks[0].upper() == 'OK':
+                return chunks[1]
+            raise ServiceError('Invalid server reply')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            resp.close()
+            raise network_error(e, deadline)
+        finally:
+            await resp.release()
+
+    async def _get_captchas(self, captcha_ids):
+        import aiohttp
+
+        data = {'key': self._api_key, 'action': 'get',
+                'ids': ','.join(captcha_ids)}
+        try:
+            resp = await self._session.get(self._response_url, params=data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise network_error(e)
+
+        try:
+            if resp.status >= 400:
+                raise http_error(resp.status)
+            msg = await resp.text()
+            if '|' not in msg and len(captcha_ids) > 1:
+                # an error of the whole request, errors of single captchas
+                # are handled with their replies
+                self._handle_error(msg)
+
+            replies = msg.split('|')
+            if len(replies) != len(captcha_ids):
+                raise ServiceError('Invalid server reply')
+            return replies
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            resp.close()
+            raise network_error(e)
+        finally:
+            await resp.release()
+
+    async def get_balance(self):
+        balance = self._balance
+        if balance is None:
+            return (await self._fetch_balance())
+
+        if balance.balance is None:
+            balance.update((await self._fetch_balance()))
+        elif balance.stale:
+            self._refresh_balance()
+        return balance.projected
+
+    def _refresh_balance(self):
+        if self._balance_task is None or self._balance_task.done():
+            if self._background is not None:
+                self._balance_task = self._background.put(
+                    self._fetch_balance)
+                self._balance_task.add_done_callback(self._balance_fetched)
+            else:
+                self._balance_task = self._loop.create_task(
+                    self._update_balance())
+
+    def _balance_fetched(self, fut):
+        # a failed refresh keeps the last known value as well
+        if not fut.cancelled() and fut.exception() is None:
+            self._balance.update(fut.result())
+
+    async def _update_balance(self):
+        try:
+            self._balance.update((await self._fetch_balance()))
+        except ServiceError:
+            # keep the last known value, retry on the next access
+            pass
+
+    async def _fetch_balance(self):
+        import aiohttp
 
-        while True:
-            resp = yield from self._session.get(self._response_url,
-                                                params=data)
-            try:
-                if resp.status >= 400:
-                    raise ServiceError('HTTP error [status: %d]' %
-                                       resp.status)
-                msg = yield from resp.text()
-
-                if msg == 'CAPCHA_NOT_READY':
-                    yield from asyncio.sleep(self._check_interval,
-                                             loop=self._loop)
-                else:
-                    self._handle_error(msg)
-
-                    chunks = msg.split('|', 1)
-                    if len(chunks) == 2 and chunks[0].upper() == 'OK':
-                        return chunks[1]
-                    else:
-                        raise ServiceError('Invalid server reply')
-            except aiohttp.ClientError as e:
-                resp.close()
-                raise ServiceError('Network error: %s' % str(e))
-            finally:
-                yield from resp.release()
-
-    @asyncio.coroutine
-    def get_balance(self):
         data = {'key': self._api_key, 'action': 'getbalance'}
-        resp = yield from self._session.get(self._response_url, params=data)
+        try:
+            resp = await self._session.get(self._response_url, params=data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise network_error(e)
 
         try:
             if resp.status >= 400:
-                raise ServiceError('HTTP error [status: %d]' % resp.status)
-            msg = (yield from resp.text())
+                raise http_error(resp.status)
+            msg = (await resp.text())
             self._handle_error(msg)
             try:
                 return float(msg)
             except ValueError:
                 raise ServiceError('Invalid server reply')
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             resp.close()
-            raise ServiceError('Network error: %s' % str(e))
+            raise network_error(e)
         finally:
-            yield from resp.release()
+            await resp.release()
+
+    async def abuse(self, captcha_id):
+        if self._cache is not None:
+            self._cache.evict(captcha_id)
+        if self._background is not None:
+            self._background.put(self._report_bad, captcha_id)
+        else:
+            await self._report_bad(captcha_id)
+
+    async def _report_bad(self, captcha_id):
+        import aiohttp
 
-    @asyncio.coroutine
-    def abuse(self, captcha_id):
         data = {'key': self._api_key, 'action': 'reportbad', 'id': captcha_id}
-        resp = yield from self._session.get(self._response_url, params=data)
+        try:
+            resp = await self._session.get(self._response_url, params=data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise network_error(e)
 
         try:
             if resp.status >= 400:
-                raise ServiceError('HTTP error [status: %d]' % resp.status)
-            msg = (yield from resp.text())
+                raise http_error(resp.status)
+            msg = (await resp.text())
             self._handle_error(msg)
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             resp.close()
-            raise ServiceError('Network error: %s' % str(e))
+            raise network_error(e)
         finally:
-            yield from resp.release()
-
-    def close(self):
-        self._session.close()
+            await resp.release()
+
+    async def warmup(self, n=1):
+        resps = await asyncio.gather(
+            *[self._session.head(self._response_url) for _ in range(n)],
+            return_exceptions=True)
+
+        opened = 0
+        for resp in resps:
+            if not isinstance(resp, Exception):
+                await resp.release()
+                opened += 1
+        return opened
+
+    async def close(self):
+        if self._balance_task is not None:
+            self._balance_task.cancel()
+        # captchas still being submitted would fail on the closed session
+        for task in list(self._submitting):
+            task._submit.cancel()
+            task.cancel()
+        self._poller.close()
+        if self._journal is not None:
+            self._journal.flush()
+        if self._background is not None:
+            await self._background.close()
+        if self._pingback is not None:
+            await self._pingback.close()
+        if self._client_session is not None:
+            await self._client_session.close()
+
+    def _request_timeout(self, deadline):
+        if deadline is None:
+            return {}
+        import aiohttp
+
+        remaining = deadline - self._loop.time()
+        if remaining <= 0:
+            raise DeadlineError('Captcha was not solved before the deadline')
+        return {'timeout': aiohttp.ClientTimeout(total=remaining)}
 
     def _create_session(self):
-        return aiohttp.ClientSession(loop=self._loop)
+        import aiohttp
+
+        trace_configs = None
+        if self._metrics is not None:
+            trace_configs = [self._metrics.trace_config()]
+        connector = self._connector
+        if connector is None and self._ssl is not None:
+            # keep TLS connections alive between polls
+            connector = create_connector(ssl=self._ssl, loop=self._loop)
+        # a connector passed by the caller may be shared with other clients
+        return aiohttp.ClientSession(
+            loop=self._loop, connector=connector,
+            connector_owner=self._connector is None,
+            trace_configs=trace_configs)
 
     def _handle_error(self, msg):
         msg = msg.upper()
         if msg.startswith('ERROR_'):
-            errs = {
-                'ERROR_WRONG_USER_KEY':
-                    UserKeyError('Account authorization key is invalid'),
-                'ERROR_KEY_DOES_NOT_EXIST':
-                    UserKeyError('Account authorization key '
-                                 'not found in the system'),
-                'ERROR_ZERO_BALANCE':
-                    ZeroBalanceError('Account has zero or negative balance'),
-                'ERROR_ZERO_CAPTCHA_FILESIZE':
-                    ServiceError('The size of the captcha you are '
-                                 'uploading is less than 100 bytes.'),
-                'ERROR_IMAGE_TYPE_NOT_SUPPORTED':
-                    ServiceError('Could not determine captcha file type'),
-                'ERROR_IP_NOT_ALLOWED':
-                    ServiceError('Request with current account key '
-                                 'is not allowed from your IP'),
-                'ERROR_NO_SUCH_CAPCHA_ID':
-                    ServiceError('Captcha with such ID was '
-                                 'not found in the system'),
-                'ERROR_NO_REQUEST_ACTION_RECEIVED':
-                    ServiceError('No request action received')
-            }
-            if msg in errs:
-                raise errs[msg]
+            exc = error_from_code(msg)
+            if self._metrics is not None:
+                # unknown replies would make the label unbounded
+                self._metrics.inc('errors_total',
+                                  code=msg if exc is not None else 'other')
+            if exc is not None:
+                raise exc
 
     def __enter__(self):
-        return self
+        raise TypeError('Use "async with" instead')
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
 
 class AntiGate(AntiCaptcha):
-    def __init__(self, api_key, *, domain='antigate.com', port=80,
-                 check_interval=10, send_interval=0.1, loop=None):
-        super().__init__(api_key, domain=domain, port=port,
-                         check_interval=check_interval, loop=loop,
-                         send_interval=send_interval)
+    def __init__(self, api_key, *, domain='antigate.com', **kwargs):
+        super().__init__(api_key, domain=domain, **kwargs)
+
+
+_clients = weakref.WeakSet()
+_inherited = []
+
+
+def _after_fork():
+    for client in list(_clients):
+        client._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
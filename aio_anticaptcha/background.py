@@ -0,0 +1,159 @@
+import asyncio
+from collections import deque
+
+from .retry import is_transient
+
+__all__ = ('BackgroundQueue',)
+
+
+class BackgroundQueue:
+    """Fire-and-forget queue of non-critical service calls.
+
+    ``abuse`` reports and balance refreshes are queued instead of being
+    awaited on the caller's path. Up to ``batch_size`` calls are sent
+    together, at most ``rate`` calls per second, a network error or a
+    ``TransientError`` is retried ``retries`` times after an
+    exponentially growing ``backoff``. Beyond ``max_size`` queued calls
+    the oldest one is dropped. The client's ``close`` flushes the queue
+    for up to ``flush_timeout`` seconds.
+    """
+
+    def __init__(self, *, rate=5, batch_size=10, retries=3, backoff=0.5,
+                 max_size=1000, flush_timeout=10, loop=None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than zero')
+        if batch_size <= 0:
+            raise ValueError('batch_size must be integer '
+                             'and greater than zero')
+        if retries < 0:
+            raise ValueError('retries must not be negative')
+        if backoff <= 0:
+            raise ValueError('backoff must be greater than zero')
+        if max_size <= 0:
+            raise ValueError('max_size must be integer '
+                             'and greater than zero')
+
+        self._rate = rate
+        self._batch_size = batch_size
+        self._retries = retries
+        self._backoff = backoff
+        self._max_size = max_size
+        self._flush_timeout = flush_timeout
+        self._event_loop = loop
+
+        self._queue = deque()
+        self._futures = set()
+        self._idle = None
+        self._task = None
+        self._next_batch = 0
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def _loop(self):
+        if self._event_loop is None:
+            self._event_loop = asyncio.get_running_loop()
+        return self._event_loop
+
+    def __len__(self):
+        return len(self._futures)
+
+    def put(self, func, *args):
+        fut = self._loop.create_future()
+        self._futures.add(fut)
+        fut.add_done_callback(self._call_done)
+        if len(self._queue) >= self._max_size:
+            self._queue.popleft()[3].cancel()
+            self.dropped += 1
+        self._enqueue((func, args, 0, fut))
+        return fut
+
+    def stats(self):
+        return {'queued': len(self), 'sent': self.sent,
+                'retried': self.retried, 'failed': self.failed,
+                'dropped': self.dropped}
+
+    async def flush(self):
+        if self._futures:
+            if self._idle is None:
+                self._idle = self._loop.create_future()
+            await asyncio.shield(self._idle)
+
+    async def close(self):
+        try:
+            await asyncio.wait_for(self.flush(), self._flush_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for fut in list(self._futures):
+            fut.cancel()
+        self._queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _after_fork(self):
+        # calls queued by the parent are sent by the parent
+        inherited = (self._task, self._queue, self._futures, self._idle)
+        self._event_loop = None
+        self._queue = deque()
+        self._futures = set()
+        self._idle = None
+        self._task = None
+        self._next_batch = 0
+        return inherited
+
+    def _enqueue(self, item):
+        if item[3].done():
+            return
+        self._queue.append(item)
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+
+    def _call_done(self, fut):
+        self._futures.discard(fut)
+        if not fut.cancelled():
+            # nobody has to await a fire-and-forget call
+            fut.exception()
+        if not self._futures and self._idle is not None:
+            if not self._idle.done():
+                self._idle.set_result(None)
+            self._idle = None
+
+    async def _run(self):
+        while self._queue:
+            delay = self._next_batch - self._loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            batch = []
+            while self._queue and len(batch) < self._batch_size:
+                item = self._queue.popleft()
+                if not item[3].done():
+                    batch.append(item)
+            if batch:
+                self._next_batch = self._loop.time() + len(batch) / self._rate
+                await asyncio.gather(*[self._call(*item) for item in batch])
+
+    async def _call(self, func, args, attempt, fut):
+        try:
+            result = await func(*args)
+        except Exception as e:
+            if is_transient(e) and attempt < self._retries:
+                self.retried += 1
+                self._loop.call_later(self._backoff * 2 ** attempt,
+                                      self._enqueue,
+                                      (func, args, attempt + 1, fut))
+            else:
+                self._fail(fut, e)
+        else:
+            self.sent += 1
+            if not fut.done():
+                fut.set_result(result)
+
+    def _fail(self, fut, exc):
+        self.failed += 1
+        if not fut.done():
+            fut.set_exception(exc)
@@ -0,0 +1,62 @@
+import time
+
+__all__ = ('BalanceTracker',)
+
+
+class BalanceTracker:
+    """Account balance cached for ``ttl`` seconds and charged locally.
+
+    Between refreshes every resolved captcha subtracts ``captcha_cost``,
+    submissions in flight reserve it, so captchas the balance can't cover
+    are refused without a round-trip.
+    """
+
+    def __init__(self, *, ttl=60, captcha_cost=0.0007):
+        if ttl <= 0:
+            raise ValueError('ttl must be greater than zero')
+        if captcha_cost < 0:
+            raise ValueError('captcha_cost must not be negative')
+
+        self._ttl = ttl
+        self._cost = captcha_cost
+        self._balance = None
+        self._updated = None
+        self._charged = 0
+        self._reserved = 0
+
+    @property
+    def balance(self):
+        return self._balance
+
+    @property
+    def projected(self):
+        if self._balance is None:
+            return None
+        return self._balance - (self._charged + self._reserved) * self._cost
+
+    @property
+    def stale(self):
+        return (self._updated is None or
+                time.monotonic() - self._updated >= self._ttl)
+
+    def update(self, balance):
+        self._balance = balance
+        self._updated = time.monotonic()
+        self._charged = 0
+
+    def invalidate(self):
+        self._updated = None
+
+    def reserve(self):
+        projected = self.projected
+        if projected is not None and projected < self._cost:
+            return False
+        self._reserved += 1
+        return True
+
+    def release(self):
+        self._reserved = max(0, self._reserved - 1)
+
+    def charge(self):
+        self.release()
+        self._charged += 1
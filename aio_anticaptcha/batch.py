@@ -0,0 +1,78 @@
+import asyncio
+from collections import deque
+
+
+class ResolveIterator:
+    """Yields ``(index, captcha_id, answer or exception)`` as they resolve.
+
+    At most ``concurrency`` captchas are in flight, the input is consumed
+    lazily so huge backlogs are processed with constant memory.
+    """
+
+    def __init__(self, client, captchas, *, concurrency, ext_opts, loop):
+        if hasattr(captchas, '__aiter__'):
+            self._aiter = captchas.__aiter__()
+            self._iter = None
+        else:
+            self._aiter = None
+            self._iter = iter(captchas)
+
+        self._client = client
+        self._concurrency = concurrency
+        self._ext_opts = ext_opts
+        self._loop = loop
+
+        self._index = 0
+        self._exhausted = False
+        self._pending = {}
+        self._done = deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._done:
+            await self._fill()
+            if not self._pending:
+                raise StopAsyncIteration
+
+            done, _ = await asyncio.wait(
+                self._pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                index, task = self._pending.pop(fut)
+                # a failed captcha may have been accepted, and paid, already
+                if fut.cancelled():
+                    self._done.append((index, task.captcha_id,
+                                       asyncio.CancelledError()))
+                elif fut.exception() is not None:
+                    self._done.append((index, task.captcha_id,
+                                       fut.exception()))
+                else:
+                    captcha_id, answer = fut.result()
+                    self._done.append((index, captcha_id, answer))
+        return self._done.popleft()
+
+    def close(self):
+        for fut in self._pending:
+            fut.cancel()
+        self._pending.clear()
+        self._exhausted = True
+
+    async def aclose(self):
+        self.close()
+
+    async def _fill(self):
+        while not self._exhausted and len(self._pending) < self._concurrency:
+            try:
+                if self._aiter is not None:
+                    captcha = await self._aiter.__anext__()
+                else:
+                    captcha = next(self._iter)
+            except (StopIteration, StopAsyncIteration):
+                self._exhausted = True
+                break
+
+            task = self._client.resolve(captcha, **self._ext_opts)
+            fut = asyncio.ensure_future(task, loop=self._loop)
+            self._pending[fut] = (self._index, task)
+            self._index += 1
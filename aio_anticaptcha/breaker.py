@@ -0,0 +1,81 @@
+import time
+
+from .errors import CircuitOpenError
+
+__all__ = ('CircuitBreaker',)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class _Circuit:
+    __slots__ = ('failures', 'opened', 'probing')
+
+    def __init__(self):
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+
+class CircuitBreaker:
+    """Fails calls to an unavailable endpoint fast.
+
+    Every endpoint has its own circuit. After ``threshold`` consecutive
+    transient failures it opens and calls raise ``CircuitOpenError``
+    without a request. ``reset_timeout`` seconds later a single probe is
+    let through (half-open), its success closes the circuit and its failure
+    opens it again.
+    """
+
+    def __init__(self, *, threshold=5, reset_timeout=30):
+        if threshold < 1:
+            raise ValueError('threshold must be greater or equal than 1')
+        if reset_timeout <= 0:
+            raise ValueError('reset_timeout must be greater than zero')
+
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._circuits = {}
+
+        self.trips = 0
+        self.rejected = 0
+
+    def state(self, endpoint):
+        circuit = self._circuits.get(endpoint)
+        if circuit is None or circuit.opened is None:
+            return CLOSED
+        return HALF_OPEN if circuit.probing else OPEN
+
+    def check(self, endpoint):
+        circuit = self._circuits.get(endpoint)
+        if circuit is None or circuit.opened is None:
+            return
+        now = time.monotonic()
+        if now - circuit.opened >= self._reset_timeout:
+            # let one probe through, another one if it never reports back
+            circuit.opened = now
+            circuit.probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError('Circuit of %s is open' % endpoint)
+
+    def on_success(self, endpoint):
+        circuit = self._circuits.get(endpoint)
+        if circuit is not None:
+            circuit.failures = 0
+            circuit.opened = None
+            circuit.probing = False
+
+    def on_failure(self, endpoint):
+        circuit = self._circuits.get(endpoint)
+        if circuit is None:
+            circuit = self._circuits[endpoint] = _Circuit()
+        circuit.failures += 1
+        if circuit.probing or (circuit.opened is None and
+                               circuit.failures >= self._threshold):
+            circuit.opened = time.monotonic()
+            circuit.probing = False
+            self.trips += 1
+            return True
+        return False
@@ -0,0 +1,293 @@
+import asyncio
+import io
+import json
+import os
+import signal
+import struct
+from base64 import b64decode, b64encode
+
+from . import errors
+from .errors import ServiceError
+
+__all__ = ('Broker', 'BrokerClient')
+
+DEFAULT_SOCKET = '/tmp/aio-anticaptcha.sock'
+MAX_FRAME = 16 * 1024 * 1024
+
+_header = struct.Struct('>I')
+
+
+def _encode(message):
+    data = json.dumps(message).encode('utf-8')
+    return _header.pack(len(data)) + data
+
+
+async def _read(reader):
+    size, = _header.unpack((await reader.readexactly(_header.size)))
+    if size > MAX_FRAME:
+        raise ServiceError('Broker frame is too large')
+    return json.loads((await reader.readexactly(size)).decode('utf-8'))
+
+
+class Broker:
+    """Serves one client to local processes over a Unix socket.
+
+    Every request is a length-prefixed JSON frame, replies carry the
+    request id and are sent as soon as they are ready, so a connection
+    multiplexes any number of captchas. Captchas of a closed connection
+    are cancelled.
+    """
+
+    def __init__(self, client, path=DEFAULT_SOCKET, *, loop=None):
+        self._client = client
+        self._path = path
+        self._loop = loop or asyncio.get_running_loop()
+        self._server = None
+        self._connections = {}
+
+    async def start(self):
+        if os.path.exists(self._path):
+            # left by a broker which was killed
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(
+            self._serve, self._path)
+
+    async def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+            os.unlink(self._path)
+        for writer, pending in self._connections.items():
+            for task in list(pending.values()):
+                task.cancel()
+            writer.close()
+        self._connections = {}
+        if server is not None:
+            await server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        pending = {}
+        self._connections[writer] = pending
+        try:
+            while True:
+                try:
+                    request = await _read(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                request_id = request.get('id')
+                if request.get('method') == 'cancel':
+                    task = pending.get(request_id)
+                    if task is not None:
+                        task.cancel()
+                    continue
+                task = pending[request_id] = self._dispatch(request)
+                task.add_done_callback(
+                    lambda task, rid=request_id: self._reply(
+                        writer, pending, rid, task))
+        except ServiceError:
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            for task in list(pending.values()):
+                task.cancel()
+            writer.close()
+
+    def _dispatch(self, request):
+        method = request.get('method')
+        try:
+            if method == 'resolve':
+                captcha = b64decode(request['captcha'])
+                # a waiter task, cancelling it leaves captchas shared
+                # through the cache to the other waiters
+                coro = self._client.resolve(captcha, **request['ext_opts'])
+            elif method == 'abuse':
+                coro = self._client.abuse(request['captcha_id'])
+            elif method == 'get_balance':
+                coro = self._client.get_balance()
+            else:
+                raise ServiceError('Unknown broker method: %s' % method)
+        except Exception as e:
+            fut = self._loop.create_future()
+            fut.set_exception(e)
+            return fut
+        return asyncio.ensure_future(coro, loop=self._loop)
+
+    def _reply(self, writer, pending, request_id, task):
+        pending.pop(request_id, None)
+        if task.cancelled() or writer.transport.is_closing():
+            return
+        exc = task.exception()
+        if exc is None:
+            reply = {'id': request_id, 'result': task.result()}
+        else:
+            reply = {'id': request_id, 'error': type(exc).__name__,
+                     'message': str(exc)}
+        writer.write(_encode(reply))
+
+
+class BrokerClient:
+    """``resolve``/``abuse``/``get_balance`` served by a ``Broker``."""
+
+    def __init__(self, path=DEFAULT_SOCKET, *, loop=None):
+        self._path = path
+        self._loop = loop or asyncio.get_running_loop()
+        self._writer = None
+        self._reader_task = None
+        self._connecting = None
+        self._pending = {}
+        self._ids = 0
+
+    async def resolve(self, captcha, **ext_opts):
+        if isinstance(captcha, io.IOBase):
+            captcha = captcha.read()
+        if not isinstance(captcha, (bytes, bytearray, memoryview)):
+            raise ServiceError('Unsupported captcha type')
+        captcha_id, answer = await self._request(
+            'resolve', captcha=b64encode(captcha).decode('ascii'),
+            ext_opts=ext_opts)
+        return captcha_id, answer
+
+    async def abuse(self, captcha_id):
+        await self._request('abuse', captcha_id=captcha_id)
+
+    async def get_balance(self):
+        return (await self._request('get_balance'))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        writer, self._writer = self._writer, None
+        self._fail(ServiceError('Broker connection closed'))
+        if writer is not None:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _request(self, method, **params):
+        if self._writer is None:
+            if self._connecting is None:
+                self._connecting = self._loop.create_task(self._connect())
+            await asyncio.shield(self._connecting)
+
+        self._ids += 1
+        request_id = self._ids
+        fut = self._loop.create_future()
+        self._pending[request_id] = fut
+        params.update(id=request_id, method=method)
+        self._writer.write(_encode(params))
+        try:
+            return (await fut)
+        finally:
+            self._pending.pop(request_id, None)
+            if fut.cancelled() and self._writer is not None:
+                self._writer.write(_encode({'id': request_id,
+                                            'method': 'cancel'}))
+
+    async def _connect(self):
+        try:
+            reader, self._writer = await asyncio.open_unix_connection(
+                self._path)
+        except OSError as e:
+            raise ServiceError('Broker is not available: %s' % str(e))
+        finally:
+            self._connecting = None
+        self._reader_task = self._loop.create_task(self._read_replies(reader))
+
+    async def _read_replies(self, reader):
+        try:
+            while True:
+                reply = await _read(reader)
+                fut = self._pending.get(reply['id'])
+                if fut is None or fut.done():
+                    continue
+                if 'error' in reply:
+                    fut.set_exception(_error(reply['error'],
+                                             reply['message']))
+                else:
+                    fut.set_result(reply['result'])
+        except (asyncio.IncompleteReadError, ConnectionError,
+                ServiceError):
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._reader_task = None
+            self._fail(ServiceError('Broker connection lost'))
+
+    def _fail(self, exc):
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+        self._pending.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+def _error(name, message):
+    exc_class = getattr(errors, name, None)
+    if not (isinstance(exc_class, type) and
+            issubclass(exc_class, ServiceError)):
+        exc_class = ServiceError
+    return exc_class(message)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Share one anti-captcha client between local processes.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--api-key',
+                        default=os.environ.get('ANTICAPTCHA_API_KEY'),
+                        help='defaults to $ANTICAPTCHA_API_KEY')
+    parser.add_argument('--domain', default='anti-captcha.com')
+    parser.add_argument('--port', type=int,
+                        help='defaults to 443 with --ssl, 80 otherwise')
+    parser.add_argument('--ssl', action='store_true',
+                        help='talk to the service over HTTPS')
+    parser.add_argument('--check-interval', type=float, default=10)
+    parser.add_argument('--poll-batch-size', type=int)
+    parser.add_argument('--adaptive', action='store_true',
+                        help='learn the polling schedule')
+    parser.add_argument('--governor', action='store_true',
+                        help='adapt the submission rate to free slots')
+    parser.add_argument('--cache', type=int, default=0,
+                        help='answer cache size, 0 disables the cache')
+    args = parser.parse_args(argv)
+    if not args.api_key:
+        parser.error('--api-key or $ANTICAPTCHA_API_KEY is required')
+
+    asyncio.run(_serve_forever(args))
+
+
+async def _serve_forever(args):
+    from . import AntiCaptcha, AnswerCache, LatencyModel, SlotGovernor
+
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set_result, None)
+
+    client = AntiCaptcha(
+        args.api_key, domain=args.domain, port=args.port,
+        ssl=args.ssl or None,
+        check_interval=args.check_interval,
+        poll_batch_size=args.poll_batch_size,
+        latency_model=LatencyModel() if args.adaptive else None,
+        governor=SlotGovernor() if args.governor else None,
+        cache=AnswerCache(maxsize=args.cache) if args.cache else None)
+    async with client:
+        broker = Broker(client, args.socket)
+        await broker.start()
+        try:
+            await stopped
+        finally:
+            await broker.close()
+
+
+if __name__ == '__main__':
+    main()
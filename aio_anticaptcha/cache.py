@@ -0,0 +1,116 @@
+import hashlib
+import time
+from collections import OrderedDict
+from functools import partial
+
+__all__ = ('AnswerCache',)
+
+# rough per entry overhead of the bookkeeping structures
+ENTRY_OVERHEAD = 200
+
+
+class AnswerCache:
+    """Answers keyed by a hash of the captcha image and additional options.
+
+    Resolved answers are evicted by TTL, LRU order and a memory bound.
+    Identical captchas submitted concurrently share one in-flight task.
+    """
+
+    def __init__(self, *, maxsize=1024, ttl=3600, max_bytes=4 * 1024 * 1024):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be integer and greater than zero')
+        if ttl <= 0:
+            raise ValueError('ttl must be greater than zero')
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be integer '
+                             'and greater than zero')
+
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._inflight = {}
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    @staticmethod
+    def key(captcha, ext_opts):
+        if not isinstance(captcha, (bytes, bytearray, memoryview)):
+            return None
+        digest = hashlib.sha256(captcha)
+        for k, v in sorted(ext_opts.items()):
+            digest.update(('\0%s=%s' % (k, v)).encode())
+        return digest.digest()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            captcha_id, answer, expires, _ = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return captcha_id, answer
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, captcha_id, answer):
+        if key in self._entries:
+            self._remove(key)
+
+        size = len(key) + len(captcha_id) + len(answer) + ENTRY_OVERHEAD
+        if size > self._max_bytes:
+            return
+        self._entries[key] = (captcha_id, answer,
+                              time.monotonic() + self._ttl, size)
+        self._keys[captcha_id] = key
+        self._size += size
+
+        while (len(self._entries) > self._maxsize or
+               self._size > self._max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def evict(self, captcha_id):
+        key = self._keys.get(captcha_id)
+        if key is not None:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys.clear()
+        self._size = 0
+
+    def _after_fork(self):
+        # in-flight tasks belong to the parent's event loop
+        inherited, self._inflight = self._inflight, {}
+        return inherited
+
+    def pending(self, key):
+        return self._inflight.get(key)
+
+    def add_pending(self, key, fut):
+        self._inflight[key] = fut
+        fut.add_done_callback(partial(self._resolved, key))
+
+    def _resolved(self, key, fut):
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        if not fut.cancelled() and fut.exception() is None:
+            self.put(key, *fut.result())
+
+    def _remove(self, key):
+        captcha_id, _, _, size = self._entries.pop(key)
+        if self._keys.get(captcha_id) == key:
+            del self._keys[captcha_id]
+        self._size -= size
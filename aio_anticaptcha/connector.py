@@ -0,0 +1,83 @@
+import ssl
+import time
+
+__all__ = ('create_connector', 'create_ssl_context')
+
+
+def create_connector(*, limit=100, limit_per_host=0, keepalive_timeout=30,
+                     ttl_dns_cache=300, ssl=None, loop=None):
+    """Create a connection pool which may be shared by several clients."""
+    if limit < 0:
+        raise ValueError('limit must be integer and not negative')
+    if limit_per_host < 0:
+        raise ValueError('limit_per_host must be integer and not negative')
+    if keepalive_timeout <= 0:
+        raise ValueError('keepalive_timeout must be greater than zero')
+
+    import aiohttp
+
+    kwargs = {}
+    if ssl is not None:
+        kwargs['ssl'] = ssl
+    return aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host,
+                                keepalive_timeout=keepalive_timeout,
+                                use_dns_cache=ttl_dns_cache is not None,
+                                ttl_dns_cache=ttl_dns_cache, loop=loop,
+                                **kwargs)
+
+
+def create_ssl_context(*, cafile=None, capath=None, cadata=None,
+                       metrics=None):
+    """Create a client TLS context which resumes sessions.
+
+    Every new connection offers the last session of its host, so only the
+    first connection to a host pays for a full handshake. Handshakes are
+    counted in ``metrics``.
+    """
+    context = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    if cafile is None and capath is None and cadata is None:
+        context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    else:
+        context.load_verify_locations(cafile, capath, cadata)
+    context.metrics = metrics
+    return context
+
+
+class _ResumingObject(ssl.SSLObject):
+    def do_handshake(self):
+        if getattr(self, '_handshake_started', None) is None:
+            self._handshake_started = time.monotonic()
+        super().do_handshake()
+        self.context._handshake_done(self)
+
+
+class _ResumingContext(ssl.SSLContext):
+    sslobject_class = _ResumingObject
+
+    def __init__(self, protocol):
+        self.metrics = None
+        self.handshakes = 0
+        self.resumed = 0
+        self._last = {}
+
+    def wrap_bio(self, incoming, outgoing, server_side=False,
+                 server_hostname=None, session=None):
+        last = self._last.get(server_hostname)
+        if session is None and last is not None and not server_side:
+            # a TLS 1.3 ticket arrives after the handshake, so the session
+            # is taken from the last connection when it is needed
+            session = last.session
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname,
+                                session=session)
+
+    def _handshake_done(self, sslobj):
+        self._last[sslobj.server_hostname] = sslobj
+        self.handshakes += 1
+        if sslobj.session_reused:
+            self.resumed += 1
+        if self.metrics is not None:
+            self.metrics.inc('tls_handshakes_total',
+                             resumed=str(sslobj.session_reused).lower())
+            self.metrics.observe('tls_handshake_seconds',
+                                 time.monotonic() - sslobj._handshake_started)
@@ -0,0 +1,86 @@
+import asyncio
+
+__all__ = ('ServiceError', 'UserKeyError', 'ZeroBalanceError',
+           'IPNotAllowedError', 'DeadlineError', 'TransientError',
+           'CircuitOpenError')
+
+
+class ServiceError(Exception):
+    pass
+
+
+class UserKeyError(ServiceError):
+    pass
+
+
+class ZeroBalanceError(ServiceError):
+    pass
+
+
+class IPNotAllowedError(ServiceError):
+    pass
+
+
+class DeadlineError(ServiceError, asyncio.TimeoutError):
+    pass
+
+
+class TransientError(ServiceError):
+    """Network failure or server side HTTP error, worth retrying."""
+
+
+class CircuitOpenError(TransientError):
+    pass
+
+
+ERRORS = {
+    'ERROR_WRONG_USER_KEY':
+        (UserKeyError, 'Account authorization key is invalid'),
+    'ERROR_KEY_DOES_NOT_EXIST':
+        (UserKeyError, 'Account authorization key not found in the system'),
+    'ERROR_ZERO_BALANCE':
+        (ZeroBalanceError, 'Account has zero or negative balance'),
+    'ERROR_ZERO_CAPTCHA_FILESIZE':
+        (ServiceError, 'The size of the captcha you are '
+                       'uploading is less than 100 bytes.'),
+    'ERROR_IMAGE_TYPE_NOT_SUPPORTED':
+        (ServiceError, 'Could not determine captcha file type'),
+    'ERROR_IP_NOT_ALLOWED':
+        (IPNotAllowedError, 'Request with current account key '
+                            'is not allowed from your IP'),
+    'ERROR_NO_SUCH_CAPCHA_ID':
+        (ServiceError, 'Captcha with such ID was not found in the system'),
+    'ERROR_NO_REQUEST_ACTION_RECEIVED':
+        (ServiceError, 'No request action received'),
+}
+
+
+def network_error(exc, deadline=None):
+    import aiohttp
+
+    if isinstance(exc, asyncio.TimeoutError):
+        if deadline is not None:
+            # the caller's deadline, handled by the caller
+            return exc
+        # aiohttp's own request timeout
+        return TransientError('Network error: request timed out')
+    msg = 'Network error: %s' % str(exc)
+    if isinstance(exc, aiohttp.ClientSSLError):
+        # a certificate problem won't go away by itself
+        return ServiceError(msg)
+    return TransientError(msg)
+
+
+def http_error(status):
+    msg = 'HTTP error [status: %d]' % status
+    if status >= 500 or status == 429:
+        return TransientError(msg)
+    return ServiceError(msg)
+
+
+def error_from_code(code):
+    try:
+        exc_class, msg = ERRORS[code]
+    except KeyError:
+        return None
+    return exc_class(msg)
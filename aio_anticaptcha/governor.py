@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import random
+
+__all__ = ('SlotGovernor',)
+
+
+class SlotGovernor:
+    """Admission control shared by all submitters of a client.
+
+    Submissions are admitted by a token bucket, higher ``priority`` first
+    and in FIFO order within a priority. Waiting ``aging`` seconds is worth
+    one priority level, so low priority submissions are not starved. The
+    rate is cut on ``ERROR_NO_SLOT_AVAILABLE`` (with a jittered,
+    exponentially growing pause) and ramps up additively on successful
+    submissions.
+    """
+
+    def __init__(self, *, rate=10, min_rate=0.5, max_rate=200, increase=1,
+                 decrease=0.5, backoff=0.1, max_backoff=10, jitter=0.5,
+                 aging=10, loop=None):
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError('rate must be in range [min_rate, max_rate] '
+                             'and greater than zero')
+        if not 0 < decrease < 1:
+            raise ValueError('decrease must be in range (0, 1)')
+        if backoff <= 0 or max_backoff < backoff:
+            raise ValueError('backoff must be greater than zero '
+                             'and not greater than max_backoff')
+        if aging <= 0:
+            raise ValueError('aging must be greater than zero')
+
+        self._rate = rate
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+        self._aging = aging
+        self._event_loop = loop
+
+        self._tokens = 1.0
+        self._updated = None
+        self._blocked_until = 0
+        self._last_decrease = 0
+        self._failures = 0
+        self._waiters = []
+        self._order = itertools.count()
+        self._task = None
+
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def _loop(self):
+        if self._event_loop is None:
+            self._event_loop = asyncio.get_running_loop()
+        return self._event_loop
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def queue_depth(self):
+        return sum(1 for waiter in self._waiters if not waiter[2].done())
+
+    def queue_depths(self):
+        depths = {}
+        for _, _, fut, priority in self._waiters:
+            if not fut.done():
+                depths[priority] = depths.get(priority, 0) + 1
+        return depths
+
+    async def acquire(self, priority=0, since=None):
+        if not self._waiters and self._take():
+            return
+
+        if since is None:
+            since = self._loop.time()
+        fut = self._loop.create_future()
+        # the earliest aged arrival goes first: waiting ``aging`` seconds
+        # counts as much as one priority level
+        heapq.heappush(self._waiters, (since - priority * self._aging,
+                                       next(self._order), fut, priority))
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._dispatch())
+        await fut
+
+    def on_success(self):
+        self._failures = 0
+        # additive increase: about ``increase`` per second at full rate
+        self._rate = min(self._max_rate,
+                         self._rate + self._increase / self._rate)
+
+    def on_no_slot(self):
+        self.rejected += 1
+        now = self._loop.time()
+        self._failures += 1
+
+        # rejections of requests sent at the old rate count once
+        if now - self._last_decrease >= 1 / self._rate:
+            self._last_decrease = now
+            self._rate = max(self._min_rate, self._rate * self._decrease)
+            self._tokens = min(self._tokens, 0)
+
+        pause = min(self._max_backoff,
+                    self._backoff * 2 ** (self._failures - 1))
+        pause *= 1 + random.uniform(-self._jitter, self._jitter)
+        self._blocked_until = max(self._blocked_until, now + pause)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for waiter in self._waiters:
+            waiter[2].cancel()
+        self._waiters = []
+
+    def _after_fork(self):
+        # waiters and the dispatcher belong to the parent's loop
+        inherited = (self._task, self._waiters)
+        self._event_loop = None
+        self._task = None
+        self._waiters = []
+        self._updated = None
+        return inherited
+
+    def _refill(self):
+        now = self._loop.time()
+        if self._updated is None:
+            self._updated = now
+        # the bucket holds at most one second of tokens
+        self._tokens = min(max(self._rate, 1),
+                           self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        return now
+
+    def _take(self):
+        now = self._refill()
+        if now < self._blocked_until or self._tokens < 1:
+            return False
+        self._tokens -= 1
+        self.admitted += 1
+        return True
+
+    async def _dispatch(self):
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            elif self._take():
+                heapq.heappop(self._waiters)[2].set_result(None)
+            else:
+                delay = max(self._blocked_until - self._loop.time(),
+                            (1 - self._tokens) / self._rate)
+                await asyncio.sleep(delay)
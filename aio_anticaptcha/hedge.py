@@ -0,0 +1,111 @@
+import itertools
+from functools import partial
+
+from .task import DONE
+
+__all__ = ('Hedger',)
+
+
+class Hedger:
+    """Submits captchas slower than a latency quantile once more.
+
+    A captcha still unsolved ``quantile`` of the learned solve time (or
+    ``delay`` seconds while the client's latency model has no estimate)
+    after submission is sent again, to the same client or round-robin to
+    ``clients``. The first answer wins and the other captcha is dropped
+    from polling and, with ``report_losers``, reported with ``abuse``.
+    Every submission earns ``budget`` hedges, at most ``burst`` are saved.
+    """
+
+    def __init__(self, *, quantile=0.95, delay=None, budget=0.05, burst=10,
+                 clients=(), report_losers=False):
+        if not 0 < quantile < 1:
+            raise ValueError('quantile must be in range (0, 1)')
+        if delay is not None and delay <= 0:
+            raise ValueError('delay must be greater than zero')
+        if not 0 <= budget <= 1:
+            raise ValueError('budget must be in range [0, 1]')
+        if burst < 1:
+            raise ValueError('burst must be greater or equal than 1')
+
+        self._quantile = quantile
+        self._delay = delay
+        self._budget = budget
+        self._burst = burst
+        self._tokens = burst
+        self._targets = itertools.cycle(clients) if clients else None
+        self._report_losers = report_losers
+
+        self.hedged = 0
+        self.won = 0
+
+    def schedule(self, client, task, captcha, ext_opts):
+        self._tokens = min(self._burst, self._tokens + self._budget)
+        if not isinstance(captcha, (bytes, bytearray, memoryview)):
+            # streams are consumed by the first submission
+            return
+
+        delay = None
+        if client._latency is not None:
+            delay = client._latency.quantile(task.profile, self._quantile)
+        if delay is None:
+            delay = self._delay
+        if delay is None:
+            return
+
+        handle = client._loop.call_at(task.started + delay, self._hedge,
+                                      client, task, captcha, ext_opts)
+        task.add_done_callback(lambda task: handle.cancel())
+
+    def stats(self):
+        return {'hedged': self.hedged, 'won': self.won}
+
+    def _hedge(self, client, task, captcha, ext_opts):
+        if task.done() or self._tokens < 1:
+            return
+        self._tokens -= 1
+        self.hedged += 1
+        if client._metrics is not None:
+            client._metrics.inc('hedges_total')
+
+        target = client if self._targets is None else next(self._targets)
+        hedge = target._resolve(captcha, ext_opts, deadline=task.deadline,
+                                hedge=False, priority=task.priority)
+        hedge.add_done_callback(partial(self._hedge_done, client, task))
+        task.add_done_callback(partial(self._drop_hedge, target, hedge))
+
+    def _hedge_done(self, client, task, hedge):
+        if task.done() or hedge.cancelled() or hedge.exception() is not None:
+            return
+        self.won += 1
+        if client._metrics is not None:
+            client._metrics.inc('hedge_wins_total')
+
+        loser = task.captcha_id
+        if task._submit is not None:
+            task._submit.cancel()
+        if loser is not None:
+            client._poller.discard(task)
+            if client._pingback is not None:
+                client._pingback.unregister(loser)
+            if client._journal is not None:
+                client._journal.finished(loser)
+            self._report(client, loser)
+
+        task.captcha_id, answer = hedge.result()
+        task._set_result(answer)
+
+    def _drop_hedge(self, target, hedge, task):
+        if hedge.done():
+            return
+        loser = hedge.captcha_id
+        hedge.cancel()
+        if loser is not None and task.state == DONE:
+            self._report(target, loser)
+
+    def _report(self, client, captcha_id):
+        if self._report_losers:
+            fut = client._loop.create_task(client.abuse(captcha_id))
+            # the report is best effort
+            fut.add_done_callback(
+                lambda fut: fut.cancelled() or fut.exception())
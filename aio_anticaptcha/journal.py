@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+__all__ = ('Journal',)
+
+
+class Journal:
+    """Append-only file of captcha ids accepted by ``in.php``.
+
+    Every submitted id is recorded with the caller supplied key and crossed
+    out once the captcha is finished, so ids which were still being solved
+    when the process died can be polled again after a restart instead of
+    being paid twice. Records are buffered and written off the event loop
+    at most every ``flush_interval`` seconds.
+    """
+
+    def __init__(self, path, *, flush_interval=0.1, fsync=True, loop=None):
+        if flush_interval <= 0:
+            raise ValueError('flush_interval must be greater than zero')
+
+        self._path = path
+        self._flush_interval = flush_interval
+        self._fsync = fsync
+        self._event_loop = loop
+
+        self._buffer = []
+        self._handle = None
+        self._writing = None
+        self._lock = threading.Lock()
+
+        self._unfinished = self._load()
+        self._compact(self._unfinished)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @property
+    def _loop(self):
+        if self._event_loop is None:
+            self._event_loop = asyncio.get_running_loop()
+        return self._event_loop
+
+    def take_unfinished(self):
+        unfinished, self._unfinished = self._unfinished, []
+        return unfinished
+
+    def submitted(self, captcha_id, key=None, profile=()):
+        self._append({'id': captcha_id, 'key': key,
+                      'profile': profile, 'time': time.time()})
+
+    def finished(self, captcha_id):
+        self._append({'id': captcha_id, 'done': True})
+
+    def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        lines, self._buffer = self._buffer, []
+        self._write(lines)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        with self._lock:
+            self._file.close()
+
+    def _after_fork(self):
+        # records buffered by the parent are written by the parent, the
+        # child appends through a handle of its own. The inherited one is
+        # kept open, closing it would write the parent's buffer again.
+        inherited = (self._file, self._handle, self._writing)
+        self._event_loop = None
+        # the parent resumes its unfinished captchas itself
+        self._unfinished = []
+        self._buffer = []
+        self._handle = None
+        self._writing = None
+        # the lock may have been held by a writer thread of the parent
+        self._lock = threading.Lock()
+        if not self._file.closed:
+            self._file = open(self._path, 'a', encoding='utf-8')
+        return inherited
+
+    def _append(self, record):
+        self._buffer.append(json.dumps(record))
+        if self._handle is None and self._writing is None:
+            self._handle = self._loop.call_later(self._flush_interval,
+                                                 self._flush)
+
+    def _flush(self):
+        self._handle = None
+        lines, self._buffer = self._buffer, []
+        self._writing = self._loop.run_in_executor(None, self._write, lines)
+        self._writing.add_done_callback(self._written)
+
+    def _written(self, fut):
+        self._writing = None
+        if self._buffer and not self._file.closed:
+            self._handle = self._loop.call_later(self._flush_interval,
+                                                 self._flush)
+        fut.result()
+
+    def _write(self, lines):
+        if not lines:
+            return
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write('\n'.join(lines) + '\n')
+            self._file.flush()
+            if self._fsync:
+                os.fsync(self._file.fileno())
+
+    def _load(self):
+        pending = {}
+        done = set()
+        try:
+            f = open(self._path, encoding='utf-8')
+        except FileNotFoundError:
+            return []
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write of the last record before a crash
+                    continue
+                if record.get('done'):
+                    done.add(record['id'])
+                else:
+                    pending[record['id']] = (
+                        record['key'],
+                        tuple(tuple(opt) for opt in record['profile']),
+                        record['time'])
+        return [(captcha_id,) + rest for captcha_id, rest in pending.items()
+                if captcha_id not in done]
+
+    def _compact(self, records):
+        tmp = '%s.tmp' % self._path
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for captcha_id, key, profile, submitted in records:
+                f.write(json.dumps({'id': captcha_id, 'key': key,
+                                    'profile': profile,
+                                    'time': submitted}) + '\n')
+            f.flush()
+            if self._fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self._path)
@@ -0,0 +1,111 @@
+import math
+from collections import deque
+
+__all__ = ('LatencyModel',)
+
+
+class LatencyModel:
+    """Learns solve times and fits the polling schedule to them.
+
+    An answer is only seen by the poll after it, so a captcha is known to
+    be solved between its last ``CAPCHA_NOT_READY`` reply and the answer,
+    the midpoint of that interval is taken as its solve time. Savings
+    against the fixed interval are counted for captchas polled on a
+    learned schedule only.
+    """
+
+    def __init__(self, *, window=500, min_samples=20, min_gap=0.5,
+                 quantiles=(0.05, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)):
+        if window < min_samples:
+            raise ValueError('window must be greater or equal '
+                             'than min_samples')
+        if not quantiles or not all(0 <= q <= 1 for q in quantiles):
+            raise ValueError('quantiles must be in range [0, 1]')
+
+        self._window = window
+        self._min_samples = min_samples
+        self.min_gap = min_gap
+        self._quantiles = sorted(quantiles)
+
+        self._samples = {}
+        self._schedules = {}
+
+        self._solved = 0
+        self._polls = 0
+        self._fixed_polls = 0
+        self._latency = 0.0
+        self._fixed_latency = 0.0
+
+    @staticmethod
+    def profile(ext_opts):
+        return tuple(sorted((k, str(v)) for k, v in ext_opts.items()))
+
+    def observe(self, profile, elapsed, polls, interval, not_ready=None,
+                fitted=True):
+        solve_time = elapsed
+        if not_ready is not None:
+            solve_time = (not_ready + elapsed) / 2
+        samples = self._samples.get(profile)
+        if samples is None:
+            samples = self._samples[profile] = deque(maxlen=self._window)
+        samples.append(solve_time)
+        self._schedules.pop(profile, None)
+
+        self._solved += 1
+        self._polls += polls
+        self._latency += elapsed
+        if fitted:
+            # a fixed interval polls at 0, interval, 2 * interval, ...
+            fixed_polls = int(math.ceil(solve_time / interval)) + 1
+            self._fixed_polls += fixed_polls
+            self._fixed_latency += (fixed_polls - 1) * interval
+        else:
+            self._fixed_polls += polls
+            self._fixed_latency += elapsed
+
+    def fitted(self, profile):
+        return self._schedule(profile) is not None
+
+    def quantile(self, profile, q):
+        ordered = self._ordered(profile)
+        if ordered is None:
+            return None
+        return ordered[int(round(q * (len(ordered) - 1)))]
+
+    def next_poll(self, profile, elapsed, polls, interval):
+        schedule = self._schedule(profile)
+        if schedule is None:
+            return 0 if polls == 0 else elapsed + interval
+
+        earliest = elapsed if polls == 0 else elapsed + self.min_gap
+        for offset in schedule:
+            if offset >= earliest:
+                return offset
+        return max(earliest, elapsed + interval)
+
+    def stats(self):
+        return {
+            'solved': self._solved,
+            'polls': self._polls,
+            'fixed_polls': self._fixed_polls,
+            'polls_avoided': self._fixed_polls - self._polls,
+            'latency_saved': self._fixed_latency - self._latency,
+        }
+
+    def _schedule(self, profile):
+        schedule = self._schedules.get(profile)
+        if schedule is None:
+            ordered = self._ordered(profile)
+            if ordered is None:
+                return None
+            last = len(ordered) - 1
+            schedule = sorted({ordered[int(round(q * last))]
+                               for q in self._quantiles})
+            self._schedules[profile] = schedule
+        return schedule
+
+    def _ordered(self, profile):
+        samples = self._samples.get(profile)
+        if not samples or len(samples) < self._min_samples:
+            return None
+        return sorted(samples)
@@ -0,0 +1,178 @@
+import bisect
+import time
+from collections import OrderedDict
+
+__all__ = ('Metrics',)
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15,
+           20, 30, 45, 60, 120, 300)
+COUNTS = (1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50)
+
+HISTOGRAMS = {
+    'polls_per_captcha': COUNTS,
+}
+
+DESCRIPTIONS = {
+    'submits_total': 'Captchas accepted by in.php',
+    'submit_seconds': 'Duration of in.php requests',
+    'slot_wait_seconds': 'Time spent waiting for slot admission',
+    'slot_queue_depth': 'Submissions waiting for slot admission',
+    'no_slot_retries_total': 'ERROR_NO_SLOT_AVAILABLE replies',
+    'polls_total': 'Captcha results checked on res.php',
+    'pingbacks_total': 'Answers pushed to the pingback receiver',
+    'polls_per_captcha': 'res.php checks needed to get an answer',
+    'solve_seconds': 'Time from submission to answer',
+    'errors_total': 'Error codes returned by the service',
+    'retries_total': 'Requests retried after a transient failure',
+    'circuit_trips_total': 'Circuits opened after repeated failures',
+    'hedges_total': 'Captchas submitted again after the hedge delay',
+    'hedge_wins_total': 'Hedged submissions answered first',
+    'requests_in_flight': 'HTTP requests being processed',
+    'connections_created_total': 'New connections opened by the pool',
+    'connections_reused_total': 'Requests served by a pooled connection',
+    'connection_queued_seconds': 'Time spent waiting for a free connection',
+    'connect_seconds': 'Time to open a connection, TLS handshake included',
+    'tls_handshakes_total': 'TLS handshakes, resumed ones are cheaper',
+    'tls_handshake_seconds': 'Duration of TLS handshakes',
+}
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield le, total
+
+
+class Metrics:
+    """Counters and histograms of the submit/poll pipeline."""
+
+    def __init__(self, *, prefix='anticaptcha'):
+        self._prefix = prefix
+        self._counters = OrderedDict()
+        self._gauges = OrderedDict()
+        self._histograms = OrderedDict()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, delta, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = self._histograms[key] = _Histogram(
+                HISTOGRAMS.get(name, SECONDS))
+        hist.observe(value)
+
+    def trace_config(self):
+        import aiohttp
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_end)
+        trace.on_connection_create_start.append(self._on_connect_start)
+        trace.on_connection_create_end.append(self._on_connection_create)
+        trace.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace.on_connection_queued_start.append(self._on_queued_start)
+        trace.on_connection_queued_end.append(self._on_queued_end)
+        return trace
+
+    def snapshot(self):
+        result = OrderedDict()
+        for (name, labels), value in self._counters.items():
+            result[_series(name, labels)] = value
+        for (name, labels), value in self._gauges.items():
+            result[_series(name, labels)] = value
+        for (name, labels), hist in self._histograms.items():
+            result[_series(name, labels)] = {
+                'count': hist.count,
+                'sum': hist.sum,
+                'buckets': list(hist.cumulative()),
+            }
+        return result
+
+    def to_prometheus(self):
+        # every family is rendered as one group under its header
+        families = OrderedDict()
+        for (name, labels), value in self._counters.items():
+            families.setdefault((name, 'counter'), []).append(
+                '%s %s' % (self._name(name, labels), value))
+        for (name, labels), value in self._gauges.items():
+            families.setdefault((name, 'gauge'), []).append(
+                '%s %s' % (self._name(name, labels), value))
+        for (name, labels), hist in self._histograms.items():
+            samples = families.setdefault((name, 'histogram'), [])
+            for le, count in hist.cumulative():
+                samples.append('%s %d' % (self._name(
+                    name + '_bucket', labels + (('le', le),)), count))
+            samples.append('%s %s' % (self._name(name + '_sum', labels),
+                                      hist.sum))
+            samples.append('%s %d' % (self._name(name + '_count', labels),
+                                      hist.count))
+
+        lines = []
+        for (name, kind), samples in families.items():
+            lines.extend(self._header(name, kind))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def _name(self, name, labels=()):
+        return _series('%s_%s' % (self._prefix, name), labels)
+
+    def _header(self, name, kind):
+        full = '%s_%s' % (self._prefix, name)
+        lines = []
+        if name in DESCRIPTIONS:
+            lines.append('# HELP %s %s' % (full, DESCRIPTIONS[name]))
+        lines.append('# TYPE %s %s' % (full, kind))
+        return lines
+
+    async def _on_request_start(self, session, ctx, params):
+        self.gauge('requests_in_flight', 1)
+
+    async def _on_request_end(self, session, ctx, params):
+        self.gauge('requests_in_flight', -1)
+
+    async def _on_connect_start(self, session, ctx, params):
+        ctx.connect_at = time.monotonic()
+
+    async def _on_connection_create(self, session, ctx, params):
+        self.inc('connections_created_total')
+        self.observe('connect_seconds', time.monotonic() - ctx.connect_at)
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self.inc('connections_reused_total')
+
+    async def _on_queued_start(self, session, ctx, params):
+        ctx.queued_at = time.monotonic()
+
+    async def _on_queued_end(self, session, ctx, params):
+        self.observe('connection_queued_seconds',
+                     time.monotonic() - ctx.queued_at)
+
+
+def _series(name, labels=()):
+    if not labels:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % (k, v)
+                                      for k, v in labels))
@@ -0,0 +1,128 @@
+import asyncio
+import secrets
+from collections import OrderedDict
+
+__all__ = ('PingbackReceiver',)
+
+
+class PingbackReceiver:
+    """Local HTTP endpoint the service pushes answers to.
+
+    The client starts it with the first submission and sends its URL as the
+    ``pingback`` of every captcha, answers delivered to it finish captchas
+    at once and polling only recovers lost callbacks every
+    ``fallback_interval`` seconds. ``url`` is the address the service can
+    reach (``http://host:port`` if omitted), a random token is appended to
+    its path so answers can't be forged by other callers.
+    """
+
+    def __init__(self, *, host='127.0.0.1', port=0, url=None,
+                 fallback_interval=60, max_early=1000, loop=None):
+        if fallback_interval <= 0:
+            raise ValueError('fallback_interval must be greater than zero')
+
+        self.fallback_interval = fallback_interval
+        self.path = '/pingback/%s' % secrets.token_urlsafe(16)
+        self._host = host
+        self._port = port
+        self._base_url = url.rstrip('/') if url is not None else None
+        self._max_early = max_early
+        self._event_loop = loop
+
+        self._runner = None
+        self._starting = None
+        self._waiting = {}
+        # answers which arrived before in.php replied with the captcha id
+        self._early = OrderedDict()
+
+        self.received = 0
+
+    @property
+    def _loop(self):
+        if self._event_loop is None:
+            self._event_loop = asyncio.get_running_loop()
+        return self._event_loop
+
+    @property
+    def url(self):
+        if self._runner is None:
+            return None
+        base = self._base_url
+        if base is None:
+            base = 'http://%s:%d' % (self._host,
+                                     self._runner.addresses[0][1])
+        return base + self.path
+
+    async def start(self):
+        if self._runner is None:
+            if self._starting is None:
+                self._starting = self._loop.create_task(self._start())
+            await asyncio.shield(self._starting)
+        return self.url
+
+    async def close(self):
+        if self._starting is not None:
+            self._starting.cancel()
+            self._starting = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self._waiting.clear()
+        self._early.clear()
+
+    def register(self, captcha_id, callback):
+        answer = self._early.pop(captcha_id, None)
+        if answer is not None:
+            callback(captcha_id, answer)
+        else:
+            self._waiting[captcha_id] = callback
+
+    def unregister(self, captcha_id):
+        self._waiting.pop(captcha_id, None)
+
+    def _after_fork(self):
+        # the parent keeps serving its own captchas, the child starts a
+        # receiver of its own with its first submission
+        inherited = (self._runner, self._starting)
+        self._event_loop = None
+        self._runner = None
+        self._starting = None
+        self._waiting = {}
+        self._early = OrderedDict()
+        return inherited
+
+    async def _start(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_route('*', self.path, self._handle)
+        runner = web.AppRunner(app)
+        try:
+            await runner.setup()
+            await web.TCPSite(runner, self._host, self._port).start()
+        except BaseException:
+            await runner.cleanup()
+            raise
+        finally:
+            self._starting = None
+        self._runner = runner
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        data = dict(request.query)
+        if request.method == 'POST':
+            data.update(await request.post())
+        captcha_id, answer = data.get('id'), data.get('code')
+        if captcha_id is None or answer is None:
+            return web.Response(status=400, text='ERROR_NO_ID_OR_CODE')
+
+        self.received += 1
+        callback = self._waiting.pop(captcha_id, None)
+        if callback is not None:
+            callback(captcha_id, answer)
+        else:
+            self._early[captcha_id] = answer
+            if len(self._early) > self._max_early:
+                self._early.popitem(last=False)
+        return web.Response(text='OK')
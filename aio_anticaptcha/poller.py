@@ -0,0 +1,267 @@
+import asyncio
+import heapq
+import itertools
+from collections import OrderedDict
+
+from .errors import ServiceError
+from .task import POLLING
+
+
+class Poller:
+    """Polls all pending captchas from a single coroutine.
+
+    Due captchas are kept in a heap, every poll is a request of its own so
+    a slow reply doesn't hold back the others.
+
+    With ``batch_size`` 1 every captcha is checked with ``action=get&id=``
+    once per ``interval``, larger batches use chunked ``action=get&ids=``
+    calls and check every pending captcha together. ``intervals`` maps
+    task priorities to their own intervals. In ``fallback`` mode answers
+    are pushed with ``push`` and captchas are only checked every
+    ``interval`` after submission.
+    """
+
+    def __init__(self, client, *, batch_size, interval, loop=None,
+                 latency=None, fallback=False, intervals=None):
+        self._client = client
+        self._batch_size = batch_size
+        self._interval = interval
+        self._intervals = {} if fallback else dict(intervals or {})
+        self._loop = loop
+        self._latency = latency
+        self._fallback = fallback
+        self._pending = OrderedDict()
+        # a heap of due polls for every priority
+        self._due = {}
+        self._order = itertools.count()
+        self._task = None
+        self._wakeup = None
+        self._wake_at = None
+        self._requests = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, task):
+        if self._loop is None:
+            self._loop = self._client._loop
+        task.state = POLLING
+        if task.started is None:
+            task.started = self._loop.time()
+        task.due = task.started
+        if self._batch_size > 1 or self._fallback:
+            task.due += self._task_interval(task)
+        self._pending[task.captcha_id] = task
+        self._reschedule(task)
+
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+
+    def discard(self, task):
+        if self._pending.get(task.captcha_id) is task:
+            del self._pending[task.captcha_id]
+            self._abort(task.captcha_id)
+            self._wake()
+
+    def push(self, captcha_id, reply):
+        if captcha_id not in self._pending:
+            return
+        self._abort(captcha_id)
+        metrics = self._client._metrics
+        if metrics is not None:
+            metrics.inc('pingbacks_total')
+        self._reply(captcha_id, reply)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for request in set(self._requests.values()):
+            request.cancel()
+        self._requests = {}
+        self._due = {}
+        tasks = list(self._pending.values())
+        self._pending.clear()
+        for task in tasks:
+            task.cancel()
+
+    def _task_interval(self, task):
+        return self._intervals.get(task.priority, self._interval)
+
+    def _reschedule(self, task):
+        if self._latency is not None and not self._fallback:
+            now = self._loop.time()
+            if not task.polls:
+                task.fitted = self._latency.fitted(task.profile)
+            task.due = task.started + self._latency.next_poll(
+                task.profile, now - task.started, task.polls,
+                self._task_interval(task))
+        elif task.polls:
+            task.due = self._loop.time() + self._task_interval(task)
+        self._schedule(task)
+
+    def _schedule(self, task):
+        # an earlier entry of the task is skipped once its due has changed
+        heap = self._due.get(task.priority)
+        if heap is None:
+            heap = self._due[task.priority] = []
+        heapq.heappush(heap, (task.due, next(self._order), task))
+        if self._wake_at is None or task.due < self._wake_at:
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _abort(self, captcha_id):
+        request = self._requests.pop(captcha_id, None)
+        if request is not None and self._batch_size == 1:
+            # a single captcha request is aborted when it is discarded
+            request.cancel()
+
+    def _horizon(self, priority):
+        # captchas which become due shortly are coalesced into one round,
+        # batches only wait for captchas of the same priority
+        if self._latency is not None and not self._fallback:
+            return self._latency.min_gap
+        if self._batch_size > 1:
+            return self._intervals.get(priority, self._interval)
+        return 0
+
+    async def _run(self):
+        while self._pending:
+            now = self._loop.time()
+            wake_at = min((heap[0][0] for heap in self._due.values()
+                           if heap), default=None)
+            if wake_at is None or wake_at > now:
+                self._wake_at = wake_at
+                self._wakeup = self._loop.create_future()
+                try:
+                    await asyncio.wait(
+                        [self._wakeup],
+                        timeout=None if self._wake_at is None
+                        else self._wake_at - now)
+                finally:
+                    self._wakeup = None
+                    self._wake_at = None
+                continue
+
+            ids = []
+            for priority, heap in self._due.items():
+                if not heap or heap[0][0] > now:
+                    continue
+                horizon = now + self._horizon(priority)
+                while heap and heap[0][0] <= horizon:
+                    due, _, task = heapq.heappop(heap)
+                    captcha_id = task.captcha_id
+                    # stale entries and captchas with a request in flight
+                    # (the reply reschedules them) are skipped
+                    if (task.due == due and
+                            self._pending.get(captcha_id) is task and
+                            captcha_id not in self._requests):
+                        ids.append(captcha_id)
+                        self._requests[captcha_id] = None
+
+            for i in range(0, len(ids), self._batch_size):
+                chunk = ids[i:i + self._batch_size]
+                request = self._loop.create_task(self._poll(chunk))
+                for captcha_id in chunk:
+                    self._requests[captcha_id] = request
+
+    async def _poll(self, captcha_ids):
+        try:
+            await self._request(captcha_ids)
+        finally:
+            request = asyncio.current_task()
+            for captcha_id in captcha_ids:
+                if self._requests.get(captcha_id) is request:
+                    del self._requests[captcha_id]
+
+    async def _request(self, captcha_ids):
+        if self._batch_size == 1:
+            task = self._pending.get(captcha_ids[0])
+            if task is None:
+                # discarded before the request was sent
+                return
+        for captcha_id in captcha_ids:
+            task = self._pending.get(captcha_id)
+            if task is not None:
+                task.polls += 1
+        client = self._client
+        if client._metrics is not None:
+            client._metrics.inc('polls_total', len(captcha_ids))
+
+        try:
+            if self._batch_size == 1:
+                replies = [(await client._call(
+                    'res.php', client._check_captcha, task.captcha_id,
+                    task.deadline))]
+            else:
+                replies = await client._call(
+                    'res.php', client._get_captchas, captcha_ids)
+        except Exception as e:
+            # a failed request is retried once, whatever its batch size
+            retried = [self._poll_failed(captcha_id, e)
+                       for captcha_id in captcha_ids]
+            if any(retried):
+                client._count_retry('res.php')
+            return
+
+        for captcha_id, reply in zip(captcha_ids, replies):
+            self._reply(captcha_id, reply)
+
+    def _poll_failed(self, captcha_id, exc):
+        task = self._pending.get(captcha_id)
+        if task is None:
+            return False
+        delay = self._client._retry_delay('res.php', exc, task.retries,
+                                          task.deadline, count=False)
+        if delay is None:
+            self._set_exception(captcha_id, exc)
+            return False
+        # the captcha is paid already, poll it again later
+        task.retries += 1
+        task.due = self._loop.time() + delay
+        self._schedule(task)
+        return True
+
+    def _reply(self, captcha_id, reply):
+        task = self._pending.get(captcha_id)
+        if task is not None:
+            task.retries = 0
+        if reply == 'CAPCHA_NOT_READY':
+            if task is not None:
+                task.not_ready = self._loop.time() - task.started
+                self._reschedule(task)
+            return
+        try:
+            self._client._handle_error(reply)
+            if reply.upper().startswith('ERROR_'):
+                raise ServiceError('Service error: %s' % reply)
+        except ServiceError as e:
+            self._set_exception(captcha_id, e)
+        else:
+            self._set_result(captcha_id, reply)
+
+    def _set_result(self, captcha_id, result):
+        task = self._pending.pop(captcha_id, None)
+        if not self._pending:
+            self._wake()
+        if task is not None and not task.done():
+            if self._latency is not None:
+                # solved after the last poll which found it not ready
+                self._latency.observe(
+                    task.profile, self._loop.time() - task.started,
+                    task.polls, self._task_interval(task),
+                    not_ready=task.not_ready or 0.0, fitted=task.fitted)
+            metrics = self._client._metrics
+            if metrics is not None:
+                metrics.observe('polls_per_captcha', task.polls)
+            task._set_result(result)
+
+    def _set_exception(self, captcha_id, exc):
+        task = self._pending.pop(captcha_id, None)
+        if not self._pending:
+            self._wake()
+        if task is not None:
+            task._set_exception(exc)
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from .errors import (IPNotAllowedError, ServiceError, UserKeyError,
+                     ZeroBalanceError)
+
+__all__ = ('AntiCaptchaPool',)
+
+# errors which take a backend out of rotation
+FATAL_ERRORS = (UserKeyError, ZeroBalanceError, IPNotAllowedError)
+
+
+class _Backend:
+    __slots__ = ('client', 'in_flight', 'latency', 'rejection', 'error',
+                 'resolved', '_submissions', '_rejections')
+
+    def __init__(self, client):
+        self.client = client
+        self.in_flight = 0
+        self.latency = None
+        self.rejection = 0.0
+        self.error = None
+        self.resolved = 0
+        self._submissions = 0
+        self._rejections = 0
+
+    @property
+    def enabled(self):
+        return self.error is None
+
+    def update(self, latency, alpha):
+        self.resolved += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += alpha * (latency - self.latency)
+
+        submissions = self.client._submissions - self._submissions
+        rejections = self.client._slot_rejections - self._rejections
+        self._submissions += submissions
+        self._rejections += rejections
+        if submissions or rejections:
+            ratio = rejections / (submissions + rejections)
+            self.rejection += alpha * (ratio - self.rejection)
+
+
+class AntiCaptchaPool:
+    """Routes captchas over several ``AntiCaptcha``/``AntiGate`` clients.
+
+    Every ``resolve`` goes to the backend with the fewest captchas in
+    flight (``strategy='least_loaded'``) or the lowest recent latency
+    (``strategy='fastest'``), both penalized by the recent share of
+    ``ERROR_NO_SLOT_AVAILABLE`` replies. Backends failing with
+    ``UserKeyError``, ``ZeroBalanceError`` or ``IPNotAllowedError`` are
+    taken out of rotation and the captcha is sent to the next one.
+    """
+
+    def __init__(self, clients, *, strategy='least_loaded', alpha=0.2,
+                 max_owners=100000):
+        if not clients:
+            raise ValueError('clients must not be empty')
+        if strategy not in ('least_loaded', 'fastest'):
+            raise ValueError("strategy must be 'least_loaded' or 'fastest'")
+
+        self._backends = [_Backend(client) for client in clients]
+        self._strategy = strategy
+        self._alpha = alpha
+        self._owners = OrderedDict()
+        self._max_owners = max_owners
+
+    async def resolve(self, captcha, **ext_opts):
+        tried = set()
+        while True:
+            backend = self._choose(tried)
+            tried.add(backend)
+
+            backend.in_flight += 1
+            started = time.monotonic()
+            try:
+                captcha_id, answer = await backend.client.resolve(
+                    captcha, **ext_opts)
+            except FATAL_ERRORS as e:
+                backend.error = e
+                continue
+            finally:
+                backend.in_flight -= 1
+
+            backend.update(time.monotonic() - started, self._alpha)
+            self._owners[captcha_id] = backend
+            if len(self._owners) > self._max_owners:
+                self._owners.popitem(last=False)
+            return captcha_id, answer
+
+    async def abuse(self, captcha_id):
+        backend = self._owners.get(captcha_id)
+        if backend is None:
+            raise ServiceError('Captcha with such ID was not '
+                               'resolved by this pool')
+        await backend.client.abuse(captcha_id)
+
+    async def get_balance(self):
+        balances = await asyncio.gather(
+            *[b.client.get_balance() for b in self._backends if b.enabled])
+        return sum(balances)
+
+    def enable(self, client):
+        for backend in self._backends:
+            if backend.client is client:
+                backend.error = None
+
+    def stats(self):
+        return [{
+            'client': backend.client,
+            'enabled': backend.enabled,
+            'error': backend.error,
+            'in_flight': backend.in_flight,
+            'resolved': backend.resolved,
+            'latency': backend.latency,
+            'rejection': backend.rejection,
+        } for backend in self._backends]
+
+    async def close(self):
+        await asyncio.gather(*[backend.client.close()
+                               for backend in self._backends])
+
+    def _choose(self, tried):
+        candidates = [b for b in self._backends
+                      if b.enabled and b not in tried]
+        if not candidates:
+            errors = [b.error for b in self._backends if b.error is not None]
+            if errors:
+                raise errors[-1]
+            raise ServiceError('No available backends')
+
+        if self._strategy == 'fastest':
+            # backends without samples are tried first
+            return min(candidates, key=lambda b: (
+                (b.latency or 0) * (1 + 4 * b.rejection), b.in_flight))
+        return min(candidates, key=lambda b: (
+            (b.in_flight + 1) * (1 + 4 * b.rejection), b.latency or 0))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,138 @@
+import asyncio
+import importlib.util
+import io
+import time
+
+from .errors import error_from_code
+
+# Pillow is slow to import, the first transform loads it
+PILLOW = importlib.util.find_spec('PIL') is not None
+
+__all__ = ('Preprocessor',)
+
+MIN_CAPTCHA_SIZE = 100
+
+SIGNATURES = (
+    b'\xff\xd8\xff',          # JPEG
+    b'\x89PNG\r\n\x1a\n',     # PNG
+    b'GIF87a', b'GIF89a',     # GIF
+    b'BM',                    # BMP
+)
+
+
+def _rejection(data):
+    if len(data) < MIN_CAPTCHA_SIZE:
+        return 'ERROR_ZERO_CAPTCHA_FILESIZE'
+    if not bytes(data[:8]).startswith(SIGNATURES):
+        return 'ERROR_IMAGE_TYPE_NOT_SUPPORTED'
+    return None
+
+
+def _transform(data, crop, grayscale, max_size, fmt):
+    from PIL import Image
+
+    started = time.perf_counter()
+    image = Image.open(io.BytesIO(data))
+    # crop and convert return images without a format
+    fmt = fmt or image.format
+    if crop is not None:
+        image = image.crop(crop)
+    if grayscale:
+        image = image.convert('L')
+    if max_size is not None:
+        image.thumbnail(max_size)
+
+    buff = io.BytesIO()
+    image.save(buff, format=fmt, optimize=True)
+    result = buff.getvalue()
+    if _rejection(result) is not None:
+        # the service would reject the tiny or unsupported result
+        result = data
+    elif crop is None and len(result) >= len(data):
+        # re-encoding did not pay off
+        result = data
+    return result, time.perf_counter() - started
+
+
+class Preprocessor:
+    """Checks captchas locally and shrinks them off the event loop.
+
+    Captchas which the service would reject with
+    ``ERROR_ZERO_CAPTCHA_FILESIZE`` or ``ERROR_IMAGE_TYPE_NOT_SUPPORTED``
+    fail before any network round-trip. Cropping, grayscale conversion,
+    downscaling and re-encoding require Pillow and run in ``executor``
+    (a thread or process pool, the loop default executor if omitted).
+    """
+
+    def __init__(self, *, crop=None, grayscale=False, max_size=None,
+                 format=None, executor=None, loop=None):
+        self._transforms = (crop is not None or grayscale or
+                            max_size is not None or format is not None)
+        if self._transforms and not PILLOW:
+            raise RuntimeError('Pillow is required for image transforms')
+
+        self._options = (crop, grayscale, max_size, format)
+        self._executor = executor
+        self._event_loop = loop
+
+        self.processed = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.check_time = 0.0
+        self.transform_time = 0.0
+        self.wait_time = 0.0
+
+    @property
+    def _loop(self):
+        if self._event_loop is None:
+            self._event_loop = asyncio.get_running_loop()
+        return self._event_loop
+
+    async def process(self, captcha):
+        if isinstance(captcha, io.IOBase):
+            captcha = await self._loop.run_in_executor(
+                self._executor, captcha.read)
+        elif not isinstance(captcha, (bytes, bytearray, memoryview)):
+            # streams can't be inspected without consuming them
+            return captcha
+
+        started = time.perf_counter()
+        try:
+            self.check(captcha)
+        finally:
+            self.check_time += time.perf_counter() - started
+
+        result = captcha
+        if self._transforms:
+            started = time.perf_counter()
+            result, elapsed = await self._loop.run_in_executor(
+                self._executor, _transform, bytes(captcha), *self._options)
+            self.transform_time += elapsed
+            self.wait_time += time.perf_counter() - started - elapsed
+
+        self.processed += 1
+        self.bytes_in += len(captcha)
+        self.bytes_out += len(result)
+        return result
+
+    def check(self, captcha):
+        code = _rejection(captcha)
+        if code is not None:
+            self.rejected += 1
+            raise error_from_code(code)
+
+    def _after_fork(self):
+        self._event_loop = None
+
+    def stats(self):
+        return {
+            'processed': self.processed,
+            'rejected': self.rejected,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'bytes_saved': self.bytes_in - self.bytes_out,
+            'check_time': self.check_time,
+            'transform_time': self.transform_time,
+            'wait_time': self.wait_time,
+        }
@@ -0,0 +1,47 @@
+import random
+
+from .errors import TransientError
+
+__all__ = ('RetryPolicy',)
+
+
+class RetryPolicy:
+    """Retries of transient ``in.php``/``res.php`` failures.
+
+    Network errors, HTTP 5xx/429 replies and calls refused by an open
+    circuit are retried ``retries`` times, the ``n``-th retry waits
+    ``backoff * 2 ** n`` seconds (at most ``max_backoff``) spread by
+    ``jitter``. A failed poll is retried with the same captcha id.
+    """
+
+    def __init__(self, *, retries=3, backoff=0.5, max_backoff=10,
+                 jitter=0.5):
+        if retries < 0:
+            raise ValueError('retries must not be negative')
+        if not 0 < backoff <= max_backoff:
+            raise ValueError('backoff must be greater than zero '
+                             'and not greater than max_backoff')
+        if not 0 <= jitter < 1:
+            raise ValueError('jitter must be in range [0, 1)')
+
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+
+        self.retried = 0
+
+    def delay(self, attempt):
+        if attempt >= self._retries:
+            return None
+        delay = min(self._max_backoff, self._backoff * 2 ** attempt)
+        return delay * (1 + random.uniform(-self._jitter, self._jitter))
+
+
+def is_transient(exc):
+    import aiohttp
+
+    if isinstance(exc, aiohttp.ClientSSLError):
+        # a certificate problem won't go away by itself
+        return False
+    return isinstance(exc, (TransientError, aiohttp.ClientConnectionError))
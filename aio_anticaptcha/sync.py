@@ -0,0 +1,124 @@
+import asyncio
+import concurrent.futures
+import threading
+from functools import partial
+
+__all__ = ('SyncAntiCaptcha',)
+
+
+class SyncAntiCaptcha:
+    """Blocking client which can be shared by any number of threads.
+
+    A single event loop runs in a background thread together with one
+    client made by ``factory(loop)`` (``AntiCaptcha(api_key, loop=loop,
+    **kwargs)`` if omitted), so captchas submitted from every thread share
+    its connection pool, poller and slot governor.
+    """
+
+    def __init__(self, api_key=None, *, factory=None, **kwargs):
+        if factory is None:
+            if api_key is None:
+                raise ValueError('api_key or factory must be given')
+            from . import AntiCaptcha
+            factory = partial(_create_client, AntiCaptcha, api_key, kwargs)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run,
+                                        name='aio-anticaptcha', daemon=True)
+        self._thread.start()
+        try:
+            self._client = self._call(factory, self._loop)
+        except BaseException:
+            self._stop()
+            raise
+
+    @property
+    def loop(self):
+        return self._loop
+
+    @property
+    def client(self):
+        return self._client
+
+    def submit(self, captcha, **ext_opts):
+        fut = concurrent.futures.Future()
+        self._loop.call_soon_threadsafe(self._start, fut, captcha, ext_opts)
+        return fut
+
+    def resolve(self, captcha, **ext_opts):
+        self._check_thread()
+        return self.submit(captcha, **ext_opts).result()
+
+    def get_balance(self):
+        return self._run_coroutine(self._client.get_balance)
+
+    def abuse(self, captcha_id):
+        return self._run_coroutine(self._client.abuse, captcha_id)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._run_coroutine(self._client.close)
+            self._stop()
+
+    def _start(self, fut, captcha, ext_opts):
+        # like an executor's future it can't be cancelled once running
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            task = self._client.resolve(captcha, **ext_opts)
+        except Exception as e:
+            fut.set_exception(e)
+            return
+        task.add_done_callback(partial(_copy_result, fut))
+
+    def _call(self, fn, *args):
+        self._check_thread()
+        fut = concurrent.futures.Future()
+
+        def call():
+            try:
+                fut.set_result(fn(*args))
+            except Exception as e:
+                fut.set_exception(e)
+
+        self._loop.call_soon_threadsafe(call)
+        return fut.result()
+
+    def _run_coroutine(self, coro_func, *args):
+        # checked before the coroutine exists, so none is left unawaited
+        self._check_thread()
+        return asyncio.run_coroutine_threadsafe(coro_func(*args),
+                                                self._loop).result()
+
+    def _check_thread(self):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('blocking calls would deadlock the event loop '
+                               'thread, use the client directly')
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _create_client(client_class, api_key, kwargs, loop):
+    return client_class(api_key, loop=loop, **kwargs)
+
+
+def _copy_result(fut, task):
+    if task.cancelled():
+        fut.set_exception(concurrent.futures.CancelledError())
+    elif task.exception() is not None:
+        fut.set_exception(task.exception())
+    else:
+        fut.set_result(task.result())
@@ -0,0 +1,77 @@
+import asyncio
+
+__all__ = ('CaptchaTask',)
+
+SUBMITTING = 'submitting'
+POLLING = 'polling'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class CaptchaTask:
+    """Handle of a captcha being solved, returned by ``resolve``.
+
+    Awaiting it returns ``(captcha_id, answer)``. The handle is driven by
+    the client's poller instead of a coroutine of its own, so it only keeps
+    the captcha id, its priority, its state and the poll schedule.
+    """
+
+    __slots__ = ('captcha_id', 'state', 'priority', 'deadline', 'profile',
+                 'started', 'polls', 'retries', 'due', 'not_ready', 'fitted',
+                 '_future', '_submit', '_waiters')
+
+    def __init__(self, profile=(), *, priority=0, deadline=None, loop):
+        self.captcha_id = None
+        self.state = SUBMITTING
+        self.priority = priority
+        self.deadline = deadline
+        self.profile = profile
+        self.started = None
+        self.polls = 0
+        self.retries = 0
+        self.due = None
+        self.not_ready = None
+        self.fitted = False
+        self._future = loop.create_future()
+        self._submit = None
+        self._waiters = 0
+
+    def done(self):
+        return self._future.done()
+
+    def cancelled(self):
+        return self._future.cancelled()
+
+    def result(self):
+        return self._future.result()
+
+    def exception(self):
+        return self._future.exception()
+
+    def cancel(self):
+        return self._future.cancel()
+
+    def add_done_callback(self, fn):
+        self._future.add_done_callback(lambda fut: fn(self))
+
+    def __await__(self):
+        fut = self._future
+        self._waiters += 1
+        try:
+            return (yield from asyncio.shield(fut).__await__())
+        finally:
+            self._waiters -= 1
+            if not fut.done() and not self._waiters:
+                # the last waiter was cancelled, stop solving the captcha
+                fut.cancel()
+
+    def _set_result(self, answer):
+        if not self._future.done():
+            self.state = DONE
+            self._future.set_result((self.captcha_id, answer))
+
+    def _set_exception(self, exc):
+        if not self._future.done():
+            self.state = FAILED
+            self._future.set_exception(exc)
@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+import itertools
+import json
+import random
+
+import aiohttp
+from aiohttp import web
+
+__all__ = ('FakeAntiCaptchaServer',)
+
+
+class FakeAntiCaptchaServer:
+    """Local stand-in for the ``in.php``/``res.php`` service.
+
+    ``solve_time`` is a number of seconds or a callable returning one,
+    ``slots`` limits the number of captchas being solved at once (further
+    submissions get ``ERROR_NO_SLOT_AVAILABLE``), a share ``error_rate`` of
+    submissions fails with ``error`` and every reply is delayed by ``delay``
+    seconds. Answers are ``'answer<captcha id>'``. With a server ``ssl``
+    context the service is served over HTTPS. Answers of captchas submitted
+    with a ``pingback`` URL are also posted to it, a share
+    ``pingback_loss`` of them is dropped.
+    """
+
+    def __init__(self, *, solve_time=0, slots=None, error_rate=0,
+                 error='ERROR_IMAGE_TYPE_NOT_SUPPORTED', delay=0,
+                 balance=10.0, ssl=None, pingback_loss=0, loop=None):
+        self._solve_time = solve_time
+        self._slots = slots
+        self._error_rate = error_rate
+        self._error = error
+        self._delay = delay
+        self._ssl = ssl
+        self._pingback_loss = pingback_loss
+        self._loop = loop or asyncio.get_running_loop()
+
+        self._ids = itertools.count(1)
+        self._captchas = {}
+        self._solving = []
+        self._runner = None
+        self._session = None
+        self._pingbacks = set()
+
+        self.balance = balance
+        self.port = None
+        self.requests = {'in.php': 0, 'res.php': 0}
+        self.submitted = 0
+        self.reported = []
+        self.pingbacks = 0
+
+        self.app = web.Application()
+        self.app.router.add_route('POST', '/in.php', self._handle_in)
+        self.app.router.add_route('GET', '/res.php', self._handle_res)
+        self.app.router.add_route('GET', '/stats', self._handle_stats)
+
+    @property
+    def domain(self):
+        return '127.0.0.1'
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port, ssl_context=self._ssl)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.port
+
+    async def close(self):
+        for task in self._pingbacks:
+            task.cancel()
+        self._pingbacks.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_in(self, request):
+        self.requests['in.php'] += 1
+        form = await request.post()
+        await self._sleep()
+
+        now = self._loop.time()
+        if self._error_rate and random.random() < self._error_rate:
+            return web.Response(text=self._error)
+        if self._slots is not None:
+            while self._solving and self._solving[0] <= now:
+                heapq.heappop(self._solving)
+            if len(self._solving) >= self._slots:
+                return web.Response(text='ERROR_NO_SLOT_AVAILABLE')
+
+        solve_time = self._solve_time
+        if callable(solve_time):
+            solve_time = solve_time()
+        captcha_id = str(next(self._ids))
+        self._captchas[captcha_id] = now + solve_time
+        if self._slots is not None:
+            heapq.heappush(self._solving, now + solve_time)
+        self.submitted += 1
+
+        pingback = form.get('pingback')
+        if pingback is not None and not (
+                self._pingback_loss and random.random() < self._pingback_loss):
+            task = self._loop.create_task(
+                self._post_answer(pingback, captcha_id, solve_time))
+            self._pingbacks.add(task)
+            task.add_done_callback(self._pingbacks.discard)
+        return web.Response(text='OK|%s' % captcha_id)
+
+    async def _post_answer(self, url, captcha_id, solve_time):
+        await asyncio.sleep(solve_time)
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        data = {'id': captcha_id, 'code': 'answer%s' % captcha_id}
+        try:
+            async with self._session.post(url, data=data) as resp:
+                await resp.read()
+        except aiohttp.ClientError:
+            # the service does not retry lost callbacks
+            return
+        self.pingbacks += 1
+
+    async def _handle_res(self, request):
+        self.requests['res.php'] += 1
+        await self._sleep()
+
+        action = request.query.get('action')
+        if action == 'getbalance':
+            return web.Response(text=str(self.balance))
+        if action == 'reportbad':
+            self.reported.append(request.query.get('id'))
+            return web.Response(text='OK_REPORT_RECORDED')
+        if action != 'get':
+            return web.Response(text='ERROR_NO_REQUEST_ACTION_RECEIVED')
+
+        if 'ids' in request.query:
+            replies = [self._result(captcha_id)
+                       for captcha_id in request.query['ids'].split(',')]
+            return web.Response(text='|'.join(replies))
+
+        reply = self._result(request.query.get('id'))
+        if reply in ('CAPCHA_NOT_READY', 'ERROR_NO_SUCH_CAPCHA_ID'):
+            return web.Response(text=reply)
+        return web.Response(text='OK|%s' % reply)
+
+    async def _handle_stats(self, request):
+        return web.Response(text=json.dumps(self.stats()),
+                            content_type='application/json')
+
+    def stats(self):
+        return {
+            'requests': dict(self.requests),
+            'submitted': self.submitted,
+            'reported': len(self.reported),
+        }
+
+    def _result(self, captcha_id):
+        ready = self._captchas.get(captcha_id)
+        if ready is None:
+            return 'ERROR_NO_SUCH_CAPCHA_ID'
+        if ready > self._loop.time():
+            return 'CAPCHA_NOT_READY'
+        return 'answer%s' % captcha_id
+
+    async def _sleep(self):
+        if self._delay:
+            await asyncio.sleep(self._delay)
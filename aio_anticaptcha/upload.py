@@ -0,0 +1,104 @@
+import io
+from base64 import b64encode
+
+from .errors import ServiceError
+
+
+class CaptchaForm:
+    """Multipart body of an ``in.php`` submission.
+
+    ``bytes``, ``bytearray`` and ``memoryview`` captchas are base64 encoded
+    straight from the caller's buffer into a single ``bytes`` object, the
+    resulting body is built once and reused by every retry. File-like and
+    asynchronous iterable captchas are streamed in chunks.
+    """
+
+    def __init__(self, api_key, captcha, ext_opts):
+        self._body = None
+        self._stream = None
+        self._position = None
+        self._writer = None
+
+        if isinstance(captcha, (bytes, bytearray, memoryview)):
+            method = 'base64'
+            self._body = b64encode(captcha)
+        elif isinstance(captcha, io.IOBase):
+            method = 'post'
+            self._stream = captcha
+            if captcha.seekable():
+                self._position = captcha.tell()
+        elif hasattr(captcha, '__aiter__'):
+            method = 'post'
+            self._stream = _Replay(captcha)
+        else:
+            raise ServiceError('Unsupported captcha type')
+
+        self.fields = [('key', api_key), ('method', method)]
+        self.fields.extend(ext_opts.items())
+
+    def payload(self):
+        if self._stream is None:
+            if self._writer is None:
+                self._writer = self._build()
+            return self._writer
+
+        # a stream is consumed by every attempt, rewind it
+        if self._position is not None:
+            self._stream.seek(self._position)
+        return self._build()
+
+    def _build(self):
+        import aiohttp
+
+        writer = aiohttp.MultipartWriter('form-data')
+        for name, value in self.fields:
+            part = writer.append(str(value))
+            part.set_content_disposition('form-data', name=name)
+
+        if self._body is not None:
+            part = writer.append(self._body)
+            part.set_content_disposition('form-data', name='body')
+        else:
+            part = writer.append(self._stream)
+            part.set_content_disposition('form-data', name='file',
+                                         filename='cap')
+        return writer
+
+
+class _Replay:
+    """Streams an asynchronous iterable once, then replays its chunks."""
+
+    def __init__(self, source):
+        self._source = source.__aiter__()
+        self._chunks = []
+        self._exhausted = False
+
+    def __aiter__(self):
+        return _ReplayIterator(self)
+
+    async def _chunk(self, index):
+        if index < len(self._chunks):
+            return self._chunks[index]
+        if self._exhausted:
+            raise StopAsyncIteration
+        try:
+            chunk = await self._source.__anext__()
+        except StopAsyncIteration:
+            self._exhausted = True
+            raise
+        self._chunks.append(chunk)
+        return chunk
+
+
+class _ReplayIterator:
+    def __init__(self, replay):
+        self._replay = replay
+        self._index = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self._replay._chunk(self._index)
+        self._index += 1
+        return chunk
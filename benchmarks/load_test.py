@@ -0,0 +1,190 @@
+"""Load test of AntiCaptcha.resolve() against a local fake service.
+
+The fake service runs in a child process. Results are appended to
+``benchmarks/results/load_test.jsonl`` and compared with the previous run
+made with the same parameters.
+
+    python benchmarks/load_test.py --captchas 5000 --concurrency 1000 \\
+        --solve-mean 2 --solve-stdev 0.5 --check-interval 0.5 --batch 100
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import time
+
+import aiohttp
+
+from aio_anticaptcha import (AntiCaptcha, LatencyModel, Metrics,
+                             SlotGovernor)
+from aio_anticaptcha.testing import FakeAntiCaptchaServer
+
+API_KEY = 'd41d8cd98f00b204e9800998ecf8427e'
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 2000
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'results', 'load_test.jsonl')
+PARAMS = ('captchas', 'concurrency', 'solve_mean', 'solve_stdev', 'slots',
+          'error_rate', 'delay', 'check_interval', 'batch', 'adaptive',
+          'governor')
+
+
+def serve(args, ports):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def solve_time():
+        return max(0, random.gauss(args.solve_mean, args.solve_stdev))
+
+    server = FakeAntiCaptchaServer(solve_time=solve_time, slots=args.slots,
+                                   error_rate=args.error_rate,
+                                   delay=args.delay, loop=loop)
+    ports.put(loop.run_until_complete(server.start()))
+    loop.run_forever()
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def fetch_stats(port):
+    session = aiohttp.ClientSession()
+    try:
+        resp = await session.get('http://127.0.0.1:%d/stats' % port)
+        stats = await resp.json()
+        await resp.release()
+        return stats
+    finally:
+        await session.close()
+
+
+async def run(args, port):
+    loop = asyncio.get_running_loop()
+    client = AntiCaptcha(
+        API_KEY, domain='127.0.0.1', port=port,
+        check_interval=args.check_interval, send_interval=0.1,
+        poll_batch_size=args.batch or None,
+        latency_model=LatencyModel() if args.adaptive else None,
+        governor=SlotGovernor() if args.governor else None,
+        metrics=Metrics())
+
+    started = {}
+
+    def captchas():
+        for index in range(args.captchas):
+            started[index] = loop.time()
+            yield IMAGE
+
+    latencies = []
+    errors = 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu = time.process_time()
+    wall = loop.time()
+
+    results = client.resolve_many(captchas(), concurrency=args.concurrency)
+    while True:
+        try:
+            index, _, answer = await results.__anext__()
+        except StopAsyncIteration:
+            break
+        if isinstance(answer, Exception):
+            errors += 1
+        else:
+            latencies.append(loop.time() - started.pop(index))
+
+    wall = loop.time() - wall
+    cpu = time.process_time() - cpu
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    await client.close()
+
+    stats = await fetch_stats(port)
+    requests = sum(stats['requests'].values())
+    in_flight = min(args.concurrency, args.captchas) / 1000
+    latencies.sort()
+    return {
+        'solved': len(latencies),
+        'errors': errors,
+        'captchas_per_sec': len(latencies) / wall,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'requests_per_solved': requests / max(1, len(latencies)),
+        'in_php_requests': stats['requests']['in.php'],
+        'res_php_requests': stats['requests']['res.php'],
+        'cpu_seconds_per_1k_in_flight': cpu / in_flight,
+        'rss_kb_per_1k_in_flight': rss / in_flight,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous(params):
+    if not os.path.exists(RESULTS):
+        return None
+    last = None
+    with open(RESULTS) as fp:
+        for line in fp:
+            record = json.loads(line)
+            if record['params'] == params:
+                last = record
+    return last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--captchas', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--solve-mean', type=float, default=1.0)
+    parser.add_argument('--solve-stdev', type=float, default=0.3)
+    parser.add_argument('--slots', type=int, default=None)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--delay', type=float, default=0)
+    parser.add_argument('--check-interval', type=float, default=0.5)
+    parser.add_argument('--batch', type=int, default=0,
+                        help='poll_batch_size, 0 polls every captcha alone')
+    parser.add_argument('--adaptive', action='store_true')
+    parser.add_argument('--governor', action='store_true')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args, ports),
+                                     daemon=True)
+    server.start()
+    try:
+        port = ports.get(timeout=10)
+        result = asyncio.run(run(args, port))
+    finally:
+        server.terminate()
+
+    params = {name: getattr(args, name) for name in PARAMS}
+    last = previous(params)
+    for name, value in result.items():
+        line = '%-30s %12.3f' % (name, value)
+        if last is not None and last['result'].get(name):
+            line += '  (%+.1f%% vs %s)' % (
+                (value / last['result'][name] - 1) * 100, last['revision'])
+        print(line)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+        with open(RESULTS, 'a') as fp:
+            fp.write(json.dumps({'revision': git_revision(),
+                                 'time': time.time(), 'params': params,
+                                 'result': result}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""CPU cost of one poll and one submission of AntiCaptcha.
+
+The HTTP session is replaced by an in-memory fake which answers at once, so
+only the client's own overhead (coroutines, reply parsing, bookkeeping) is
+measured. ``request`` is a single call, ``poller`` a poll scheduled by the
+poller for one of ``--captchas`` pending captchas.
+
+    python benchmarks/poll_overhead.py --requests 100000 --captchas 1000
+"""
+import argparse
+import asyncio
+import time
+
+from aio_anticaptcha import AntiCaptcha, CaptchaTask
+
+API_KEY = 'd41d8cd98f00b204e9800998ecf8427e'
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 2000
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, text):
+        self._text = text
+
+    async def text(self):
+        return self._text
+
+    async def release(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self):
+        self._poll = FakeResponse('CAPCHA_NOT_READY')
+        self._submit = FakeResponse('OK|1')
+
+    async def get(self, url, *, params, **kwargs):
+        if 'ids' in params:
+            count = params['ids'].count(',') + 1
+            return FakeResponse('|'.join(['CAPCHA_NOT_READY'] * count))
+        return self._poll
+
+    async def post(self, url, **kwargs):
+        return self._submit
+
+    async def close(self):
+        pass
+
+
+async def measure(call, requests):
+    started = time.process_time()
+    for _ in range(requests):
+        await call()
+    return (time.process_time() - started) / requests
+
+
+async def measure_poller(client, requests, captchas):
+    loop = asyncio.get_running_loop()
+    tasks = []
+    for index in range(captchas):
+        task = CaptchaTask(loop=loop)
+        task.captcha_id = str(index)
+        tasks.append(task)
+
+    started = time.process_time()
+    for task in tasks:
+        client._poller.add(task)
+    while sum(task.polls for task in tasks) < requests:
+        await asyncio.sleep(0.01)
+    elapsed = time.process_time() - started
+    polls = sum(task.polls for task in tasks)
+    client._poller.close()
+    return elapsed / polls
+
+
+async def run(args):
+    client = AntiCaptcha(API_KEY, check_interval=1e-6,
+                         poll_batch_size=args.batch)
+    await client._session.close()
+    client._session = FakeSession()
+    try:
+        poll = await measure(lambda: client._check_captcha('1'),
+                             args.requests)
+        poller = await measure_poller(client, args.requests, args.captchas)
+        submit = await measure(lambda: client._send_captcha(IMAGE),
+                               args.requests)
+    finally:
+        await client.close()
+
+    print('request %8.2f us per poll' % (poll * 1e6))
+    print('poller  %8.2f us per poll' % (poller * 1e6))
+    print('submit  %8.2f us per submission' % (submit * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--captchas', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=1,
+                        help='captchas per poll request')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
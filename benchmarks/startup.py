@@ -0,0 +1,70 @@
+"""Startup cost of a worker which imports and builds AntiCaptcha.
+
+Every run is a fresh interpreter. ``import`` is ``import aio_anticaptcha``,
+``construct`` building a client outside of any event loop and ``session``
+the first request's deferred work: importing aiohttp and creating the
+HTTP session. Workers which never solve a captcha pay only for the first
+two.
+
+    python benchmarks/startup.py --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_KEY = 'd41d8cd98f00b204e9800998ecf8427e'
+
+CHILD = '''
+import asyncio, json, sys, time
+started = time.perf_counter()
+import aio_anticaptcha
+imported = time.perf_counter()
+client = aio_anticaptcha.AntiCaptcha(%(api_key)r)
+constructed = time.perf_counter()
+heavy = sorted({'aiohttp', 'PIL'} & set(sys.modules))
+
+async def first_request():
+    started = time.perf_counter()
+    client._session
+    elapsed = time.perf_counter() - started
+    await client.close()
+    return elapsed
+
+print(json.dumps({
+    'import': imported - started,
+    'construct': constructed - imported,
+    'session': asyncio.run(first_request()),
+    'heavy': heavy,
+}))
+'''
+
+
+def run_child():
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root, env.get('PYTHONPATH')]))
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD % {'api_key': API_KEY}], env=env)
+    return json.loads(output.decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    results = [run_child() for _ in range(args.runs)]
+    for name in ('import', 'construct', 'session'):
+        values = [result[name] * 1000 for result in results]
+        print('%-10s %8.2f ms median %8.2f ms min' % (
+            name, statistics.median(values), min(values)))
+    print('imported by "import aio_anticaptcha": %s' % (
+        ', '.join(results[0]['heavy']) or 'nothing heavy'))
+
+
+if __name__ == '__main__':
+    main()
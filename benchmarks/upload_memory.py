@@ -0,0 +1,68 @@
+"""Peak memory per in-flight captcha of the in.php request body.
+
+Compares the current ``CaptchaForm`` with the previous ``FormData`` body
+(base64 ``bytes`` decoded to ``str`` and url-encoded).
+
+    python benchmarks/upload_memory.py --size 300000 --captchas 50
+"""
+import argparse
+import asyncio
+import os
+import tracemalloc
+from base64 import b64encode
+
+import aiohttp
+
+from aio_anticaptcha.upload import CaptchaForm
+
+API_KEY = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class NullWriter:
+    def __init__(self):
+        self.written = 0
+
+    async def write(self, chunk):
+        self.written += len(chunk)
+
+
+def formdata_body(image):
+    data = aiohttp.FormData((('key', API_KEY),))
+    data.add_fields(('method', 'base64'), ('body', b64encode(image).decode()))
+    return data()
+
+
+def captcha_form_body(image):
+    return CaptchaForm(API_KEY, image, {}).payload()
+
+
+def measure(build, images, loop):
+    tracemalloc.start()
+    # keep every body alive, as in-flight submissions do between retries
+    bodies = [build(image) for image in images]
+    for body in bodies:
+        loop.run_until_complete(body.write(NullWriter()))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=300000)
+    parser.add_argument('--captchas', type=int, default=50)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    images = [os.urandom(args.size) for _ in range(args.captchas)]
+
+    for name, build in (('FormData', formdata_body),
+                        ('CaptchaForm', captcha_form_body)):
+        peak = measure(build, images, loop)
+        print('%-12s %10.0f bytes per captcha (%.2fx image size)' %
+              (name, peak, peak / args.size))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
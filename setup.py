@@ -19,8 +19,8 @@ with codecs.open(os.path.join(os.path.abspath(os.path.dirname(
         raise RuntimeError('Unable to determine version.')
 
 
-if sys.version_info < (3, 4, 0):
-    raise RuntimeError("aio_anticaptcha requires Python 3.4+")
+if sys.version_info < (3, 7, 0):
+    raise RuntimeError("aio_anticaptcha requires Python 3.7+")
 
 
 setup(
@@ -31,9 +31,15 @@ setup(
         keywords='antigate captcha anticaptcha',
         license='Apache 2',
         url='https://github.com/nibrag/aio_anticaptcha',
-        install_requires=['aiohttp'],
+        install_requires=['aiohttp>=3.3'],
+        extras_require={'preprocess': ['Pillow']},
 
         description='Real-time captcha-to-text decodings',
         long_description=open("README.rst").read(),
-        packages=['aio_anticaptcha']
+        packages=['aio_anticaptcha'],
+        entry_points={
+            'console_scripts': [
+                'aio-anticaptcha-broker = aio_anticaptcha.broker:main',
+            ],
+        },
 )
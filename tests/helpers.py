@@ -1,6 +1,10 @@
 import asyncio
 from unittest import mock
 
+from aio_anticaptcha import AntiCaptcha
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+
 
 def fake_coroutine(return_value, iter_v=False):
     def coro(*args, **kwargs):
@@ -13,7 +17,14 @@ def fake_coroutine(return_value, iter_v=False):
             raise value
         return value
 
-    return mock.Mock(side_effect=asyncio.coroutine(coro))
+    async def async_coro(*args, **kwargs):
+        return coro(*args, **kwargs)
+
+    return mock.Mock(side_effect=async_coro)
+
+
+async def gather(*aws, **kwargs):
+    return await asyncio.gather(*aws, **kwargs)
 
 
 def fake_resp(status, text):
@@ -24,8 +35,14 @@ def fake_resp(status, text):
     return resp
 
 
-def fake_client_session(status, text, ret_resp=False, iter_v=False):
+def fake_session():
     session = mock.Mock()
+    session.close = fake_coroutine(None)
+    return session
+
+
+def fake_client_session(status, text, ret_resp=False, iter_v=False):
+    session = fake_session()
 
     if iter_v:
         resp = map(lambda t: fake_resp(status, t), text)
@@ -38,3 +55,30 @@ def fake_client_session(status, text, ret_resp=False, iter_v=False):
     if ret_resp:
         return session, resp
     return session
+
+
+class BufferWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    async def write(self, chunk):
+        self.buffer.extend(chunk)
+
+
+def serialize(payload, loop):
+    writer = BufferWriter()
+    loop.run_until_complete(payload.write(writer))
+    return bytes(writer.buffer)
+
+
+def run_client(loop, server, coro_func, **kwargs):
+    async def go():
+        await server.start()
+        client = AntiCaptcha(api_key, domain=server.domain, port=server.port,
+                             loop=loop, **kwargs)
+        try:
+            return (await coro_func(client))
+        finally:
+            await client.close()
+            await server.close()
+    return loop.run_until_complete(go())
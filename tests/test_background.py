@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+
+import aiohttp
+
+from aio_anticaptcha import BackgroundQueue, ServiceError, TransientError
+
+from .helpers import gather
+
+
+class BackgroundQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            BackgroundQueue(rate=0, loop=self.loop)
+        self.assertIn('rate must be greater than zero', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            BackgroundQueue(batch_size=0, loop=self.loop)
+        self.assertIn('batch_size must be integer', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            BackgroundQueue(retries=-1, loop=self.loop)
+        self.assertIn('retries must not be negative', str(cm.exception))
+
+    def test_batch_rate(self):
+        queue = BackgroundQueue(rate=100, batch_size=5, loop=self.loop)
+        calls = []
+
+        async def call(i):
+            calls.append((i, self.loop.time()))
+            return i
+
+        futs = [queue.put(call, i) for i in range(10)]
+        self.assertEqual(len(queue), 10)
+        started = self.loop.time()
+        results = self.loop.run_until_complete(gather(*futs))
+        self.assertEqual(results, list(range(10)))
+        self.assertEqual([i for i, _ in calls], list(range(10)))
+        # the second batch waits until 5 calls at 100/s are spent
+        self.assertGreaterEqual(calls[5][1] - started, 0.045)
+        self.assertEqual(queue.stats(), {'queued': 0, 'sent': 10,
+                                         'retried': 0, 'failed': 0,
+                                         'dropped': 0})
+
+    def test_retry(self):
+        queue = BackgroundQueue(retries=2, backoff=0.01, loop=self.loop)
+        attempts = []
+
+        async def flaky():
+            attempts.append(None)
+            if len(attempts) < 3:
+                raise TransientError('Network error: reset')
+            return 'OK'
+
+        async def broken():
+            raise ServiceError('No request action received')
+
+        fut = queue.put(flaky)
+        self.assertEqual(self.loop.run_until_complete(fut), 'OK')
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(queue.retried, 2)
+
+        fut = queue.put(broken)
+        with self.assertRaises(ServiceError):
+            self.loop.run_until_complete(fut)
+        self.assertEqual(queue.failed, 1)
+        self.assertEqual(queue.retried, 2)
+
+    def test_retry_network(self):
+        queue = BackgroundQueue(retries=1, backoff=0.01, loop=self.loop)
+        attempts = []
+
+        async def disconnected():
+            attempts.append(None)
+            if len(attempts) < 2:
+                raise aiohttp.ServerDisconnectedError()
+            return 'OK'
+
+        async def untrusted():
+            raise aiohttp.ClientSSLError(None, OSError('bad certificate'))
+
+        fut = queue.put(disconnected)
+        self.assertEqual(self.loop.run_until_complete(fut), 'OK')
+        self.assertEqual(queue.retried, 1)
+
+        fut = queue.put(untrusted)
+        with self.assertRaises(aiohttp.ClientSSLError):
+            self.loop.run_until_complete(fut)
+        self.assertEqual(queue.retried, 1)
+        self.assertEqual(queue.failed, 1)
+
+    def test_max_size(self):
+        queue = BackgroundQueue(max_size=2, loop=self.loop)
+
+        async def call(i):
+            return i
+
+        futs = [queue.put(call, i) for i in range(3)]
+        self.assertTrue(futs[0].cancelled())
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual(self.loop.run_until_complete(gather(*futs[1:])),
+                         [1, 2])
+
+    def test_close(self):
+        queue = BackgroundQueue(rate=100, batch_size=1, flush_timeout=0.05,
+                                loop=self.loop)
+        done = []
+
+        async def call(i):
+            done.append(i)
+
+        futs = [queue.put(call, i) for i in range(20)]
+        self.loop.run_until_complete(queue.close())
+        # flushed until the timeout, the rest is dropped
+        self.assertGreater(len(done), 1)
+        self.assertLess(len(done), 20)
+        self.assertTrue(futs[-1].cancelled())
+        self.assertEqual(len(queue), 0)
+
+    def test_flush(self):
+        queue = BackgroundQueue(retries=1, backoff=0.01, loop=self.loop)
+
+        async def fail():
+            raise TransientError('HTTP error [status: 503]')
+
+        queue.put(fail)
+        self.loop.run_until_complete(queue.flush())
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.failed, 1)
+        self.loop.run_until_complete(queue.close())
@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+from aio_anticaptcha import BalanceTracker
+
+
+class BalanceTrackerTestCase(unittest.TestCase):
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            BalanceTracker(ttl=0)
+        self.assertIn('ttl must be greater', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            BalanceTracker(captcha_cost=-1)
+        self.assertIn('captcha_cost must not be negative', str(cm.exception))
+
+    def test_unknown(self):
+        tracker = BalanceTracker()
+        self.assertIsNone(tracker.balance)
+        self.assertIsNone(tracker.projected)
+        self.assertTrue(tracker.stale)
+        self.assertTrue(tracker.reserve())
+
+    @mock.patch('aio_anticaptcha.balance.time.monotonic')
+    def test_stale(self, monotonic):
+        monotonic.return_value = 100
+        tracker = BalanceTracker(ttl=10)
+        tracker.update(1)
+        self.assertFalse(tracker.stale)
+        monotonic.return_value = 110
+        self.assertTrue(tracker.stale)
+        tracker.update(1)
+        tracker.invalidate()
+        self.assertTrue(tracker.stale)
+
+    def test_projected(self):
+        tracker = BalanceTracker(captcha_cost=1)
+        tracker.update(2.5)
+        self.assertTrue(tracker.reserve())
+        self.assertTrue(tracker.reserve())
+        self.assertEqual(tracker.projected, 0.5)
+        # in flight captchas use up the balance
+        self.assertFalse(tracker.reserve())
+
+        tracker.charge()
+        tracker.release()
+        self.assertEqual(tracker.projected, 1.5)
+        tracker.release()
+        self.assertEqual(tracker.projected, 1.5)
+
+        # a refresh replaces the locally charged amount
+        tracker.update(3)
+        self.assertEqual(tracker.projected, 3)
@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+
+from aio_anticaptcha import AntiCaptcha, CaptchaTask, ServiceError
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class FakeClient:
+    def __init__(self, loop):
+        self._loop = loop
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.ext_opts = None
+
+    def resolve(self, captcha, **ext_opts):
+        self.ext_opts = ext_opts
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        task = CaptchaTask(loop=self._loop)
+        task.add_done_callback(self._done)
+        task._submit = self._loop.create_task(self._solve(task, captcha))
+        return task
+
+    async def _solve(self, task, captcha):
+        # in.php accepted the captcha, res.php replies later
+        task.captcha_id = str(captcha)
+        await asyncio.sleep(0.001 * (captcha % 3))
+        if captcha == 4:
+            task._set_exception(ServiceError('failed'))
+        else:
+            task._set_result('answer%d' % captcha)
+
+    def _done(self, task):
+        self.in_flight -= 1
+        task._submit.cancel()
+
+
+class AsyncRange:
+    def __init__(self, n):
+        self._it = iter(range(n))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class ResolveIteratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def collect(self, it):
+        async def go():
+            results = []
+            while True:
+                try:
+                    results.append((await it.__anext__()))
+                except StopAsyncIteration:
+                    return results
+        return self.loop.run_until_complete(go())
+
+    def check(self, captchas):
+        client = FakeClient(self.loop)
+        it = AntiCaptcha.resolve_many(client, captchas, concurrency=3,
+                                      numeric=1)
+        self.assertIs(it.__aiter__(), it)
+
+        results = self.collect(it)
+        self.assertEqual(len(results), 10)
+        self.assertLessEqual(client.max_in_flight, 3)
+        self.assertEqual(client.ext_opts, {'numeric': 1})
+
+        results = sorted(results, key=lambda r: r[0])
+        self.assertEqual(results[0], (0, '0', 'answer0'))
+        self.assertEqual(results[9], (9, '9', 'answer9'))
+        index, captcha_id, err = results[4]
+        # the failed captcha was accepted, its id is reported
+        self.assertEqual((index, captcha_id), (4, '4'))
+        self.assertIsInstance(err, ServiceError)
+
+    def test_iterable(self):
+        self.check(iter(range(10)))
+
+    def test_async_iterable(self):
+        self.check(AsyncRange(10))
+
+    def test_completion_order(self):
+        client = FakeClient(self.loop)
+        it = AntiCaptcha.resolve_many(client, [2, 0], concurrency=2)
+        results = self.collect(it)
+        self.assertEqual([r[0] for r in results], [1, 0])
+
+    def test_empty(self):
+        client = FakeClient(self.loop)
+        it = AntiCaptcha.resolve_many(client, [])
+        self.assertEqual(self.collect(it), [])
+
+    def test_close(self):
+        client = FakeClient(self.loop)
+        it = AntiCaptcha.resolve_many(client, range(10), concurrency=2)
+        self.loop.run_until_complete(it.__anext__())
+        it.close()
+        self.assertEqual(self.collect(it), [])
+
+    def test_aclose(self):
+        client = FakeClient(self.loop)
+        it = AntiCaptcha.resolve_many(client, range(10), concurrency=2)
+
+        async def go():
+            async for result in it:
+                await it.aclose()
+                return result
+
+        self.assertEqual(self.loop.run_until_complete(go()),
+                         (0, '0', 'answer0'))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(client.in_flight, 0)
+        self.assertEqual(self.collect(it), [])
+
+    def test_concurrency(self):
+        ac = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ac.close())
+        with self.assertRaises(ValueError) as cm:
+            ac.resolve_many([], concurrency=0)
+        self.assertIn('concurrency must be integer', str(cm.exception))
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+from aio_anticaptcha import CircuitBreaker, CircuitOpenError
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            CircuitBreaker(threshold=0)
+        self.assertIn('threshold must be greater', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            CircuitBreaker(reset_timeout=0)
+        self.assertIn('reset_timeout must be greater', str(cm.exception))
+
+    @mock.patch('aio_anticaptcha.breaker.time.monotonic')
+    def test_trip(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(threshold=3, reset_timeout=10)
+        breaker.on_failure('in.php')
+        breaker.on_failure('in.php')
+        breaker.on_success('in.php')
+        breaker.on_failure('in.php')
+        self.assertEqual(breaker.state('in.php'), 'closed')
+        self.assertFalse(breaker.on_failure('in.php'))
+        self.assertTrue(breaker.on_failure('in.php'))
+        self.assertEqual(breaker.state('in.php'), 'open')
+        self.assertEqual(breaker.trips, 1)
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.check('in.php')
+        self.assertEqual(breaker.rejected, 1)
+        # circuits are kept per endpoint
+        breaker.check('res.php')
+        self.assertEqual(breaker.state('res.php'), 'closed')
+
+    @mock.patch('aio_anticaptcha.breaker.time.monotonic')
+    def test_half_open(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.on_failure('res.php')
+
+        monotonic.return_value = 110
+        breaker.check('res.php')
+        self.assertEqual(breaker.state('res.php'), 'half-open')
+        # a single probe at a time
+        with self.assertRaises(CircuitOpenError):
+            breaker.check('res.php')
+        self.assertTrue(breaker.on_failure('res.php'))
+        self.assertEqual(breaker.state('res.php'), 'open')
+        self.assertEqual(breaker.trips, 2)
+
+        monotonic.return_value = 120
+        breaker.check('res.php')
+        breaker.on_success('res.php')
+        self.assertEqual(breaker.state('res.php'), 'closed')
+        breaker.check('res.php')
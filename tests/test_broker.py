@@ -0,0 +1,118 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aio_anticaptcha import (AntiCaptcha, Broker, BrokerClient, ServiceError,
+                             UserKeyError)
+from aio_anticaptcha.broker import main
+from .helpers import (fake_client_session, fake_coroutine, fake_resp,
+                      fake_session, gather)
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class BrokerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'broker.sock')
+
+        self.ac = AntiCaptcha(api_key, check_interval=0.01, loop=self.loop)
+        self.loop.run_until_complete(self.ac.close())
+        self.broker = Broker(self.ac, self.path, loop=self.loop)
+        self.loop.run_until_complete(self.broker.start())
+        self.client = BrokerClient(self.path, loop=self.loop)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.client.close())
+        self.loop.run_until_complete(self.broker.close())
+        self.loop.run_until_complete(self.ac.close())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def test_resolve(self):
+        self.ac._session = fake_session()
+        self.ac._session.post = fake_coroutine(
+            iter([fake_resp(200, 'OK|%d' % i) for i in range(10)]),
+            iter_v=True)
+        self.ac._session.get = fake_coroutine(fake_resp(200, 'OK|abc'))
+
+        results = self.loop.run_until_complete(gather(
+            *[self.client.resolve(b'img', phrase=1) for _ in range(10)]))
+        self.assertEqual(sorted(results),
+                         sorted(('%d' % i, 'abc') for i in range(10)))
+        self.assertEqual(self.ac._session.post.call_count, 10)
+
+    def test_resolve_error(self):
+        self.ac._session = fake_client_session(200, 'ERROR_WRONG_USER_KEY')
+
+        with self.assertRaises(UserKeyError) as cm:
+            self.loop.run_until_complete(self.client.resolve(b'img'))
+        self.assertIn('Account authorization key', str(cm.exception))
+
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(self.client.resolve('img'))
+        self.assertIn('Unsupported captcha type', str(cm.exception))
+
+    def test_resolve_cancel(self):
+        self.ac._session = fake_session()
+        self.ac._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        self.ac._session.get = fake_coroutine(
+            fake_resp(200, 'CAPCHA_NOT_READY'))
+
+        task = asyncio.ensure_future(self.client.resolve(b'img'),
+                                     loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(len(self.ac._poller), 1)
+
+        task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(len(self.ac._poller), 0)
+
+    def test_connection_lost(self):
+        self.ac._session = fake_session()
+        self.ac._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        self.ac._session.get = fake_coroutine(
+            fake_resp(200, 'CAPCHA_NOT_READY'))
+
+        task = asyncio.ensure_future(self.client.resolve(b'img'),
+                                     loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.loop.run_until_complete(self.client.close())
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(task)
+        self.assertIn('connection closed', str(cm.exception))
+
+        # captchas of a closed connection are cancelled by the broker
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(len(self.ac._poller), 0)
+
+    def test_abuse_and_balance(self):
+        self.ac._session = fake_client_session(200, '2.5')
+        balance = self.loop.run_until_complete(self.client.get_balance())
+        self.assertEqual(balance, 2.5)
+
+        self.ac._session = fake_client_session(200, 'OK_REPORT_RECORDED')
+        self.loop.run_until_complete(self.client.abuse('1'))
+        params = self.ac._session.get.call_args[1]['params']
+        self.assertEqual(params['action'], 'reportbad')
+        self.assertEqual(params['id'], '1')
+
+    def test_not_available(self):
+        client = BrokerClient(os.path.join(self.dir, 'missing.sock'),
+                              loop=self.loop)
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(client.get_balance())
+        self.assertIn('Broker is not available', str(cm.exception))
+        self.loop.run_until_complete(client.close())
+
+    def test_main_requires_key(self):
+        with mock.patch.dict(os.environ, clear=True):
+            with self.assertRaises(SystemExit):
+                with mock.patch('sys.stderr'):
+                    main(['--socket', self.path])
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aio_anticaptcha import AnswerCache
+
+
+class AnswerCacheTestCase(unittest.TestCase):
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            AnswerCache(maxsize=0)
+        self.assertIn('maxsize must be integer', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            AnswerCache(ttl=0)
+        self.assertIn('ttl must be greater', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            AnswerCache(max_bytes=0)
+        self.assertIn('max_bytes must be integer', str(cm.exception))
+
+    def test_key(self):
+        key = AnswerCache.key(b'image', {})
+        self.assertEqual(key, AnswerCache.key(bytearray(b'image'), {}))
+        self.assertEqual(key, AnswerCache.key(memoryview(b'image'), {}))
+        self.assertNotEqual(key, AnswerCache.key(b'image', {'a': 1}))
+        self.assertEqual(AnswerCache.key(b'image', {'a': 1, 'b': 2}),
+                         AnswerCache.key(b'image', {'b': 2, 'a': 1}))
+        self.assertIsNone(AnswerCache.key(object(), {}))
+
+    def test_get_put(self):
+        cache = AnswerCache()
+        self.assertIsNone(cache.get(b'k'))
+        cache.put(b'k', '1', 'abc')
+        self.assertEqual(cache.get(b'k'), ('1', 'abc'))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(cache), 1)
+
+    @mock.patch('aio_anticaptcha.cache.time.monotonic')
+    def test_ttl(self, monotonic):
+        monotonic.return_value = 100
+        cache = AnswerCache(ttl=10)
+        cache.put(b'k', '1', 'abc')
+        monotonic.return_value = 109
+        self.assertEqual(cache.get(b'k'), ('1', 'abc'))
+        monotonic.return_value = 110
+        self.assertIsNone(cache.get(b'k'))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_lru(self):
+        cache = AnswerCache(maxsize=2)
+        cache.put(b'a', '1', 'a')
+        cache.put(b'b', '2', 'b')
+        cache.get(b'a')
+        cache.put(b'c', '3', 'c')
+        self.assertIsNone(cache.get(b'b'))
+        self.assertEqual(cache.get(b'a'), ('1', 'a'))
+        self.assertEqual(cache.get(b'c'), ('3', 'c'))
+
+    def test_max_bytes(self):
+        cache = AnswerCache(max_bytes=500)
+        cache.put(b'a', '1', 'x' * 100)
+        cache.put(b'b', '2', 'x' * 100)
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.size, 500)
+        self.assertIsNone(cache.get(b'a'))
+
+        cache.put(b'c', '3', 'x' * 1000)
+        self.assertIsNone(cache.get(b'c'))
+        self.assertEqual(cache.get(b'b'), ('2', 'x' * 100))
+
+    def test_evict(self):
+        cache = AnswerCache()
+        cache.put(b'k', '1', 'abc')
+        cache.evict('1')
+        cache.evict('unknown')
+        self.assertIsNone(cache.get(b'k'))
+        self.assertEqual(cache.size, 0)
+
+    def test_pending(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        cache = AnswerCache()
+        ok, err = asyncio.Future(loop=loop), asyncio.Future(loop=loop)
+        cache.add_pending(b'ok', ok)
+        cache.add_pending(b'err', err)
+        self.assertIs(cache.pending(b'ok'), ok)
+
+        ok.set_result(('1', 'abc'))
+        err.set_exception(ValueError())
+        loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertIsNone(cache.pending(b'ok'))
+        self.assertIsNone(cache.pending(b'err'))
+        self.assertEqual(cache.get(b'ok'), ('1', 'abc'))
+        self.assertIsNone(cache.get(b'err'))
+        err.exception()
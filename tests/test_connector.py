@@ -0,0 +1,108 @@
+import asyncio
+import os
+import socket
+import ssl
+import unittest
+
+from aio_anticaptcha import (AntiCaptcha, Metrics, ServiceError,
+                             TransientError, create_connector,
+                             create_ssl_context)
+from aio_anticaptcha.testing import FakeAntiCaptchaServer
+
+from .helpers import gather
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+here = os.path.dirname(os.path.abspath(__file__))
+cert = os.path.join(here, 'sample.crt')
+key = os.path.join(here, 'sample.key')
+
+
+class TLSTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        server_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_ssl.load_cert_chain(cert, key)
+        self.server = FakeAntiCaptchaServer(solve_time=0.02, ssl=server_ssl,
+                                            loop=self.loop)
+        self.loop.run_until_complete(self.server.start())
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.server.close())
+        self.loop.close()
+
+    def test_urls(self):
+        ac = AntiCaptcha(api_key, ssl=True, loop=self.loop)
+        self.assertEqual(ac._request_url,
+                         'https://anti-captcha.com:443/in.php')
+        self.assertIsInstance(ac._ssl, ssl.SSLContext)
+        self.assertIs(ac._session.connector._ssl, ac._ssl)
+        self.loop.run_until_complete(ac.close())
+
+        ac = AntiCaptcha(api_key, loop=self.loop)
+        self.assertEqual(ac._response_url,
+                         'http://anti-captcha.com:80/res.php')
+        self.assertIsNone(ac._ssl)
+        self.loop.run_until_complete(ac.close())
+
+    def test_resolve(self):
+        metrics = Metrics()
+        context = create_ssl_context(cafile=cert, metrics=metrics)
+        ac = AntiCaptcha(api_key, domain=self.server.domain,
+                         port=self.server.port, ssl=context,
+                         check_interval=0.02, metrics=metrics, loop=self.loop)
+
+        first = self.loop.run_until_complete(ac.resolve(b'img'))
+        self.assertEqual(first, ('1', 'answer1'))
+        # the burst opens new connections, all of them resume the session
+        results = self.loop.run_until_complete(
+            gather(*[ac.resolve(b'img%d' % i) for i in range(5)]))
+        self.assertEqual(len(results), 5)
+        self.loop.run_until_complete(ac.close())
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['tls_handshakes_total{resumed="false"}'], 1)
+        self.assertEqual(snapshot['tls_handshakes_total{resumed="true"}'],
+                         context.resumed)
+        self.assertGreater(context.resumed, 0)
+        self.assertEqual(context.handshakes, context.resumed + 1)
+        self.assertEqual(snapshot['tls_handshake_seconds']['count'],
+                         context.handshakes)
+        self.assertEqual(snapshot['connect_seconds']['count'],
+                         context.handshakes)
+
+    def test_shared_connector(self):
+        context = create_ssl_context(cafile=cert)
+        conn = create_connector(ssl=context, loop=self.loop)
+        clients = [AntiCaptcha(api_key, domain=self.server.domain,
+                               port=self.server.port, ssl=True,
+                               connector=conn, check_interval=0.02,
+                               loop=self.loop) for _ in range(2)]
+        for ac in clients:
+            self.assertEqual(self.loop.run_until_complete(ac.get_balance()),
+                             10.0)
+            self.loop.run_until_complete(ac.close())
+        self.assertEqual(context.handshakes, 1)
+        self.loop.run_until_complete(conn.close())
+
+    def test_untrusted(self):
+        ac = AntiCaptcha(api_key, domain=self.server.domain,
+                         port=self.server.port, ssl=True, loop=self.loop)
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(ac.get_balance())
+        # a bad certificate is not worth retrying
+        self.assertNotIsInstance(cm.exception, TransientError)
+        self.assertIn('Network error', str(cm.exception))
+        self.loop.run_until_complete(ac.close())
+
+    def test_refused(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        ac = AntiCaptcha(api_key, domain='127.0.0.1', port=port,
+                         loop=self.loop)
+        with self.assertRaises(TransientError) as cm:
+            self.loop.run_until_complete(ac.get_balance())
+        self.assertIn('Network error', str(cm.exception))
+        self.loop.run_until_complete(ac.close())
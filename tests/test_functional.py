@@ -3,14 +3,24 @@ from base64 import b64encode
 import aiohttp
 import asyncio
 import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 from unittest import mock
+import aio_anticaptcha
 from aio_anticaptcha import (
-    AntiCaptcha, ServiceError, ZeroBalanceError,
-    UserKeyError, AntiGate
+    AntiCaptcha, ServiceError, ZeroBalanceError, DeadlineError,
+    UserKeyError, AntiGate, LatencyModel, AnswerCache, SlotGovernor,
+    Preprocessor, Metrics, BalanceTracker, IPNotAllowedError, Journal,
+    BackgroundQueue, TransientError, RetryPolicy, CircuitBreaker,
+    CircuitOpenError, create_connector
 )
 from .helpers import (
-    fake_coroutine, fake_client_session
+    fake_coroutine, fake_client_session, fake_resp, fake_session, gather,
+    serialize
 )
 
 api_key = 'd41d8cd98f00b204e9800998ecf8427e'
@@ -37,6 +47,10 @@ class AntiCaptchaTestCase(unittest.TestCase):
             AntiCaptcha(api_key, check_interval=-1)
         self.assertIn('check_interval must be integer', str(cm.exception))
 
+        with self.assertRaises(ValueError) as cm:
+            AntiCaptcha(api_key, check_intervals={1: 0})
+        self.assertIn('check_intervals must be greater', str(cm.exception))
+
         with self.assertRaises(ValueError) as cm:
             AntiCaptcha(api_key, send_interval=0)
         self.assertIn('send_interval must be integer', str(cm.exception))
@@ -45,30 +59,174 @@ class AntiCaptchaTestCase(unittest.TestCase):
             AntiCaptcha(api_key, send_interval=-1)
         self.assertIn('send_interval must be integer', str(cm.exception))
 
+        with self.assertRaises(ValueError) as cm:
+            AntiCaptcha(api_key, poll_batch_size=0)
+        self.assertIn('poll_batch_size must be integer', str(cm.exception))
+
     def test_create_session(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
         ses = ag._create_session()
         self.assertIsInstance(ses, aiohttp.ClientSession)
         self.assertIs(ses._loop, ag._loop)
-        ses.close()
-        ag.close()
+        self.loop.run_until_complete(ses.close())
+        self.loop.run_until_complete(ag.close())
+
+    def test_create_connector(self):
+        with self.assertRaises(ValueError) as cm:
+            create_connector(limit=-1, loop=self.loop)
+        self.assertIn('limit must be integer', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            create_connector(keepalive_timeout=0, loop=self.loop)
+        self.assertIn('keepalive_timeout must be', str(cm.exception))
+
+        conn = create_connector(limit=10, limit_per_host=5,
+                                keepalive_timeout=60, loop=self.loop)
+        self.assertIsInstance(conn, aiohttp.TCPConnector)
+        self.assertEqual(conn.limit, 10)
+        self.assertEqual(conn.limit_per_host, 5)
+        self.loop.run_until_complete(conn.close())
+
+    def test_shared_connector(self):
+        conn = create_connector(loop=self.loop)
+        ac = AntiCaptcha(api_key, connector=conn, loop=self.loop)
+        ag = AntiGate(api_key, connector=conn, loop=self.loop)
+        self.assertIs(ac._session.connector, conn)
+        self.assertIs(ag._session.connector, conn)
+        self.assertFalse(ac._session.connector_owner)
+        self.loop.run_until_complete(ac.close())
+        self.assertFalse(conn.closed)
+        self.loop.run_until_complete(ag.close())
+        self.loop.run_until_complete(conn.close())
+
+    def test_warmup(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.head = fake_coroutine(iter([
+            fake_resp(200, ''), aiohttp.ClientError(), fake_resp(200, '')
+        ]), iter_v=True)
+
+        opened = self.loop.run_until_complete(ag.warmup(3))
+        self.assertEqual(opened, 2)
+        self.assertEqual(ag._session.head.call_count, 3)
+        ag._session.head.assert_called_with(ag._response_url)
 
     def test_close(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
         self.assertFalse(ag._session.closed)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         self.assertTrue(ag._session.closed)
 
+    def test_lazy_import(self):
+        code = ('import sys, aio_anticaptcha; '
+                'print(sorted({"aiohttp", "PIL"} & set(sys.modules)))')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'[]')
+
+    def test_lazy_session(self):
+        # built before the loop runs, bound by the first request
+        ag = AntiCaptcha(api_key)
+        self.assertIsNone(ag._event_loop)
+        self.assertIsNone(ag._client_session)
+
+        async def go():
+            await ag.close()
+            ag._session = fake_client_session(200, '5.0')
+            self.assertEqual((await ag.get_balance()), 5.0)
+            self.assertIs(ag._loop, self.loop)
+            await ag.close()
+
+        self.loop.run_until_complete(go())
+
+    def test_after_fork(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        session = ag._session
+        poller = ag._poller
+        aio_anticaptcha._after_fork()
+        self.assertIsNone(ag._event_loop)
+        self.assertIsNone(ag._client_session)
+        self.assertIsNot(ag._poller, poller)
+        self.loop.run_until_complete(session.close())
+
+        # the child starts over with its own loop
+        loop = asyncio.new_event_loop()
+        try:
+            async def go():
+                ag._session = fake_session()
+                ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+                ag._session.get = fake_coroutine(fake_resp(200, 'OK|abc'))
+                return (await ag.resolve(b'img'))
+
+            self.assertEqual(loop.run_until_complete(go()), ('1', 'abc'))
+            self.assertIs(ag._loop, loop)
+            loop.run_until_complete(ag.close())
+        finally:
+            loop.close()
+
+    def test_after_fork_components(self):
+        path = os.path.join(tempfile.mkdtemp(), 'journal')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        # components are built before any loop runs, like in a prefork
+        # server's master process
+        governor = SlotGovernor(rate=100)
+        journal = Journal(path, flush_interval=10)
+        queue = BackgroundQueue()
+        ag = AntiCaptcha(api_key, governor=governor, journal=journal,
+                         background_queue=queue)
+
+        async def go(captcha_id):
+            ag._session = fake_session()
+            ag._session.post = fake_coroutine(
+                fake_resp(200, 'OK|%s' % captcha_id))
+            ag._session.get = fake_coroutine(fake_resp(200, 'OK|abc'))
+            result = await ag.resolve(b'img')
+            await queue.put(asyncio.sleep, 0)
+            return result
+
+        self.assertEqual(self.loop.run_until_complete(go('1')), ('1', 'abc'))
+        self.assertIs(governor._loop, self.loop)
+        # the parent's records wait for the flush timer
+        self.assertTrue(journal._buffer)
+        parent_file = journal._file
+        aio_anticaptcha._after_fork()
+        self.assertIsNone(governor._event_loop)
+        self.assertIsNone(queue._event_loop)
+        self.assertEqual(journal._buffer, [])
+        self.assertIsNot(journal._file, parent_file)
+
+        loop = asyncio.new_event_loop()
+        try:
+            # the child runs the same client on a loop of its own
+            self.assertEqual(loop.run_until_complete(go('2')), ('2', 'abc'))
+            self.assertIs(governor._loop, loop)
+            self.assertIs(queue._loop, loop)
+            loop.run_until_complete(ag.close())
+        finally:
+            loop.close()
+        journal.close()
+        parent_file.close()
+
+        with open(path) as f:
+            records = [line for line in f if '"2"' in line]
+        self.assertEqual(len(records), 2)
+
     def test_enter_ctx(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ses = ag._session
-        ag.__enter__()
-        self.assertIs(ses, ag._session)
-        ag.close()
+        with self.assertRaises(TypeError) as cm:
+            with ag:
+                pass
+        self.assertIn('Use "async with" instead', str(cm.exception))
+        self.loop.run_until_complete(ag.close())
 
     def test_exit_ctx(self):
-        with AntiCaptcha(api_key, loop=self.loop) as ag:
-            self.assertIsInstance(ag._session, aiohttp.ClientSession)
+        async def go():
+            async with AntiCaptcha(api_key) as ag:
+                self.assertIsInstance(ag._session, aiohttp.ClientSession)
+                self.assertIs(ag._loop, self.loop)
+            return ag
+
+        ag = self.loop.run_until_complete(go())
         self.assertTrue(ag._session.closed)
 
     def test_handle_error(self):
@@ -87,6 +245,10 @@ class AntiCaptchaTestCase(unittest.TestCase):
         self.assertIn('Account has zero or negative balance',
                       str(cm.exception))
 
+        with self.assertRaises(IPNotAllowedError) as cm:
+            ag._handle_error('ERROR_IP_NOT_ALLOWED')
+        self.assertIn('is not allowed from your IP', str(cm.exception))
+
         with self.assertRaises(ServiceError) as cm:
             ag._handle_error('ERROR_ZERO_CAPTCHA_FILESIZE')
         self.assertIn('The size of the captcha you are',
@@ -109,11 +271,11 @@ class AntiCaptchaTestCase(unittest.TestCase):
         with self.assertRaises(ServiceError) as cm:
             ag._handle_error('ERROR_NO_REQUEST_ACTION_RECEIVED')
         self.assertIn('No request action received', str(cm.exception))
-        ag.close()
+        self.loop.run_until_complete(ag.close())
 
     def test_abuse_http_err(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(400, 'OK')
 
         with self.assertRaises(ServiceError) as cm:
@@ -122,7 +284,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_abuse_handle_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(
             200, 'ERROR_NO_REQUEST_ACTION_RECEIVED')
 
@@ -130,13 +292,55 @@ class AntiCaptchaTestCase(unittest.TestCase):
             self.loop.run_until_complete(ag.abuse(123))
         self.assertIn('No request action received', str(cm.exception))
 
+    def test_abuse_transient_error(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(503, 'OK')
+
+        with self.assertRaises(TransientError):
+            self.loop.run_until_complete(ag.abuse(123))
+
+    def test_abuse_background(self):
+        queue = BackgroundQueue(retries=1, backoff=0.01, loop=self.loop)
+        ag = AntiCaptcha(api_key, background_queue=queue, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(502, 'Bad Gateway'),
+            fake_resp(200, 'OK_REPORT_RECORDED'),
+        ]), iter_v=True)
+
+        self.loop.run_until_complete(ag.abuse('123'))
+        self.assertFalse(ag._session.get.called)
+        self.assertEqual(len(queue), 1)
+
+        # close flushes the queue
+        self.loop.run_until_complete(ag.close())
+        self.assertEqual(ag._session.get.call_count, 2)
+        params = ag._session.get.call_args[1]['params']
+        self.assertEqual(params['action'], 'reportbad')
+        self.assertEqual(queue.stats()['sent'], 1)
+
+    def test_balance_background(self):
+        queue = BackgroundQueue(loop=self.loop)
+        tracker = BalanceTracker(ttl=60)
+        ag = AntiCaptcha(api_key, balance_tracker=tracker,
+                         background_queue=queue, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, '5.0')
+
+        ag._refresh_balance()
+        self.assertIsNone(tracker.balance)
+        self.loop.run_until_complete(queue.flush())
+        self.assertEqual(tracker.balance, 5.0)
+
     def test_abuse_client_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session, resp = fake_client_session(
             200, aiohttp.ClientError(), ret_resp=True)
 
-        with self.assertRaises(ServiceError) as cm:
+        with self.assertRaises(TransientError) as cm:
             self.loop.run_until_complete(ag.abuse(123))
         self.assertIn('Network error', str(cm.exception))
         self.assertTrue(resp.release.called)
@@ -144,7 +348,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_get_balance_http_err(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(400, 'OK')
 
         with self.assertRaises(ServiceError) as cm:
@@ -153,7 +357,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_get_balance_handle_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(
             200, 'ERROR_NO_REQUEST_ACTION_RECEIVED')
 
@@ -163,7 +367,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_get_balance_client_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session, resp = fake_client_session(
             200, aiohttp.ClientError(), ret_resp=True)
 
@@ -175,7 +379,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_get_balance_inv_reply(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'abc')
 
         with self.assertRaises(ServiceError) as cm:
@@ -184,122 +388,209 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_get_balance_ok(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, '0.5')
 
         balance = self.loop.run_until_complete(ag.get_balance())
         self.assertEqual(balance, 0.5)
 
-    def test_get_captcha_http_err(self):
+    def test_check_captcha_http_err(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(400, 'OK')
 
         with self.assertRaises(ServiceError) as cm:
-            self.loop.run_until_complete(ag._get_captcha('id'))
+            self.loop.run_until_complete(ag._check_captcha('id'))
         self.assertIn('HTTP error', str(cm.exception))
 
-    def test_get_captcha_handle_error(self):
+    def test_check_captcha_handle_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(
             200, 'ERROR_NO_REQUEST_ACTION_RECEIVED')
 
         with self.assertRaises(ServiceError) as cm:
-            self.loop.run_until_complete(ag._get_captcha('id'))
+            self.loop.run_until_complete(ag._check_captcha('id'))
         self.assertIn('No request action received', str(cm.exception))
 
-    def test_get_captcha_client_error(self):
+    def test_check_captcha_client_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session, resp = fake_client_session(
             200, aiohttp.ClientError(), ret_resp=True)
 
         with self.assertRaises(ServiceError) as cm:
-            self.loop.run_until_complete(ag._get_captcha('id'))
+            self.loop.run_until_complete(ag._check_captcha('id'))
         self.assertIn('Network error', str(cm.exception))
         self.assertTrue(resp.release.called)
         self.assertTrue(resp.close.called)
 
-    def test_get_captcha_inv_reply(self):
+    def test_check_captcha_inv_reply(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'abc')
 
         with self.assertRaises(ServiceError) as cm:
-            self.loop.run_until_complete(ag._get_captcha('id'))
+            self.loop.run_until_complete(ag._check_captcha('id'))
         self.assertIn('Invalid server reply', str(cm.exception))
 
-    def test_get_captcha_ok(self):
+    def test_check_captcha_ok(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'OK|123')
 
-        cid = self.loop.run_until_complete(ag._get_captcha('id'))
+        cid = self.loop.run_until_complete(ag._check_captcha('id'))
         self.assertEqual(cid, '123')
 
-    @mock.patch('aio_anticaptcha.asyncio.sleep')
-    def test_get_captcha_not_ready(self, sleep_mock):
-        sleep_mock.side_effect = fake_coroutine(1)
-
+    def test_resolve_slow_poll(self):
+        ag = AntiCaptcha(api_key, check_interval=0.01, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(iter([
+            fake_resp(200, 'OK|1'), fake_resp(200, 'OK|2'),
+        ]), iter_v=True)
+
+        async def get(url, params, **kwargs):
+            if params['id'] == '1':
+                await asyncio.sleep(1)
+            return fake_resp(200, 'OK|answer%s' % params['id'])
+
+        ag._session.get = mock.Mock(side_effect=get)
+
+        async def go():
+            slow = ag.resolve(b'img1')
+            await asyncio.sleep(0.01)
+            started = self.loop.time()
+            result = await ag.resolve(b'img2')
+            # a slow reply doesn't hold back polls of other captchas
+            self.assertLess(self.loop.time() - started, 0.5)
+            slow.cancel()
+            await ag.close()
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(self.loop.run_until_complete(go()),
+                         ('2', 'answer2'))
+
+    def test_resolve_priority_interval(self):
+        ag = AntiCaptcha(api_key, check_interval=10,
+                         check_intervals={1: 0.01}, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(200, 'CAPCHA_NOT_READY'),
+            fake_resp(200, 'OK|123'),
+        ]), iter_v=True)
+
+        task = ag.resolve(b'id', priority=1)
+        self.assertEqual(task.priority, 1)
+        result = self.loop.run_until_complete(
+            asyncio.wait_for(gather(task), timeout=1))
+        self.assertEqual(result, [('1', '123')])
+
+    def test_resolve_priority_batched(self):
+        ag = AntiCaptcha(api_key, check_interval=1, check_intervals={5: 0.1},
+                         poll_batch_size=10, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(iter([
+            fake_resp(200, 'OK|1'), fake_resp(200, 'OK|2'),
+        ]), iter_v=True)
+        polls = {'1': 0, '2': 0}
+
+        async def get(url, params, **kwargs):
+            ids = params['ids'].split(',')
+            for captcha_id in ids:
+                polls[captcha_id] += 1
+            return fake_resp(200, '|'.join(['CAPCHA_NOT_READY'] * len(ids)))
+
+        ag._session.get = mock.Mock(side_effect=get)
+
+        async def go():
+            ag.resolve(b'img1', priority=5)
+            ag.resolve(b'img2')
+            await asyncio.sleep(1.5)
+            await ag.close()
+
+        self.loop.run_until_complete(go())
+        # high priority polls don't drag the low priority captcha along
+        self.assertGreaterEqual(polls['1'], 10)
+        self.assertLessEqual(polls['2'], 2)
+
+    def test_check_captcha_not_ready(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
-        ag._session = fake_client_session(
-            200, ['CAPCHA_NOT_READY', 'OK|123'], iter_v=True)
-
-        cid = self.loop.run_until_complete(ag._get_captcha('id'))
-        self.assertEqual(cid, '123')
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'CAPCHA_NOT_READY')
+
+        reply = self.loop.run_until_complete(ag._check_captcha('id'))
+        self.assertEqual(reply, 'CAPCHA_NOT_READY')
+
+    def test_resolve_not_ready(self):
+        ag = AntiCaptcha(api_key, check_interval=0.01, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(200, 'CAPCHA_NOT_READY'),
+            fake_resp(200, 'OK|123'),
+        ]), iter_v=True)
+
+        started = self.loop.time()
+        result = self.loop.run_until_complete(ag.resolve(b'id'))
+        self.assertEqual(result, ('1', '123'))
         self.assertEqual(ag._session.get.call_count, 2)
-        sleep_mock.assert_called_with(ag._check_interval, loop=ag._loop)
+        self.assertGreaterEqual(self.loop.time() - started, 0.01)
+        params = ag._session.get.call_args[1]['params']
+        self.assertEqual(params['id'], '1')
 
-    @mock.patch('aio_anticaptcha.aiohttp.helpers.FormData.add_fields')
-    def test_send_captcha_base64(self, add_fields):
+    def test_send_captcha_base64(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'OK|123')
 
         self.loop.run_until_complete(ag._send_captcha(b'base64'))
-        add_fields.assert_called_with(
-            ('method', 'base64'), ('body', b64encode(b'base64').decode()))
+        body = serialize(ag._session.post.call_args[1]['data'], self.loop)
+        self.assertIn(b'name="method"\r\n', body)
+        self.assertIn(b'\r\n\r\nbase64\r\n', body)
+        self.assertIn(b'name="body"\r\n', body)
+        self.assertIn(b'\r\n\r\n' + b64encode(b'base64') + b'\r\n', body)
 
-    @mock.patch('aio_anticaptcha.aiohttp.helpers.FormData.add_field')
-    def test_send_captcha_io_base(self, add_field):
+    def test_send_captcha_io_base(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'OK|123')
 
-        f = io.StringIO()
+        f = io.BytesIO(b'image')
         self.loop.run_until_complete(ag._send_captcha(f))
-        self.assertEqual(add_field.call_count, 3)
-        add_field.assert_any_call('method', 'post')
-        add_field.assert_any_call('key', api_key)
-        add_field.assert_any_call('file', f, filename='cap',
-                                  content_type='multipart/form-data')
+        body = serialize(ag._session.post.call_args[1]['data'], self.loop)
+        self.assertIn(b'\r\n\r\npost\r\n', body)
+        self.assertIn(api_key.encode(), body)
+        self.assertIn(b'name="file"; filename="cap"', body)
+        self.assertIn(b'\r\n\r\nimage\r\n', body)
 
     def test_send_captcha_wrong_format(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
 
         with self.assertRaises(ServiceError) as cm:
             self.loop.run_until_complete(ag._send_captcha('str'))
         self.assertIn('Unsupported captcha type', str(cm.exception))
 
-    @mock.patch('aio_anticaptcha.aiohttp.helpers.FormData.add_fields')
-    def test_send_captcha_ext_opts(self, add_fields):
+    def test_send_captcha_ext_opts(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'OK|123')
 
         self.loop.run_until_complete(ag._send_captcha(b'base64', b=2))
-        self.assertEqual(add_fields.call_count, 3)
-
-        add_fields.assert_any_call(
-            ('method', 'base64'), ('body', b64encode(b'base64').decode()))
-        add_fields.assert_any_call([('b', 2)])
+        body = serialize(ag._session.post.call_args[1]['data'], self.loop)
+        self.assertIn(b'\r\n\r\n' + b64encode(b'base64') + b'\r\n', body)
+        self.assertIn(b'name="b"\r\n', body)
+        self.assertIn(b'\r\n\r\n2\r\n', body)
 
     def test_send_captcha_http_err(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(400, 'OK|123')
 
         with self.assertRaises(ServiceError) as cm:
@@ -308,7 +599,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_send_captcha_handle_err(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(
             200, 'ERROR_NO_REQUEST_ACTION_RECEIVED')
 
@@ -318,7 +609,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_send_captcha_client_error(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session, resp = fake_client_session(
             200, aiohttp.ClientError(), ret_resp=True)
 
@@ -330,7 +621,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_send_captcha_inv_reply(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'abc')
 
         with self.assertRaises(ServiceError) as cm:
@@ -339,7 +630,7 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_send_captcha_ok(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, 'OK|123')
 
         cid = self.loop.run_until_complete(ag._send_captcha(b'id'))
@@ -347,21 +638,168 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     @mock.patch('aio_anticaptcha.asyncio.sleep')
     def test_send_captcha_not_ready(self, sleep_mock):
-        sleep_mock.side_effect = fake_coroutine(1)
+        sleep_mock.return_value = None
+
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(
+            200, ['ERROR_NO_SLOT_AVAILABLE', 'OK|123'], iter_v=True)
+
+        cid = self.loop.run_until_complete(ag._send_captcha(b'id'))
+        self.assertEqual(cid, '123')
+        self.assertEqual(ag._session.post.call_count, 2)
+        sleep_mock.assert_called_with(ag._send_interval)
+
+    @mock.patch('aio_anticaptcha.asyncio.sleep')
+    def test_send_captcha_retry_reuses_body(self, sleep_mock):
+        sleep_mock.return_value = None
 
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(
+            200, ['ERROR_NO_SLOT_AVAILABLE', 'OK|123'], iter_v=True)
+
+        self.loop.run_until_complete(ag._send_captcha(memoryview(b'img')))
+        first, second = ag._session.post.call_args_list
+        self.assertIs(first[1]['data'], second[1]['data'])
+
+    def test_send_captcha_governor(self):
+        governor = mock.Mock()
+        governor.acquire = fake_coroutine(None)
+
+        ag = AntiCaptcha(api_key, governor=governor, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(
+            200, ['ERROR_NO_SLOT_AVAILABLE', 'OK|123'], iter_v=True)
+
+        cid = self.loop.run_until_complete(ag._send_captcha(b'id'))
+        self.assertEqual(cid, '123')
+        self.assertEqual(governor.acquire.call_count, 2)
+        self.assertEqual(governor.on_no_slot.call_count, 1)
+        self.assertEqual(governor.on_success.call_count, 1)
+
+    def test_send_captcha_priority(self):
+        governor = mock.Mock()
+        governor.acquire = fake_coroutine(None)
+
+        ag = AntiCaptcha(api_key, governor=governor, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(
             200, ['ERROR_NO_SLOT_AVAILABLE', 'OK|123'], iter_v=True)
 
+        self.loop.run_until_complete(ag._send_captcha(b'id', priority=2))
+        first, second = governor.acquire.call_args_list
+        self.assertEqual(first[0], (2,))
+        # the retry keeps its place in the queue
+        self.assertEqual(first, second)
+        body = serialize(ag._session.post.call_args[1]['data'], self.loop)
+        self.assertNotIn(b'name="priority"', body)
+
+    def test_send_captcha_retry(self):
+        policy = RetryPolicy(retries=2, backoff=0.01)
+        metrics = Metrics()
+        ag = AntiCaptcha(api_key, retry_policy=policy, metrics=metrics,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(
+            200, [aiohttp.ServerDisconnectedError(), 'OK|123'], iter_v=True)
+
         cid = self.loop.run_until_complete(ag._send_captcha(b'id'))
         self.assertEqual(cid, '123')
+        self.assertEqual(policy.retried, 1)
+        self.assertEqual(
+            metrics.snapshot()['retries_total{endpoint="in.php"}'], 1)
+
+    def test_resolve_request_timeout(self):
+        policy = RetryPolicy(retries=1, backoff=0.01)
+        ag = AntiCaptcha(api_key, check_interval=0.01, retry_policy=policy,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(
+            200, [asyncio.TimeoutError(), 'OK|1', 'OK|abc'], iter_v=True)
+
+        # aiohttp's own timeout is retried, no deadline was missed
+        result = self.loop.run_until_complete(ag.resolve(b'id'))
+        self.assertEqual(result, ('1', 'abc'))
+        self.assertEqual(policy.retried, 1)
+
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(
+            200, [asyncio.TimeoutError()], iter_v=True)
+        with self.assertRaises(TransientError) as cm:
+            self.loop.run_until_complete(ag.resolve(b'id'))
+        self.assertNotIsInstance(cm.exception, DeadlineError)
+
+    def test_send_captcha_retry_exhausted(self):
+        policy = RetryPolicy(retries=1, backoff=0.01)
+        ag = AntiCaptcha(api_key, retry_policy=policy, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(503, 'OK|123')
+
+        with self.assertRaises(TransientError):
+            self.loop.run_until_complete(ag._send_captcha(b'id'))
+        self.assertEqual(ag._session.post.call_count, 2)
+
+        # errors of the service itself are not retried
+        ag._session = fake_client_session(400, 'OK|123')
+        with self.assertRaises(ServiceError):
+            self.loop.run_until_complete(ag._send_captcha(b'id'))
+        self.assertEqual(ag._session.post.call_count, 1)
+
+    def test_send_captcha_circuit_breaker(self):
+        breaker = CircuitBreaker(threshold=2)
+        metrics = Metrics()
+        ag = AntiCaptcha(api_key, circuit_breaker=breaker, metrics=metrics,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(500, 'OK|123')
+
+        for _ in range(2):
+            with self.assertRaises(TransientError):
+                self.loop.run_until_complete(ag._send_captcha(b'id'))
+        with self.assertRaises(CircuitOpenError):
+            self.loop.run_until_complete(ag._send_captcha(b'id'))
         self.assertEqual(ag._session.post.call_count, 2)
-        sleep_mock.assert_called_with(ag._send_interval, loop=ag._loop)
+        self.assertEqual(breaker.state('in.php'), 'open')
+        self.assertEqual(breaker.state('res.php'), 'closed')
+        self.assertEqual(
+            metrics.snapshot()['circuit_trips_total{endpoint="in.php"}'], 1)
+
+    def test_resolve_poll_retry(self):
+        policy = RetryPolicy(retries=2, backoff=0.01)
+        ag = AntiCaptcha(api_key, check_interval=0.01, retry_policy=policy,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(502, 'Bad Gateway'),
+            fake_resp(200, 'CAPCHA_NOT_READY'),
+            fake_resp(502, 'Bad Gateway'),
+            fake_resp(200, 'OK|123'),
+        ]), iter_v=True)
+
+        result = self.loop.run_until_complete(ag.resolve(b'id'))
+        self.assertEqual(result, ('1', '123'))
+        # the paid captcha is polled again instead of being resubmitted
+        self.assertEqual(ag._session.post.call_count, 1)
+        self.assertEqual(ag._session.get.call_count, 4)
+        self.assertEqual(policy.retried, 2)
+
+    def test_send_captcha_shared_governor(self):
+        governor = SlotGovernor(rate=1000, max_rate=1000, loop=self.loop)
+        ag = AntiCaptcha(api_key, governor=governor, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'OK|123')
+
+        self.loop.run_until_complete(gather(
+            *[ag._send_captcha(b'id') for _ in range(5)]))
+        self.assertEqual(governor.admitted, 5)
 
     def test_resolve(self):
         ag = AntiCaptcha(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
         ag._session = fake_client_session(200, ['OK|123', 'OK|234'],
                                           iter_v=True)
 
@@ -370,6 +808,480 @@ class AntiCaptchaTestCase(unittest.TestCase):
 
     def test_antigate(self):
         ag = AntiGate(api_key, loop=self.loop)
-        ag.close()
+        self.loop.run_until_complete(ag.close())
 
         self.assertIn('antigate.com', ag._request_url)
+
+    def test_get_captchas_ok(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'abc|CAPCHA_NOT_READY')
+
+        replies = self.loop.run_until_complete(ag._get_captchas(['1', '2']))
+        self.assertEqual(replies, ['abc', 'CAPCHA_NOT_READY'])
+        params = ag._session.get.call_args[1]['params']
+        self.assertEqual(params['ids'], '1,2')
+        self.assertEqual(params['action'], 'get')
+
+    def test_get_captchas_inv_reply(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'abc')
+
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(ag._get_captchas(['1', '2']))
+        self.assertIn('Invalid server reply', str(cm.exception))
+
+    def test_get_captchas_handle_error(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'ERROR_WRONG_USER_KEY')
+
+        with self.assertRaises(UserKeyError):
+            self.loop.run_until_complete(ag._get_captchas(['1', '2']))
+
+    def test_resolve_batched(self):
+        ag = AntiCaptcha(api_key, poll_batch_size=2, check_interval=0.01,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(
+            iter([fake_resp(200, 'OK|%d' % i) for i in range(3)]),
+            iter_v=True)
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(200, 'CAPCHA_NOT_READY|a'),
+            fake_resp(200, 'CAPCHA_NOT_READY'),
+            fake_resp(200, 'b|ERROR_NO_SUCH_CAPCHA_ID'),
+        ]), iter_v=True)
+
+        results = self.loop.run_until_complete(gather(
+            *[ag.resolve(b'id') for _ in range(3)], return_exceptions=True))
+
+        self.assertEqual(results[0], ('0', 'b'))
+        self.assertEqual(results[1], ('1', 'a'))
+        self.assertIsInstance(results[2], ServiceError)
+        self.assertIn('Captcha with such ID', str(results[2]))
+        self.assertEqual(ag._session.get.call_count, 3)
+        self.assertEqual(len(ag._poller), 0)
+
+    def test_resolve_batched_poll_retry(self):
+        policy = RetryPolicy(retries=2, backoff=0.01)
+        metrics = Metrics()
+        ag = AntiCaptcha(api_key, poll_batch_size=3, check_interval=0.01,
+                         retry_policy=policy, metrics=metrics, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(
+            iter([fake_resp(200, 'OK|%d' % i) for i in range(3)]),
+            iter_v=True)
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(502, 'Bad Gateway'),
+            fake_resp(200, 'a|b|c'),
+        ]), iter_v=True)
+
+        results = self.loop.run_until_complete(gather(
+            *[ag.resolve(b'id') for _ in range(3)]))
+        self.assertEqual(sorted(answer for _, answer in results),
+                         ['a', 'b', 'c'])
+        # one failed request is one retry, not one per captcha
+        self.assertEqual(policy.retried, 1)
+        self.assertEqual(
+            metrics.snapshot()['retries_total{endpoint="res.php"}'], 1)
+
+    def test_resolve_handle_cancel(self):
+        tracker = BalanceTracker(ttl=60, captcha_cost=0.5)
+        tracker.update(1.0)
+        ag = AntiCaptcha(api_key, balance_tracker=tracker, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(fake_resp(200, 'CAPCHA_NOT_READY'))
+
+        task = ag.resolve(b'id')
+        self.assertEqual(task.state, 'submitting')
+        self.assertAlmostEqual(tracker.projected, 0.5)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(task.state, 'polling')
+        self.assertEqual(task.captcha_id, '1')
+        self.assertEqual(task.polls, 1)
+        self.assertEqual(len(ag._poller), 1)
+
+        task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(task.state, 'cancelled')
+        self.assertEqual(len(ag._poller), 0)
+        self.assertAlmostEqual(tracker.projected, 1)
+        ag._poller.close()
+
+    def test_resolve_journal_resume(self):
+        path = os.path.join(tempfile.mkdtemp(), 'journal')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+
+        journal = Journal(path, loop=self.loop)
+        ag = AntiCaptcha(api_key, journal=journal, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(fake_resp(200, 'CAPCHA_NOT_READY'))
+
+        task = ag.resolve(b'id', journal_key='first', phrase=1)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(task.state, 'polling')
+        # the process stops while the captcha is being solved
+        self.loop.run_until_complete(ag.close())
+        journal.close()
+
+        journal = Journal(path, loop=self.loop)
+        ag = AntiCaptcha(api_key, journal=journal, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'OK|abc')
+
+        tasks = ag.resume()
+        self.assertEqual(len(tasks), 1)
+        key, task = tasks[0]
+        self.assertEqual(key, 'first')
+        self.assertEqual(task.profile, (('phrase', '1'),))
+        self.assertEqual(self.loop.run_until_complete(task), ('1', 'abc'))
+        self.assertFalse(ag._session.post.called)
+        self.assertEqual(ag.resume(), [])
+        journal.close()
+
+        journal = Journal(path, loop=self.loop)
+        self.assertEqual(journal.take_unfinished(), [])
+        journal.close()
+
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        with self.assertRaises(RuntimeError):
+            ag.resume()
+
+    def test_resolve_timeout(self):
+        ag = AntiCaptcha(api_key, check_interval=0.01, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(fake_resp(200, 'CAPCHA_NOT_READY'))
+
+        with self.assertRaises(ValueError) as cm:
+            ag.resolve(b'id', timeout=0)
+        self.assertIn('timeout must be greater than zero', str(cm.exception))
+
+        task = ag.resolve(b'id', timeout=0.05)
+        with self.assertRaises(DeadlineError):
+            self.loop.run_until_complete(task)
+        self.assertIsInstance(task.exception(), asyncio.TimeoutError)
+        self.assertEqual(task.state, 'failed')
+        self.assertEqual(len(ag._poller), 0)
+        timeout = ag._session.get.call_args[1]['timeout']
+        self.assertLessEqual(timeout.total, 0.05)
+        ag._poller.close()
+
+    def test_resolve_timeout_no_slot(self):
+        ag = AntiCaptcha(api_key, send_interval=0.01, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'ERROR_NO_SLOT_AVAILABLE')
+
+        with self.assertRaises(DeadlineError) as cm:
+            self.loop.run_until_complete(ag.resolve(b'id', timeout=0.05))
+        self.assertIn('before the deadline', str(cm.exception))
+        self.assertGreater(ag._session.post.call_count, 1)
+        self.assertIn('timeout', ag._session.post.call_args[1])
+
+    def test_resolve_cancel_aborts_request(self):
+        ag = AntiCaptcha(api_key, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        aborted = []
+
+        async def get(*args, **kwargs):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                aborted.append(kwargs['params']['id'])
+                raise
+
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = get
+
+        task = ag.resolve(b'id')
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(len(ag._poller), 1)
+        task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(aborted, ['1'])
+        self.assertEqual(len(ag._poller), 0)
+        ag._poller.close()
+
+    def test_resolve_batched_network_error(self):
+        ag = AntiCaptcha(api_key, poll_batch_size=10, check_interval=0.01,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(fake_resp(500, ''))
+
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(ag.resolve(b'id'))
+        self.assertIn('HTTP error', str(cm.exception))
+
+    def test_resolve_batched_cancel(self):
+        ag = AntiCaptcha(api_key, poll_batch_size=10, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+
+        task = asyncio.ensure_future(ag.resolve(b'id'), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(len(ag._poller), 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        self.assertEqual(len(ag._poller), 0)
+        ag._poller.close()
+
+    def test_resolve_adaptive(self):
+        model = LatencyModel(min_samples=1, quantiles=(0.5,))
+        model.observe((), 0.05, 1, 10)
+        ag = AntiCaptcha(api_key, latency_model=model, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        ag._session.get = fake_coroutine(fake_resp(200, 'OK|123'))
+
+        started = self.loop.time()
+        result = self.loop.run_until_complete(ag.resolve(b'id'))
+        self.assertEqual(result, ('1', '123'))
+        # the first check waits for the learned solve time only
+        self.assertGreaterEqual(self.loop.time() - started, 0.04)
+        self.assertLess(self.loop.time() - started, 1)
+        self.assertEqual(ag._session.get.call_count, 1)
+        self.assertEqual(model.stats()['solved'], 2)
+
+    def test_resolve_batched_adaptive(self):
+        model = LatencyModel(min_samples=1, quantiles=(0.5,))
+        model.observe((), 0.05, 1, 10)
+        ag = AntiCaptcha(api_key, poll_batch_size=10, latency_model=model,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(
+            iter([fake_resp(200, 'OK|%d' % i) for i in range(2)]),
+            iter_v=True)
+        ag._session.get = fake_coroutine(fake_resp(200, 'a|b'))
+
+        started = self.loop.time()
+        results = self.loop.run_until_complete(gather(
+            ag.resolve(b'id'), ag.resolve(b'id')))
+        self.assertEqual(sorted(results), [('0', 'a'), ('1', 'b')])
+        # both captchas were coalesced into one request at the learned time
+        self.assertEqual(ag._session.get.call_count, 1)
+        self.assertLess(self.loop.time() - started, 1)
+        self.assertEqual(model.stats()['solved'], 3)
+
+    def test_resolve_cached(self):
+        cache = AnswerCache()
+        ag = AntiCaptcha(api_key, cache=cache, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(fake_resp(200, 'OK|123'))
+        ag._session.get = fake_coroutine(fake_resp(200, 'OK|abc'))
+
+        results = self.loop.run_until_complete(gather(
+            ag.resolve(b'img'), ag.resolve(bytearray(b'img'))))
+        self.assertEqual(results, [('123', 'abc'), ('123', 'abc')])
+        self.assertEqual(ag._session.post.call_count, 1)
+
+        result = self.loop.run_until_complete(ag.resolve(b'img'))
+        self.assertEqual(result, ('123', 'abc'))
+        self.assertEqual(ag._session.post.call_count, 1)
+
+    def test_resolve_cached_timeout(self):
+        ag = AntiCaptcha(api_key, cache=AnswerCache(), check_interval=0.01,
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(iter([
+            fake_resp(200, 'OK|123'), fake_resp(200, 'OK|456'),
+        ]), iter_v=True)
+        solved_at = self.loop.time() + 0.1
+
+        async def get(url, params, **kwargs):
+            if params['id'] == '456' or self.loop.time() < solved_at:
+                return fake_resp(200, 'CAPCHA_NOT_READY')
+            return fake_resp(200, 'OK|abc')
+
+        ag._session.get = mock.Mock(side_effect=get)
+
+        async def go():
+            hasty = ag.resolve(b'img', timeout=0.03)
+            patient = ag.resolve(b'img', priority=1)
+            with self.assertRaises(DeadlineError):
+                await hasty
+            self.assertEqual(hasty.captcha_id, '123')
+            # the first caller's deadline doesn't fail the second one
+            self.assertEqual(await patient, ('123', 'abc'))
+            self.assertEqual(patient.priority, 1)
+            self.assertEqual(ag._session.post.call_count, 1)
+            self.assertNotIn('timeout', ag._session.get.call_args[1])
+
+            lonely = ag.resolve(b'img2', timeout=0.03)
+            with self.assertRaises(DeadlineError):
+                await lonely
+            await asyncio.sleep(0)
+            # nobody waits for the shared captcha anymore
+            self.assertEqual(len(ag._poller), 0)
+            self.assertIsNone(ag._cache.pending(
+                AnswerCache.key(b'img2', {})))
+
+        self.loop.run_until_complete(go())
+        self.loop.run_until_complete(ag.close())
+
+    def test_resolve_cached_error(self):
+        ag = AntiCaptcha(api_key, cache=AnswerCache(), loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'ERROR_ZERO_BALANCE')
+
+        with self.assertRaises(ZeroBalanceError):
+            self.loop.run_until_complete(ag.resolve(b'img'))
+        self.assertEqual(len(ag._cache), 0)
+
+    def test_abuse_evicts_cached(self):
+        cache = AnswerCache()
+        ag = AntiCaptcha(api_key, cache=cache, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'OK')
+        cache.put(AnswerCache.key(b'img', {}), '123', 'abc')
+
+        self.loop.run_until_complete(ag.abuse('123'))
+        self.assertEqual(len(cache), 0)
+
+    def test_resolve_preprocessed(self):
+        ag = AntiCaptcha(api_key, preprocessor=Preprocessor(loop=self.loop),
+                         loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'OK|123')
+
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(ag.resolve(b'img'))
+        self.assertIn('less than 100 bytes', str(cm.exception))
+        self.assertFalse(ag._session.post.called)
+
+    @mock.patch('aio_anticaptcha.asyncio.sleep')
+    def test_resolve_metrics(self, sleep_mock):
+        sleep_mock.return_value = None
+
+        metrics = Metrics()
+        governor = mock.Mock()
+        governor.acquire = fake_coroutine(None)
+        ag = AntiCaptcha(api_key, metrics=metrics, governor=governor,
+                         check_interval=0.01, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(iter([
+            fake_resp(200, 'ERROR_NO_SLOT_AVAILABLE'),
+            fake_resp(200, 'OK|123'),
+        ]), iter_v=True)
+        ag._session.get = fake_coroutine(iter([
+            fake_resp(200, 'CAPCHA_NOT_READY'),
+            fake_resp(200, 'OK|abc'),
+        ]), iter_v=True)
+
+        self.loop.run_until_complete(ag.resolve(b'img'))
+        with self.assertRaises(ServiceError):
+            ag._handle_error('ERROR_IP_NOT_ALLOWED')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['submits_total'], 1)
+        self.assertEqual(snapshot['no_slot_retries_total'], 1)
+        self.assertEqual(snapshot['polls_total'], 2)
+        self.assertEqual(snapshot['submit_seconds']['count'], 2)
+        self.assertEqual(
+            snapshot['slot_wait_seconds{priority="0"}']['count'], 2)
+        self.assertEqual(snapshot['slot_queue_depth{priority="0"}'], 0)
+        self.assertEqual(snapshot['solve_seconds{priority="0"}']['count'], 1)
+        self.assertEqual(snapshot['polls_per_captcha']['sum'], 2)
+        self.assertEqual(
+            snapshot['errors_total{code="ERROR_IP_NOT_ALLOWED"}'], 1)
+
+    def test_metrics_batch_errors(self):
+        metrics = Metrics()
+        ag = AntiCaptcha(api_key, poll_batch_size=10, check_interval=0.01,
+                         metrics=metrics, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_session()
+        ag._session.post = fake_coroutine(iter([
+            fake_resp(200, 'OK|1'), fake_resp(200, 'OK|2'),
+        ]), iter_v=True)
+        ag._session.get = fake_coroutine(
+            fake_resp(200, 'ERROR_NO_SUCH_CAPCHA_ID|answer2'))
+
+        results = self.loop.run_until_complete(gather(
+            ag.resolve(b'img'), ag.resolve(b'img'), return_exceptions=True))
+        self.assertIsInstance(results[0], ServiceError)
+        self.assertEqual(results[1], ('2', 'answer2'))
+        ag._handle_error('ERROR_SOMETHING_NEW')
+
+        errors = {name: value
+                  for name, value in metrics.snapshot().items()
+                  if name.startswith('errors_total')}
+        # counted once per captcha, answers never end up in a label
+        self.assertEqual(errors, {
+            'errors_total{code="ERROR_NO_SUCH_CAPCHA_ID"}': 1,
+            'errors_total{code="other"}': 1,
+        })
+
+    def test_metrics_trace_config(self):
+        ag = AntiCaptcha(api_key, metrics=Metrics(), loop=self.loop)
+        self.assertEqual(len(ag._session.trace_configs), 1)
+        self.loop.run_until_complete(ag.close())
+
+    def test_get_balance_cached(self):
+        tracker = BalanceTracker(ttl=60, captcha_cost=0.5)
+        ag = AntiCaptcha(api_key, balance_tracker=tracker, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, '2.0')
+
+        self.assertEqual(self.loop.run_until_complete(ag.get_balance()), 2)
+        self.assertEqual(self.loop.run_until_complete(ag.get_balance()), 2)
+        self.assertEqual(ag._session.get.call_count, 1)
+
+    def test_get_balance_background_refresh(self):
+        tracker = BalanceTracker(ttl=60)
+        tracker.update(1.0)
+        tracker.invalidate()
+        ag = AntiCaptcha(api_key, balance_tracker=tracker, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, '3.0')
+
+        # the stale value is returned while refreshing in the background
+        self.assertEqual(self.loop.run_until_complete(ag.get_balance()), 1)
+        self.loop.run_until_complete(ag._balance_task)
+        self.assertEqual(tracker.balance, 3)
+        self.assertFalse(tracker.stale)
+
+    def test_resolve_charges_balance(self):
+        tracker = BalanceTracker(ttl=60, captcha_cost=0.5)
+        tracker.update(1.2)
+        ag = AntiCaptcha(api_key, balance_tracker=tracker, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'OK|123')
+
+        self.loop.run_until_complete(ag.resolve(b'img'))
+        self.loop.run_until_complete(ag.resolve(b'img'))
+        self.assertAlmostEqual(tracker.projected, 0.2)
+
+        with self.assertRaises(ZeroBalanceError) as cm:
+            self.loop.run_until_complete(ag.resolve(b'img'))
+        self.assertIn('Balance is not enough', str(cm.exception))
+        self.assertEqual(ag._session.post.call_count, 2)
+
+    def test_resolve_zero_balance_reply(self):
+        tracker = BalanceTracker(ttl=60)
+        ag = AntiCaptcha(api_key, balance_tracker=tracker, loop=self.loop)
+        self.loop.run_until_complete(ag.close())
+        ag._session = fake_client_session(200, 'ERROR_ZERO_BALANCE')
+
+        with self.assertRaises(ZeroBalanceError):
+            self.loop.run_until_complete(ag.resolve(b'img'))
+        self.assertEqual(tracker.balance, 0)
+        self.assertEqual(tracker.projected, 0)
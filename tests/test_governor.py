@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aio_anticaptcha import SlotGovernor
+
+from .helpers import gather
+
+
+class SlotGovernorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            SlotGovernor(rate=0, loop=self.loop)
+        self.assertIn('rate must be in range', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            SlotGovernor(rate=1000, max_rate=10, loop=self.loop)
+        self.assertIn('rate must be in range', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            SlotGovernor(decrease=1, loop=self.loop)
+        self.assertIn('decrease must be in range', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            SlotGovernor(backoff=2, max_backoff=1, loop=self.loop)
+        self.assertIn('backoff must be greater', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            SlotGovernor(aging=0, loop=self.loop)
+        self.assertIn('aging must be greater', str(cm.exception))
+
+    def test_fifo(self):
+        gov = SlotGovernor(rate=1000, max_rate=1000, loop=self.loop)
+        order = []
+
+        async def submit(i):
+            await gov.acquire()
+            order.append(i)
+
+        self.loop.run_until_complete(gather(
+            *[submit(i) for i in range(20)]))
+        self.assertEqual(order, list(range(20)))
+        self.assertEqual(gov.admitted, 20)
+        self.assertEqual(gov.queue_depth, 0)
+
+    def test_priority(self):
+        gov = SlotGovernor(rate=100, loop=self.loop)
+        gov._tokens = 0
+        order = []
+
+        async def submit(i, priority):
+            await gov.acquire(priority)
+            order.append(i)
+
+        async def go():
+            tasks = [self.loop.create_task(submit(i, priority))
+                     for i, priority in enumerate([0, 0, 1, 0, 2])]
+            await asyncio.sleep(0)
+            self.assertEqual(gov.queue_depths(), {0: 3, 1: 1, 2: 1})
+            await gather(*tasks)
+
+        self.loop.run_until_complete(go())
+        self.assertEqual(order, [4, 2, 0, 1, 3])
+        self.assertEqual(gov.queue_depths(), {})
+
+    def test_aging(self):
+        gov = SlotGovernor(rate=100, aging=1, loop=self.loop)
+        gov._tokens = 0
+        order = []
+
+        async def submit(i, priority, since=None):
+            await gov.acquire(priority, since=since)
+            order.append(i)
+
+        async def go():
+            now = self.loop.time()
+            # waiting for 3 seconds outweighs 2 priority levels
+            tasks = [self.loop.create_task(submit(0, 0, now - 3)),
+                     self.loop.create_task(submit(1, 2))]
+            await asyncio.sleep(0)
+            await gather(*tasks)
+
+        self.loop.run_until_complete(go())
+        self.assertEqual(order, [0, 1])
+
+    def test_rate_limit(self):
+        gov = SlotGovernor(rate=100, loop=self.loop)
+        tasks = [asyncio.ensure_future(gov.acquire(), loop=self.loop)
+                 for _ in range(10)]
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertLess(sum(t.done() for t in tasks), 10)
+        self.assertGreater(gov.queue_depth, 0)
+
+        started = self.loop.time()
+        self.loop.run_until_complete(gather(*tasks))
+        self.assertGreater(self.loop.time() - started, 0.03)
+        self.assertEqual(gov.queue_depth, 0)
+
+    @mock.patch('aio_anticaptcha.governor.random.uniform')
+    def test_no_slot(self, uniform):
+        uniform.return_value = 0
+        gov = SlotGovernor(rate=10, backoff=0.05, loop=self.loop)
+        gov.on_no_slot()
+        self.assertEqual(gov.rate, 5)
+        self.assertEqual(gov.rejected, 1)
+        # burst of rejections from requests sent at the old rate
+        gov.on_no_slot()
+        self.assertEqual(gov.rate, 5)
+
+        started = self.loop.time()
+        self.loop.run_until_complete(gov.acquire())
+        # second consecutive failure doubles the pause
+        self.assertGreaterEqual(self.loop.time() - started, 0.09)
+
+    def test_min_max_rate(self):
+        gov = SlotGovernor(rate=1, min_rate=1, max_rate=2, loop=self.loop)
+        gov.on_no_slot()
+        self.assertEqual(gov.rate, 1)
+        for _ in range(10):
+            gov.on_success()
+        self.assertEqual(gov.rate, 2)
+
+    def test_increase(self):
+        gov = SlotGovernor(rate=10, increase=1, loop=self.loop)
+        for _ in range(10):
+            gov.on_success()
+        self.assertAlmostEqual(gov.rate, 11, places=0)
+
+    def test_close(self):
+        gov = SlotGovernor(rate=1, loop=self.loop)
+        self.loop.run_until_complete(gov.acquire())
+        task = asyncio.ensure_future(gov.acquire(), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(gov.queue_depth, 1)
+        gov.close()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        self.assertEqual(gov.queue_depth, 0)
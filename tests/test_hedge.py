@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+
+from aio_anticaptcha import (AntiCaptcha, Hedger, LatencyModel, Metrics,
+                             PingbackReceiver)
+from aio_anticaptcha.testing import FakeAntiCaptchaServer
+
+from .helpers import gather, run_client
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class HedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            Hedger(quantile=1)
+        self.assertIn('quantile must be in range', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            Hedger(delay=0)
+        self.assertIn('delay must be greater than zero', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            Hedger(budget=2)
+        self.assertIn('budget must be in range', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            Hedger(burst=0)
+        self.assertIn('burst must be greater', str(cm.exception))
+
+    def test_hedge_wins(self):
+        server = FakeAntiCaptchaServer(solve_time=iter([5, 0.02]).__next__,
+                                       loop=self.loop)
+        hedger = Hedger(delay=0.05, report_losers=True)
+        metrics = Metrics()
+
+        async def resolve(client):
+            result = await client.resolve(b'img')
+            await asyncio.sleep(0.05)
+            return result, len(client._poller)
+
+        (result, pending) = run_client(self.loop, server, resolve,
+                                       check_interval=0.02, hedger=hedger,
+                                       metrics=metrics)
+        self.assertEqual(result, ('2', 'answer2'))
+        self.assertEqual(pending, 0)
+        self.assertEqual(hedger.stats(), {'hedged': 1, 'won': 1})
+        self.assertEqual(server.reported, ['1'])
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['hedges_total'], 1)
+        self.assertEqual(snapshot['hedge_wins_total'], 1)
+
+    def test_hedge_wins_pingback(self):
+        server = FakeAntiCaptchaServer(solve_time=iter([5, 0.02]).__next__,
+                                       loop=self.loop)
+        receiver = PingbackReceiver(fallback_interval=10, loop=self.loop)
+        hedger = Hedger(delay=0.05)
+
+        async def resolve(client):
+            return (await client.resolve(b'img')), dict(receiver._waiting)
+
+        result, waiting = run_client(self.loop, server, resolve,
+                                     hedger=hedger, pingback=receiver)
+        self.assertEqual(result, ('2', 'answer2'))
+        # the loser's answer is no longer waited for
+        self.assertEqual(waiting, {})
+
+    def test_primary_wins(self):
+        server = FakeAntiCaptchaServer(solve_time=iter([0.1, 5]).__next__,
+                                       loop=self.loop)
+        hedger = Hedger(delay=0.05)
+
+        async def resolve(client):
+            result = await client.resolve(b'img')
+            await asyncio.sleep(0.05)
+            return result, len(client._poller)
+
+        result, pending = run_client(self.loop, server, resolve,
+                                     check_interval=0.02, hedger=hedger)
+        self.assertEqual(result, ('1', 'answer1'))
+        self.assertEqual(pending, 0)
+        self.assertEqual(hedger.stats(), {'hedged': 1, 'won': 0})
+        self.assertEqual(server.submitted, 2)
+        self.assertEqual(server.reported, [])
+
+    def test_other_client(self):
+        fast = FakeAntiCaptchaServer(solve_time=0.02, loop=self.loop)
+        slow = FakeAntiCaptchaServer(solve_time=5, loop=self.loop)
+        self.loop.run_until_complete(fast.start())
+        other = AntiCaptcha(api_key, domain=fast.domain, port=fast.port,
+                            check_interval=0.02, loop=self.loop)
+        hedger = Hedger(delay=0.05, clients=[other])
+        try:
+            result = run_client(self.loop, slow, lambda c: c.resolve(b'img'),
+                                check_interval=0.02, hedger=hedger)
+        finally:
+            self.loop.run_until_complete(other.close())
+            self.loop.run_until_complete(fast.close())
+
+        self.assertEqual(result, ('1', 'answer1'))
+        self.assertEqual(slow.submitted, 1)
+        self.assertEqual(fast.submitted, 1)
+
+    def test_budget(self):
+        server = FakeAntiCaptchaServer(solve_time=0.1, loop=self.loop)
+        hedger = Hedger(delay=0.02, budget=0, burst=1)
+
+        async def resolve(client):
+            return (await gather(
+                *[client.resolve(b'img') for _ in range(5)]))
+
+        run_client(self.loop, server, resolve, check_interval=0.02,
+                   hedger=hedger)
+        self.assertEqual(hedger.hedged, 1)
+        self.assertEqual(server.submitted, 6)
+
+    def test_quantile_delay(self):
+        model = LatencyModel(min_samples=1, quantiles=(0.5,))
+        model.observe((), 0.1, 1, 10)
+        model.observe((), 1, 1, 10)
+        server = FakeAntiCaptchaServer(solve_time=0.05, loop=self.loop)
+        hedger = Hedger(quantile=0.9, delay=0.01)
+
+        run_client(self.loop, server, lambda c: c.resolve(b'img'),
+                   check_interval=0.02, hedger=hedger, latency_model=model)
+        # the learned solve time overrides the fallback delay
+        self.assertEqual(hedger.hedged, 0)
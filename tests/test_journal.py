@@ -0,0 +1,79 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aio_anticaptcha import Journal
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'journal')
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            Journal(self.path, flush_interval=0, loop=self.loop)
+        self.assertIn('flush_interval must be greater than zero',
+                      str(cm.exception))
+
+    def test_unfinished(self):
+        journal = Journal(self.path, loop=self.loop)
+        self.assertEqual(journal.take_unfinished(), [])
+        journal.submitted('1', 'a', (('phrase', '1'),))
+        journal.submitted('2', 'b')
+        journal.submitted('3')
+        journal.finished('2')
+        journal.close()
+
+        journal = Journal(self.path, loop=self.loop)
+        unfinished = journal.take_unfinished()
+        self.assertEqual([r[:3] for r in unfinished],
+                         [('1', 'a', (('phrase', '1'),)), ('3', None, ())])
+        self.assertEqual(journal.take_unfinished(), [])
+        journal.close()
+
+        # finished records are dropped when the journal is opened
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_torn_record(self):
+        journal = Journal(self.path, loop=self.loop)
+        journal.submitted('1')
+        journal.close()
+        with open(self.path, 'a') as f:
+            f.write('{"id": "2", "ke')
+
+        journal = Journal(self.path, loop=self.loop)
+        self.assertEqual([r[0] for r in journal.take_unfinished()], ['1'])
+        journal.submitted('3')
+        journal.close()
+
+        journal = Journal(self.path, loop=self.loop)
+        self.assertEqual([r[0] for r in journal.take_unfinished()],
+                         ['1', '3'])
+        journal.close()
+
+    def test_batched_writes(self):
+        journal = Journal(self.path, flush_interval=0.01, fsync=False,
+                          loop=self.loop)
+        with mock.patch.object(journal, '_write',
+                               wraps=journal._write) as write:
+            for i in range(100):
+                journal.submitted(str(i))
+            self.assertFalse(write.called)
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+            self.assertEqual(write.call_count, 1)
+            self.assertEqual(len(write.call_args[0][0]), 100)
+
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 100)
+        journal.close()
@@ -0,0 +1,70 @@
+import unittest
+
+from aio_anticaptcha import LatencyModel
+
+
+class LatencyModelTestCase(unittest.TestCase):
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            LatencyModel(window=5, min_samples=10)
+        self.assertIn('window must be greater', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            LatencyModel(quantiles=(0.5, 2))
+        self.assertIn('quantiles must be in range', str(cm.exception))
+
+    def test_profile(self):
+        self.assertEqual(LatencyModel.profile({}), ())
+        self.assertEqual(LatencyModel.profile({'b': 1, 'a': True}),
+                         (('a', 'True'), ('b', '1')))
+
+    def test_cold_schedule_is_fixed(self):
+        model = LatencyModel(min_samples=3)
+        self.assertEqual(model.next_poll((), 0, 0, 10), 0)
+        self.assertEqual(model.next_poll((), 0.1, 1, 10), 10.1)
+        self.assertIsNone(model.quantile((), 0.5))
+
+    def test_learned_schedule(self):
+        model = LatencyModel(min_samples=3, min_gap=0.5,
+                             quantiles=(0, 0.5, 1))
+        for solve_time in (4, 6, 8):
+            model.observe((), solve_time, 1, 10)
+
+        self.assertEqual(model.quantile((), 0.5), 6)
+        # first poll is skipped until the expected minimum
+        self.assertEqual(model.next_poll((), 0, 0, 10), 4)
+        self.assertEqual(model.next_poll((), 4, 1, 10), 6)
+        self.assertEqual(model.next_poll((), 6, 2, 10), 8)
+        # past the learned distribution fall back to the fixed interval
+        self.assertEqual(model.next_poll((), 8, 3, 10), 18)
+        # other profiles are still cold
+        self.assertEqual(model.next_poll((('a', '1'),), 0, 0, 10), 0)
+
+    def test_stats(self):
+        model = LatencyModel()
+        model.observe((), 6, 1, 10)
+        model.observe((), 12, 2, 10)
+
+        stats = model.stats()
+        self.assertEqual(stats['solved'], 2)
+        self.assertEqual(stats['polls'], 3)
+        # fixed interval polls at 0, 10 and 0, 10, 20
+        self.assertEqual(stats['fixed_polls'], 5)
+        self.assertEqual(stats['polls_avoided'], 2)
+        self.assertEqual(stats['latency_saved'], 30 - 18)
+
+    def test_observe_interval(self):
+        model = LatencyModel(min_samples=1)
+        # answered at 10, the poll at 4 found it not ready
+        model.observe((), 10, 2, 10, not_ready=4, fitted=False)
+        self.assertEqual(model.quantile((), 0.5), 7)
+        # polled on the fixed schedule, nothing was saved
+        self.assertEqual(model.stats()['polls_avoided'], 0)
+        self.assertEqual(model.stats()['latency_saved'], 0)
+
+        self.assertTrue(model.fitted(()))
+        model.observe((), 7, 1, 10, not_ready=0, fitted=True)
+        stats = model.stats()
+        # the fixed interval would have found it at 10 after 2 polls
+        self.assertEqual(stats['polls_avoided'], 1)
+        self.assertEqual(stats['latency_saved'], 3)
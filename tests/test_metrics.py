@@ -0,0 +1,123 @@
+import asyncio
+import types
+import unittest
+
+from aio_anticaptcha import Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counters(self):
+        metrics = Metrics()
+        metrics.inc('submits_total')
+        metrics.inc('submits_total', 2)
+        metrics.inc('errors_total', code='ERROR_ZERO_BALANCE')
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['submits_total'], 3)
+        self.assertEqual(
+            snapshot['errors_total{code="ERROR_ZERO_BALANCE"}'], 1)
+
+    def test_histogram(self):
+        metrics = Metrics()
+        metrics.observe('submit_seconds', 0.01)
+        metrics.observe('submit_seconds', 0.3)
+        metrics.observe('submit_seconds', 1000)
+        metrics.observe('polls_per_captcha', 2)
+
+        hist = metrics.snapshot()['submit_seconds']
+        self.assertEqual(hist['count'], 3)
+        self.assertAlmostEqual(hist['sum'], 1000.31)
+        buckets = dict(hist['buckets'])
+        self.assertEqual(buckets[0.005], 0)
+        self.assertEqual(buckets[0.01], 1)
+        self.assertEqual(buckets[0.5], 2)
+        self.assertEqual(buckets['+Inf'], 3)
+
+        polls = dict(metrics.snapshot()['polls_per_captcha']['buckets'])
+        self.assertEqual(polls[1], 0)
+        self.assertEqual(polls[2], 1)
+
+    def test_prometheus(self):
+        metrics = Metrics(prefix='ac')
+        metrics.inc('errors_total', code='ERROR_A')
+        metrics.inc('errors_total', code='ERROR_B')
+        metrics.gauge('requests_in_flight', 1)
+        metrics.observe('solve_seconds', 12)
+
+        text = metrics.to_prometheus()
+        self.assertEqual(text.count('# TYPE ac_errors_total counter'), 1)
+        self.assertIn('ac_errors_total{code="ERROR_A"} 1\n', text)
+        self.assertIn('ac_errors_total{code="ERROR_B"} 1\n', text)
+        self.assertIn('# TYPE ac_requests_in_flight gauge\n', text)
+        self.assertIn('# TYPE ac_solve_seconds histogram\n', text)
+        self.assertIn('ac_solve_seconds_bucket{le="10"} 0\n', text)
+        self.assertIn('ac_solve_seconds_bucket{le="15"} 1\n', text)
+        self.assertIn('ac_solve_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('ac_solve_seconds_sum 12\n', text)
+        self.assertIn('ac_solve_seconds_count 1\n', text)
+        self.assertIn('# HELP ac_solve_seconds ', text)
+
+    def test_labels(self):
+        metrics = Metrics(prefix='ac')
+        metrics.gauge('slot_queue_depth', 2, priority=0)
+        metrics.gauge('slot_queue_depth', 1, priority=1)
+        metrics.observe('solve_seconds', 12, priority=0)
+        metrics.observe('solve_seconds', 3, priority=1)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['slot_queue_depth{priority="1"}'], 1)
+        self.assertEqual(snapshot['solve_seconds{priority="0"}']['sum'], 12)
+
+        text = metrics.to_prometheus()
+        self.assertEqual(text.count('# TYPE ac_slot_queue_depth gauge'), 1)
+        self.assertEqual(text.count('# TYPE ac_solve_seconds histogram'), 1)
+        self.assertIn('ac_slot_queue_depth{priority="0"} 2\n', text)
+        self.assertIn(
+            'ac_solve_seconds_bucket{priority="1",le="5"} 1\n', text)
+        self.assertIn('ac_solve_seconds_sum{priority="1"} 3\n', text)
+        self.assertIn('ac_solve_seconds_count{priority="0"} 1\n', text)
+
+    def test_families_grouped(self):
+        metrics = Metrics(prefix='ac')
+        metrics.inc('errors_total', code='ERROR_A')
+        metrics.inc('submits_total')
+        metrics.inc('errors_total', code='ERROR_B')
+        metrics.observe('solve_seconds', 12, priority=0)
+        metrics.observe('slot_wait_seconds', 1)
+        metrics.observe('solve_seconds', 3, priority=1)
+
+        family = None
+        seen = []
+        for line in metrics.to_prometheus().splitlines():
+            if line.startswith('# TYPE '):
+                family = line.split()[2]
+                seen.append(family)
+            elif not line.startswith('#'):
+                # every sample belongs to the family declared above it
+                self.assertTrue(line.startswith(family), line)
+        self.assertEqual(seen, ['ac_errors_total', 'ac_submits_total',
+                                'ac_solve_seconds', 'ac_slot_wait_seconds'])
+
+    def test_trace_config(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        metrics = Metrics()
+        trace = metrics.trace_config()
+        ctx = types.SimpleNamespace()
+
+        async def run():
+            await trace.on_request_start[0](None, ctx, None)
+            await trace.on_connection_queued_start[0](None, ctx, None)
+            await trace.on_connection_queued_end[0](None, ctx, None)
+            await trace.on_connection_create_start[0](None, ctx, None)
+            await trace.on_connection_create_end[0](None, ctx, None)
+            await trace.on_connection_reuseconn[0](None, ctx, None)
+            self.assertEqual(metrics.snapshot()['requests_in_flight'], 1)
+            await trace.on_request_end[0](None, ctx, None)
+
+        loop.run_until_complete(run())
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['requests_in_flight'], 0)
+        self.assertEqual(snapshot['connections_created_total'], 1)
+        self.assertEqual(snapshot['connections_reused_total'], 1)
+        self.assertEqual(snapshot['connection_queued_seconds']['count'], 1)
+        self.assertEqual(snapshot['connect_seconds']['count'], 1)
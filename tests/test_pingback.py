@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+
+import aiohttp
+
+from aio_anticaptcha import Metrics, PingbackReceiver
+from aio_anticaptcha.testing import FakeAntiCaptchaServer
+
+from .helpers import gather, run_client
+
+
+class PingbackReceiverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            PingbackReceiver(fallback_interval=0, loop=self.loop)
+        self.assertIn('fallback_interval must be greater than zero',
+                      str(cm.exception))
+
+    def test_url(self):
+        receiver = PingbackReceiver(url='https://example.com/captcha/',
+                                    loop=self.loop)
+        self.assertIsNone(receiver.url)
+        url = self.loop.run_until_complete(receiver.start())
+        self.assertEqual(url, 'https://example.com/captcha' + receiver.path)
+        self.assertEqual(self.loop.run_until_complete(receiver.start()), url)
+        self.loop.run_until_complete(receiver.close())
+        self.assertIsNone(receiver.url)
+
+    def test_resolve_pushed(self):
+        server = FakeAntiCaptchaServer(solve_time=0.05, loop=self.loop)
+        metrics = Metrics()
+        receiver = PingbackReceiver(fallback_interval=10, loop=self.loop)
+
+        async def resolve(client):
+            return (await asyncio.wait_for(
+                gather(*[client.resolve(b'img%d' % i) for i in range(3)]),
+                timeout=5))
+
+        results = run_client(self.loop, server, resolve, pingback=receiver,
+                             metrics=metrics)
+        self.assertEqual(sorted(results), [('1', 'answer1'),
+                                           ('2', 'answer2'),
+                                           ('3', 'answer3')])
+        self.assertEqual(server.requests['res.php'], 0)
+        self.assertEqual(server.pingbacks, 3)
+        self.assertEqual(receiver.received, 3)
+        self.assertEqual(metrics.snapshot()['pingbacks_total'], 3)
+        self.assertEqual(receiver._waiting, {})
+
+    def test_lost_pingback(self):
+        server = FakeAntiCaptchaServer(solve_time=0.02, pingback_loss=1,
+                                       loop=self.loop)
+        receiver = PingbackReceiver(fallback_interval=0.1, loop=self.loop)
+
+        result = run_client(self.loop, server, lambda c: c.resolve(b'img'),
+                            pingback=receiver)
+        self.assertEqual(result, ('1', 'answer1'))
+        self.assertEqual(server.pingbacks, 0)
+        self.assertEqual(server.requests['res.php'], 1)
+
+    def test_handler(self):
+        receiver = PingbackReceiver(loop=self.loop)
+        answers = []
+
+        async def go():
+            url = await receiver.start()
+            receiver.register('1', lambda *args: answers.append(args))
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, data={'id': '1',
+                                                   'code': 'abc'}) as resp:
+                    self.assertEqual(resp.status, 200)
+                # an answer which arrived before the captcha id
+                async with session.get(url, params={'id': '2',
+                                                    'code': 'xyz'}) as resp:
+                    self.assertEqual(resp.status, 200)
+                async with session.post(url, data={'id': '3'}) as resp:
+                    self.assertEqual(resp.status, 400)
+                async with session.post(url.rsplit('/', 1)[0] + '/forged',
+                                        data={'id': '1',
+                                              'code': 'abc'}) as resp:
+                    self.assertEqual(resp.status, 404)
+            receiver.register('2', lambda *args: answers.append(args))
+            await receiver.close()
+
+        self.loop.run_until_complete(go())
+        self.assertEqual(answers, [('1', 'abc'), ('2', 'xyz')])
+        self.assertEqual(receiver.received, 2)
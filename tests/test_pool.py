@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+
+from aio_anticaptcha import (AntiCaptchaPool, IPNotAllowedError,
+                             ServiceError, UserKeyError, ZeroBalanceError)
+
+from .helpers import gather
+
+
+class FakeClient:
+    def __init__(self, loop, name, delay=0.0, error=None, balance=1.0):
+        self._loop = loop
+        self._submissions = 0
+        self._slot_rejections = 0
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.balance = balance
+        self.resolved = 0
+        self.abused = []
+        self.closed = False
+
+    async def resolve(self, captcha, **ext_opts):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.resolved += 1
+        self._submissions += 1
+        return '%s-%d' % (self.name, self.resolved), 'answer'
+
+    async def abuse(self, captcha_id):
+        self.abused.append(captcha_id)
+
+    async def get_balance(self):
+        return self.balance
+
+    async def close(self):
+        self.closed = True
+
+
+class AntiCaptchaPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def gather(self, pool, n):
+        return self.loop.run_until_complete(gather(
+            *[pool.resolve(b'img') for _ in range(n)]))
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            AntiCaptchaPool([])
+        self.assertIn('clients must not be empty', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            AntiCaptchaPool([FakeClient(self.loop, 'a')], strategy='x')
+        self.assertIn('strategy must be', str(cm.exception))
+
+    def test_least_loaded(self):
+        a = FakeClient(self.loop, 'a', delay=0.01)
+        b = FakeClient(self.loop, 'b', delay=0.01)
+        pool = AntiCaptchaPool([a, b])
+        self.gather(pool, 10)
+        self.assertEqual((a.resolved, b.resolved), (5, 5))
+
+    def test_slot_rejections_penalized(self):
+        a = FakeClient(self.loop, 'a', delay=0.01)
+        b = FakeClient(self.loop, 'b', delay=0.01)
+        pool = AntiCaptchaPool([a, b], alpha=1)
+        self.gather(pool, 2)
+        a._slot_rejections += 10
+        self.gather(pool, 2)
+        self.gather(pool, 4)
+        self.assertGreater(b.resolved, a.resolved)
+        self.assertGreater(pool.stats()[0]['rejection'], 0.5)
+
+    def test_fastest(self):
+        a = FakeClient(self.loop, 'a', delay=0.05)
+        b = FakeClient(self.loop, 'b', delay=0.001)
+        pool = AntiCaptchaPool([a, b], strategy='fastest')
+        for _ in range(5):
+            self.gather(pool, 1)
+        self.assertEqual(a.resolved, 1)
+        self.assertEqual(b.resolved, 4)
+
+    def test_failover(self):
+        for error in (UserKeyError(), ZeroBalanceError(),
+                      IPNotAllowedError()):
+            a = FakeClient(self.loop, 'a', error=error)
+            b = FakeClient(self.loop, 'b')
+            pool = AntiCaptchaPool([a, b])
+            ids = sorted(r[0] for r in self.gather(pool, 3))
+            self.assertEqual(ids, ['b-1', 'b-2', 'b-3'])
+            stats = pool.stats()
+            self.assertFalse(stats[0]['enabled'])
+            self.assertIs(stats[0]['error'], error)
+            self.assertEqual(b.resolved, 3)
+
+            a.error = None
+            pool.enable(a)
+            self.gather(pool, 2)
+            self.assertEqual(a.resolved, 1)
+
+    def test_all_disabled(self):
+        a = FakeClient(self.loop, 'a', error=UserKeyError('bad key'))
+        pool = AntiCaptchaPool([a])
+        with self.assertRaises(UserKeyError):
+            self.gather(pool, 1)
+        with self.assertRaises(UserKeyError):
+            self.gather(pool, 1)
+
+    def test_other_errors_propagate(self):
+        a = FakeClient(self.loop, 'a', error=ServiceError('boom'))
+        b = FakeClient(self.loop, 'b')
+        pool = AntiCaptchaPool([a, b])
+        with self.assertRaises(ServiceError):
+            self.gather(pool, 1)
+        self.assertTrue(pool.stats()[0]['enabled'])
+
+    def test_abuse(self):
+        a = FakeClient(self.loop, 'a')
+        b = FakeClient(self.loop, 'b')
+        pool = AntiCaptchaPool([a, b])
+        ids = [r[0] for r in self.gather(pool, 2)]
+        for captcha_id in ids:
+            self.loop.run_until_complete(pool.abuse(captcha_id))
+        self.assertEqual(a.abused + b.abused, ids)
+
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(pool.abuse('unknown'))
+        self.assertIn('was not resolved by this pool', str(cm.exception))
+
+    def test_balance_and_close(self):
+        a = FakeClient(self.loop, 'a', balance=1)
+        b = FakeClient(self.loop, 'b', balance=2)
+
+        async def go():
+            async with AntiCaptchaPool([a, b]) as pool:
+                return (await pool.get_balance())
+
+        self.assertEqual(self.loop.run_until_complete(go()), 3)
+        self.assertTrue(a.closed and b.closed)
@@ -0,0 +1,125 @@
+import asyncio
+import io
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from aio_anticaptcha import Preprocessor, ServiceError
+from aio_anticaptcha import preprocess
+
+if preprocess.PILLOW:
+    from PIL import Image
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+def make_image(size=(200, 100), fmt='BMP', noise=False):
+    buff = io.BytesIO()
+    if noise:
+        image = Image.frombytes('RGB', size,
+                                os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new('RGB', size, (255, 0, 0))
+    image.save(buff, format=fmt)
+    return buff.getvalue()
+
+
+class PreprocessorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_too_small(self):
+        pre = Preprocessor(loop=self.loop)
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(pre.process(PNG_HEADER))
+        self.assertIn('less than 100 bytes', str(cm.exception))
+        self.assertEqual(pre.rejected, 1)
+
+    def test_unknown_type(self):
+        pre = Preprocessor(loop=self.loop)
+        with self.assertRaises(ServiceError) as cm:
+            self.loop.run_until_complete(pre.process(b'x' * 200))
+        self.assertIn('Could not determine captcha file type',
+                      str(cm.exception))
+
+    def test_check_only(self):
+        pre = Preprocessor(loop=self.loop)
+        data = PNG_HEADER + b'\0' * 200
+        result = self.loop.run_until_complete(pre.process(data))
+        self.assertIs(result, data)
+        self.assertEqual(pre.stats()['processed'], 1)
+        self.assertEqual(pre.stats()['bytes_saved'], 0)
+
+        f = io.BytesIO(data)
+        result = self.loop.run_until_complete(pre.process(f))
+        self.assertEqual(result, data)
+
+    def test_stream_passthrough(self):
+        pre = Preprocessor(loop=self.loop)
+        stream = object()
+        self.assertIs(self.loop.run_until_complete(pre.process(stream)),
+                      stream)
+
+    @unittest.skipIf(not preprocess.PILLOW, 'Pillow is not installed')
+    def test_transform(self):
+        data = make_image(noise=True)
+        pre = Preprocessor(crop=(0, 0, 100, 100), grayscale=True,
+                           max_size=(50, 50), format='PNG',
+                           executor=ThreadPoolExecutor(1), loop=self.loop)
+        result = self.loop.run_until_complete(pre.process(data))
+
+        image = Image.open(io.BytesIO(result))
+        self.assertEqual(image.format, 'PNG')
+        self.assertEqual(image.mode, 'L')
+        self.assertEqual(image.size, (50, 50))
+
+        stats = pre.stats()
+        self.assertEqual(stats['bytes_in'], len(data))
+        self.assertEqual(stats['bytes_out'], len(result))
+        self.assertGreater(stats['bytes_saved'], 0)
+        self.assertGreater(stats['transform_time'], 0)
+
+    @unittest.skipIf(not preprocess.PILLOW, 'Pillow is not installed')
+    def test_transform_source_format(self):
+        data = make_image(noise=True)
+        pre = Preprocessor(crop=(0, 0, 100, 100), grayscale=True,
+                           loop=self.loop)
+        result = self.loop.run_until_complete(pre.process(data))
+
+        image = Image.open(io.BytesIO(result))
+        self.assertEqual(image.format, 'BMP')
+        self.assertEqual(image.size, (100, 100))
+
+    @unittest.skipIf(not preprocess.PILLOW, 'Pillow is not installed')
+    def test_keep_rejected_result(self):
+        data = make_image()
+        pre = Preprocessor(max_size=(10, 10), format='PNG', loop=self.loop)
+        result = self.loop.run_until_complete(pre.process(data))
+        # a 10x10 PNG is too small for the service
+        self.assertEqual(result, data)
+
+        pre = Preprocessor(format='WEBP', loop=self.loop)
+        result = self.loop.run_until_complete(pre.process(data))
+        self.assertEqual(result, data)
+
+    @unittest.skipIf(not preprocess.PILLOW, 'Pillow is not installed')
+    def test_keep_smaller_original(self):
+        data = make_image(fmt='PNG')
+        pre = Preprocessor(format='BMP', loop=self.loop)
+        result = self.loop.run_until_complete(pre.process(data))
+        self.assertEqual(result, data)
+
+    def test_pillow_required(self):
+        pillow = preprocess.PILLOW
+        preprocess.PILLOW = False
+        try:
+            with self.assertRaises(RuntimeError) as cm:
+                Preprocessor(grayscale=True, loop=self.loop)
+            self.assertIn('Pillow is required', str(cm.exception))
+            Preprocessor(loop=self.loop)
+        finally:
+            preprocess.PILLOW = pillow
@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+
+import aiohttp
+
+from aio_anticaptcha import (CircuitOpenError, RetryPolicy, ServiceError,
+                             TransientError)
+from aio_anticaptcha.retry import is_transient
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            RetryPolicy(retries=-1)
+        self.assertIn('retries must not be negative', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            RetryPolicy(backoff=2, max_backoff=1)
+        self.assertIn('backoff must be greater', str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            RetryPolicy(jitter=1)
+        self.assertIn('jitter must be in range', str(cm.exception))
+
+    @mock.patch('aio_anticaptcha.retry.random.uniform')
+    def test_delay(self, uniform):
+        uniform.return_value = 0
+        policy = RetryPolicy(retries=4, backoff=1, max_backoff=5)
+        self.assertEqual([policy.delay(i) for i in range(5)],
+                         [1, 2, 4, 5, None])
+
+        uniform.return_value = 0.5
+        self.assertEqual(policy.delay(0), 1.5)
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient(TransientError('Network error')))
+        self.assertTrue(is_transient(CircuitOpenError('open')))
+        self.assertTrue(is_transient(aiohttp.ServerDisconnectedError()))
+        self.assertFalse(is_transient(ServiceError('HTTP error')))
+        self.assertFalse(is_transient(aiohttp.ClientSSLError(
+            mock.Mock(), OSError())))
@@ -0,0 +1,98 @@
+import asyncio
+import concurrent.futures
+import threading
+import unittest
+
+from aio_anticaptcha import (AntiCaptcha, ServiceError, SlotGovernor,
+                             SyncAntiCaptcha)
+from .helpers import (fake_client_session, fake_coroutine, fake_resp,
+                      fake_session)
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class SyncAntiCaptchaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sync = SyncAntiCaptcha(api_key, check_interval=0.01)
+        self.addCleanup(self.sync.close)
+
+    def test_ctor(self):
+        with self.assertRaises(ValueError) as cm:
+            SyncAntiCaptcha()
+        self.assertIn('api_key or factory must be given', str(cm.exception))
+
+        with self.assertRaises(ValueError):
+            SyncAntiCaptcha('short')
+
+    def test_factory(self):
+        def factory(loop):
+            return AntiCaptcha(api_key, loop=loop,
+                               governor=SlotGovernor(loop=loop))
+
+        with SyncAntiCaptcha(factory=factory) as sync:
+            self.assertIs(sync.client._loop, sync.loop)
+            self.assertIs(sync.client._governor._loop, sync.loop)
+
+    def test_resolve_threads(self):
+        session = fake_session()
+        session.post = fake_coroutine(
+            iter([fake_resp(200, 'OK|%d' % i) for i in range(16)]),
+            iter_v=True)
+        session.get = fake_coroutine(fake_resp(200, 'OK|abc'))
+        self.sync.client._session = session
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(self.sync.resolve, [b'img'] * 16))
+        self.assertEqual(sorted(results),
+                         sorted(('%d' % i, 'abc') for i in range(16)))
+        self.assertEqual(session.post.call_count, 16)
+
+    def test_submit(self):
+        self.sync.client._session = fake_client_session(
+            200, 'ERROR_WRONG_USER_KEY')
+
+        fut = self.sync.submit(b'img')
+        self.assertIsInstance(fut, concurrent.futures.Future)
+        with self.assertRaises(ServiceError):
+            fut.result(1)
+
+    def test_submit_cancel(self):
+        session = fake_session()
+        session.post = fake_coroutine(fake_resp(200, 'OK|1'))
+        session.get = fake_coroutine(fake_resp(200, 'CAPCHA_NOT_READY'))
+        self.sync.client._session = session
+
+        # hold the loop thread until the captcha is cancelled
+        release = threading.Event()
+        self.sync.loop.call_soon_threadsafe(release.wait, 1)
+        fut = self.sync.submit(b'img')
+        self.assertTrue(fut.cancel())
+        release.set()
+        self.sync._call(lambda: None)
+        self.assertFalse(session.post.called)
+        self.assertEqual(len(self.sync.client._poller), 0)
+
+        # a running one can't be cancelled anymore
+        fut = self.sync.submit(b'img')
+        self.sync._call(lambda: None)
+        self.assertTrue(fut.running())
+        self.assertFalse(fut.cancel())
+
+    def test_get_balance_and_abuse(self):
+        self.sync.client._session = fake_client_session(200, '1.5')
+        self.assertEqual(self.sync.get_balance(), 1.5)
+
+        self.sync.client._session = fake_client_session(
+            200, 'OK_REPORT_RECORDED')
+        self.sync.abuse('1')
+        params = self.sync.client._session.get.call_args[1]['params']
+        self.assertEqual(params['action'], 'reportbad')
+
+    def test_loop_thread(self):
+        async def call():
+            return self.sync.get_balance()
+
+        fut = asyncio.run_coroutine_threadsafe(call(), self.sync.loop)
+        with self.assertRaises(RuntimeError) as cm:
+            fut.result(1)
+        self.assertIn('would deadlock', str(cm.exception))
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from aio_anticaptcha import CaptchaTask, ServiceError
+
+
+class CaptchaTaskTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_result(self):
+        task = CaptchaTask(loop=self.loop)
+        self.assertEqual(task.state, 'submitting')
+        self.assertIsNone(task.deadline)
+        self.assertFalse(hasattr(task, '__dict__'))
+
+        done = []
+        task.add_done_callback(done.append)
+        task.captcha_id = '1'
+        task._set_result('abc')
+        task._set_result('ignored')
+
+        self.assertEqual(task.state, 'done')
+        self.assertEqual(self.loop.run_until_complete(task), ('1', 'abc'))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(done, [task])
+
+    def test_exception(self):
+        task = CaptchaTask(loop=self.loop)
+        task._set_exception(ServiceError('boom'))
+        self.assertEqual(task.state, 'failed')
+        self.assertIsInstance(task.exception(), ServiceError)
+        with self.assertRaises(ServiceError):
+            self.loop.run_until_complete(task)
+
+    def test_await(self):
+        task = CaptchaTask(loop=self.loop)
+
+        async def waiter():
+            return (await task)
+
+        fut = asyncio.ensure_future(waiter(), loop=self.loop)
+        task.captcha_id = '1'
+        task._set_result('abc')
+        self.assertEqual(self.loop.run_until_complete(fut), ('1', 'abc'))
+
+    def test_cancel_waiters(self):
+        task = CaptchaTask(loop=self.loop)
+        first = asyncio.ensure_future(task, loop=self.loop)
+        second = asyncio.ensure_future(task, loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        # the captcha is cancelled only when nobody waits for it
+        first.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(task.done())
+        second.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(task.cancelled())
+
+    def test_cancel(self):
+        task = CaptchaTask(loop=self.loop)
+        self.assertTrue(task.cancel())
+        self.assertTrue(task.cancelled())
+        self.assertFalse(task.cancel())
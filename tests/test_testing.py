@@ -0,0 +1,113 @@
+import asyncio
+import random
+import unittest
+
+from aio_anticaptcha import LatencyModel, ServiceError
+from aio_anticaptcha.testing import FakeAntiCaptchaServer
+
+from .helpers import gather, run_client
+
+
+class FakeServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_resolve(self):
+        server = FakeAntiCaptchaServer(solve_time=0.05, loop=self.loop)
+        result = run_client(self.loop, server, lambda c: c.resolve(b'img'),
+                            check_interval=0.02)
+        self.assertEqual(result, ('1', 'answer1'))
+        self.assertEqual(server.requests['in.php'], 1)
+        self.assertGreaterEqual(server.requests['res.php'], 2)
+
+    def test_resolve_batched(self):
+        server = FakeAntiCaptchaServer(solve_time=0.05, loop=self.loop)
+
+        async def resolve(client):
+            return (await gather(
+                *[client.resolve(b'img') for _ in range(20)]))
+
+        results = run_client(self.loop, server, resolve, check_interval=0.1,
+                             poll_batch_size=10)
+        self.assertEqual(sorted(results),
+                         sorted(('%d' % i, 'answer%d' % i)
+                                for i in range(1, 21)))
+        self.assertLessEqual(server.requests['res.php'], 4)
+
+    def test_no_slots(self):
+        server = FakeAntiCaptchaServer(solve_time=0.05, slots=1,
+                                       loop=self.loop)
+
+        async def resolve(client):
+            return (await gather(
+                client.resolve(b'img'), client.resolve(b'img')))
+
+        results = run_client(self.loop, server, resolve, check_interval=0.02,
+                             send_interval=0.02)
+        self.assertEqual(len(results), 2)
+        self.assertGreater(server.requests['in.php'], 2)
+
+    def test_latency_model_learns(self):
+        server = FakeAntiCaptchaServer(
+            solve_time=lambda: random.uniform(0.05, 0.1), loop=self.loop)
+        model = LatencyModel(min_samples=10, min_gap=0.02)
+
+        async def rounds(client):
+            durations = []
+            stats = []
+            for _ in range(4):
+                started = self.loop.time()
+                await gather(*[client.resolve(b'img') for _ in range(10)])
+                durations.append(self.loop.time() - started)
+                stats.append(model.stats())
+            return durations, stats
+
+        durations, stats = run_client(self.loop, server, rounds,
+                                      check_interval=0.5,
+                                      latency_model=model)
+        # a cold model polls like the fixed interval and saves nothing
+        self.assertGreaterEqual(durations[0], 0.5)
+        self.assertEqual(stats[0]['polls_avoided'], 0)
+        self.assertEqual(stats[0]['latency_saved'], 0)
+        # answers are found sooner than the interval they were polled at
+        self.assertLess(durations[-1], 0.25)
+        self.assertLess(model.quantile((), 0.5), 0.2)
+        self.assertGreater(stats[-1]['latency_saved'],
+                           stats[0]['latency_saved'])
+
+    def test_close_while_submitting(self):
+        server = FakeAntiCaptchaServer(slots=0, loop=self.loop)
+
+        async def go(client):
+            task = client.resolve(b'img')
+            await asyncio.sleep(0.05)
+            await client.close()
+            # cancelled instead of failing on the closed session
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return task.state
+
+        self.assertEqual(run_client(self.loop, server, go,
+                                    send_interval=0.01), 'cancelled')
+        self.assertGreater(server.requests['in.php'], 1)
+
+    def test_errors(self):
+        server = FakeAntiCaptchaServer(error_rate=1, loop=self.loop)
+        with self.assertRaises(ServiceError) as cm:
+            run_client(self.loop, server, lambda c: c.resolve(b'img'))
+        self.assertIn('Could not determine captcha file type',
+                      str(cm.exception))
+
+    def test_balance_and_abuse(self):
+        server = FakeAntiCaptchaServer(balance=1.5, loop=self.loop)
+
+        async def go(client):
+            await client.abuse('7')
+            return (await client.get_balance())
+
+        self.assertEqual(run_client(self.loop, server, go), 1.5)
+        self.assertEqual(server.reported, ['7'])
@@ -0,0 +1,85 @@
+import asyncio
+import io
+import unittest
+from base64 import b64encode
+
+from aio_anticaptcha import ServiceError
+from aio_anticaptcha.upload import CaptchaForm
+from .helpers import serialize
+
+api_key = 'd41d8cd98f00b204e9800998ecf8427e'
+
+
+class AsyncChunks:
+    def __init__(self, chunks):
+        self.reads = 0
+        self._it = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+        self.reads += 1
+        return chunk
+
+
+class CaptchaFormTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_unsupported(self):
+        with self.assertRaises(ServiceError) as cm:
+            CaptchaForm(api_key, 'str', {})
+        self.assertIn('Unsupported captcha type', str(cm.exception))
+
+    def test_fields(self):
+        form = CaptchaForm(api_key, b'img', {'numeric': 1})
+        self.assertEqual(form.fields, [('key', api_key),
+                                       ('method', 'base64'),
+                                       ('numeric', 1)])
+        form = CaptchaForm(api_key, io.BytesIO(b'img'), {})
+        self.assertEqual(form.fields, [('key', api_key), ('method', 'post')])
+
+    def test_buffers(self):
+        expected = b64encode(b'image')
+        for captcha in (b'image', bytearray(b'image'),
+                        memoryview(b'xximage')[2:]):
+            form = CaptchaForm(api_key, captcha, {})
+            body = serialize(form.payload(), self.loop)
+            self.assertIn(b'\r\n\r\n' + expected + b'\r\n', body)
+
+    def test_buffer_built_once(self):
+        form = CaptchaForm(api_key, b'image', {})
+        payload = form.payload()
+        self.assertIs(form.payload(), payload)
+        self.assertEqual(serialize(payload, self.loop),
+                         serialize(payload, self.loop))
+
+    def test_file_rewind(self):
+        f = io.BytesIO(b'headimage')
+        f.seek(4)
+        form = CaptchaForm(api_key, f, {})
+        first = serialize(form.payload(), self.loop)
+        second = serialize(form.payload(), self.loop)
+        self.assertIn(b'\r\n\r\nimage\r\n', first)
+        self.assertIn(b'\r\n\r\nimage\r\n', second)
+
+    def test_async_iterable(self):
+        source = AsyncChunks([b'ima', b'ge'])
+        form = CaptchaForm(api_key, source, {})
+        first = serialize(form.payload(), self.loop)
+        self.assertIn(b'name="file"; filename="cap"', first)
+        self.assertIn(b'\r\n\r\nimage\r\n', first)
+
+        # retries replay the chunks without reading the source again
+        second = serialize(form.payload(), self.loop)
+        self.assertIn(b'\r\n\r\nimage\r\n', second)
+        self.assertEqual(source.reads, 2)